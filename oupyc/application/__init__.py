@@ -3,14 +3,17 @@ from threading import RLock
 
 from oupyc.application.condition import ConditionGenerator
 from oupyc.application.generator import GeneratorThread
+from oupyc.application.process import ProcessTransformerThread
 from oupyc.application.processor import ProcessorThread
 from oupyc.application.router import RouterThread
 from oupyc.application.transformer import TransformerThread
 from oupyc.queues import FixedSizeQueue
+from oupyc.queues.durable import DurableStorageMixin
 
 __author__ = 'AMarin'
 
 # -*- coding: utf-8 -*-
+import signal
 import threading
 import time
 import logging
@@ -27,13 +30,15 @@ ROUTER="router",
 TRANSFORMER="transformer"
 PROCESSOR="processor"
 CONDITION="condition"
+PROCESS_TRANSFORMER="process_transformer"
 
 KNOWN_THREADS = {
     GENERATOR: GeneratorThread,
     ROUTER: RouterThread,
     TRANSFORMER: TransformerThread,
     PROCESSOR: ProcessorThread,
-    CONDITION: ConditionGenerator
+    CONDITION: ConditionGenerator,
+    PROCESS_TRANSFORMER: ProcessTransformerThread,
 }
 
 class ThreadSearchError(Exception):
@@ -53,6 +58,15 @@ class ThreadSearchError(Exception):
 '''
 
 class ThreadedApplication(object):
+    # seconds between supervisor checks of running threads
+    supervisor_interval = 1.0
+    # restart threads died while application running, give up after max_thread_restarts per thread
+    restart_dead_threads = True
+    max_thread_restarts = 10
+    # stop application when thread processes single item (batch) longer than stuck_thread_timeout seconds
+    stuck_thread_timeout = None
+    # signals leading to graceful stop
+    exit_signals = (signal.SIGINT, signal.SIGTERM)
 
     def __init__(self, threads, *args, **kwargs):
         super(ThreadedApplication, self).__init__()
@@ -62,6 +76,9 @@ class ThreadedApplication(object):
             for th in threads:
                 self._threads.append(th)
         self._exit_event = threading.Event()
+        self._restarts = {}
+        # queues made by application, closed on exit
+        self._owned_queues = []
 
     def add_thread(self, th):
         info("Adding thread %s" % th)
@@ -71,34 +88,89 @@ class ThreadedApplication(object):
     def add_threads(self, *threads):
         map(lambda th: self.add_thread(th), threads)
 
-    def make_thread(self, thread_type, func):
+    def make_thread(self, thread_type, func, **kwargs):
         if thread_type in KNOWN_THREADS:
             thread_class = KNOWN_THREADS[thread_type]
-            return thread_class.make(func)
+            return thread_class.make(func, **kwargs)
         else:
             raise ThreadSearchError("Unknown thread type %s, choose one of %s" % (thread_type, KNOWN_THREADS))
 
-    def make_gtp_chain(self, *callables):
-        current_queue = None
+    @staticmethod
+    def _chain_option(value, index):
+        """ Return chain option value for link or stage index. Option is either single value or sequence """
+        if isinstance(value, (list, tuple)):
+            return value[index]
+        return value
+
+    def make_gtp_chain(self, *callables, **kwargs):
+        """ Make generator -> transformer(s) -> processor chain of threads.
+
+        Keyword arguments are either single value for every link(stage) or sequence with value per link(stage):
+            queue_size: depth of queue between stages, defaults to batch_size or 1
+            batch_size: hand up to batch_size items between stages at once
+            batch_timeout: seconds to wait for batch to fill before passing it further
+            workers: number of transformer pool workers
+            ordered: keep transformer pool results in input order
+            processes: run transformer in that number of worker processes instead of threads
+            queue_class: queue class taking size kwarg, e.g. PriorityQueue, FixedSizeQueue by default. Queues
+                having close() (e.g. SpillingQueue) are closed on application exit
+            queue_factory: callable(link index, size) making queue of link instead of queue_class, for queues
+                needing own settings per link, e.g. DurableQueue log directory
+        """
+        queue_size = kwargs.get('queue_size', None)
+        batch_size = kwargs.get('batch_size', None)
+        batch_timeout = kwargs.get('batch_timeout', None)
         max_index = len(callables)-1
+
+        def make_queue(idx):
+            size = self._chain_option(queue_size, idx) or self._chain_option(batch_size, idx) or 1
+            queue_factory = self._chain_option(kwargs.get('queue_factory', None), idx)
+            if queue_factory is not None:
+                queue = queue_factory(idx, size)
+            else:
+                queue_class = self._chain_option(kwargs.get('queue_class', None), idx) or FixedSizeQueue
+                # functools.partial binding kwargs would make every link share them
+                if issubclass(getattr(queue_class, 'func', queue_class), DurableStorageMixin):
+                    raise ValueError("%s needs log directory per link, pass queue_factory instead of queue_class" % (
+                        getattr(queue_class, 'func', queue_class).__name__
+                    ))
+                queue = queue_class(size=size)
+            self._owned_queues.append(queue)
+            return queue
+
         with self._mutex:
-            for func in callables:
-                idx = callables.index(func)
+            for idx, func in enumerate(callables):
+                batch_kwargs = dict(
+                    batch_size=self._chain_option(batch_size, idx),
+                    batch_timeout=self._chain_option(batch_timeout, idx),
+                )
                 item = None
                 if 0 == idx:
                     # first thread is item generator
-                    item = self.make_thread(GENERATOR, callables[idx])
-                    item.add_queue("result", FixedSizeQueue(size=1))
+                    item = self.make_thread(GENERATOR, func, **batch_kwargs)
+                    item.add_queue("result", make_queue(idx))
 
                 elif idx < max_index:
                     # internal threads
-                    item = self.make_thread(TRANSFORMER, callables[idx])
+                    processes = self._chain_option(kwargs.get('processes', None), idx)
+                    ordered = self._chain_option(kwargs.get('ordered', False), idx)
+                    if processes:
+                        item = self.make_thread(
+                            PROCESS_TRANSFORMER, func, processes=processes, ordered=ordered, **batch_kwargs
+                        )
+                    else:
+                        item = self.make_thread(
+                            TRANSFORMER, func,
+                            workers=self._chain_option(kwargs.get('workers', 1), idx),
+                            ordered=ordered,
+                            **batch_kwargs
+                        )
                     item.set_input(self._threads[-1])
-                    item.add_queue("result", FixedSizeQueue(size=1))
+                    item.add_queue("result", make_queue(idx))
 
                 elif idx == max_index:
                     # last thread is item processor
-                    item = self.make_thread(PROCESSOR, callables[idx])
+                    item = self.make_thread(PROCESSOR, func, **batch_kwargs)
                     item.set_input(self._threads[-1])
 
                 self.add_thread(item)
@@ -117,8 +189,58 @@ class ThreadedApplication(object):
             th.start()
             info("%s started", th.description)
         info("All internal threads started")
+        self.install_signal_handlers()
         while not self._exit_event.isSet():
-            pass
+            # sleep until exit requested or next supervisor check
+            self._exit_event.wait(self.supervisor_interval)
+            if not self._exit_event.isSet():
+                self.supervise()
+
+    def install_signal_handlers(self):
+        """ Set exit event on exit_signals. Works only when called from main thread """
+        if not 'MainThread' == threading.current_thread().getName():
+            warning("Not in main thread, signal handlers not installed")
+            return
+        for signum in self.exit_signals:
+            signal.signal(signum, self._on_exit_signal)
+
+    def _on_exit_signal(self, signum, frame):
+        warning("Got signal %s, stopping", signum)
+        self._exit_event.set()
+
+    def supervise(self):
+        """ Check threads are alive and not stuck, restart died ones """
+        with self._mutex:
+            for idx, th in enumerate(self._threads):
+                if th.is_alive():
+                    self.check_progress(th)
+                    continue
+                error("Thread %s is dead", th.getName())
+                if self.restart_dead_threads:
+                    self.restart_thread(idx)
+
+    def check_progress(self, th):
+        """ Stop application if thread is stuck processing item: running thread can not be replaced """
+        if not self.stuck_thread_timeout or not hasattr(th, 'busy_for'):
+            return
+        busy = th.busy_for()
+        if busy > self.stuck_thread_timeout:
+            critical("Thread %s is busy with single item for %.1f seconds, stopping", th.getName(), busy)
+            self._exit_event.set()
+
+    def restart_thread(self, idx):
+        """ Replace dead thread with its clone and start it """
+        th = self._threads[idx]
+        restarts = self._restarts.get(idx, 0)
+        if restarts >= self.max_thread_restarts:
+            critical("Thread %s restarted %s times already, stopping", th.getName(), restarts)
+            self._exit_event.set()
+            return
+        self._restarts[idx] = restarts + 1
+        new_th = th.clone()
+        self._threads[idx] = new_th
+        new_th.start()
+        warning("Thread %s restarted as %s", th.getName(), new_th.getName())
 
     def exit_gracefully(self):
         """ Gracefull stop """
@@ -127,6 +249,21 @@ class ThreadedApplication(object):
             info("Waiting %s", th.description)
             debug("thread %s[%s]", type(th), th)
             th.join(10)
+        self.close_queues()
+
+    def close_queues(self):
+        """ Close queues made by application, e.g. removing spill files """
+        for th in self._threads:
+            if th.is_alive():
+                warning("Closing queues while %s is still running", th.getName())
+        queues, self._owned_queues = self._owned_queues, []
+        for queue in queues:
+            if not hasattr(queue, 'close'):
+                continue
+            try:
+                queue.close()
+            except Exception as exc:
+                error("Failed to close %s: %s", queue, exc)
 
     def run(self):
         info("Run %s", self.__class__.__name__)
@@ -185,11 +322,33 @@ class ApplicationWithStatistics(ThreadedApplication):
             self._exit_event,
             stat_queue_size,
             stat_queue_size,
-            lambda x: self.process_stat_record(x)
+            lambda x: self.process_stat_record(x),
+            # process_stat_record gets lists of records if batch size set
+            save_batch_size=kwargs.get('statistics_save_batch_size', None),
+            save_batch_timeout=kwargs.get('statistics_save_batch_timeout', None),
         )
         self._threads.insert(0, stat_thread)
         self._threads.insert(0, stat_aggregate_thread)
 
+        # optional OpenMetrics endpoint
+        self._exporter_window = kwargs.get('statistics_exporter_window', 60)
+        exporter_address = kwargs.get('statistics_exporter_address', None)
+        if exporter_address:
+            from oupyc.inthreads.exporter import OpenMetricsExporterThread
+            exporter = OpenMetricsExporterThread(exporter_address, exit_event=self._exit_event)
+            exporter.attach(stat_aggregate_thread, self._exporter_window)
+            self._threads.insert(0, exporter)
+
+    def restart_thread(self, idx):
+        """ Replace dead thread and attach exporter to statistics processor again if any of them replaced """
+        super(ApplicationWithStatistics, self).restart_thread(idx)
+        from oupyc.inthreads.exporter import OpenMetricsExporterThread
+        from oupyc.inthreads.statistics import StatisticsProcessorThread
+        exporters = [th for th in self._threads if isinstance(th, OpenMetricsExporterThread)]
+        processors = [th for th in self._threads if isinstance(th, StatisticsProcessorThread)]
+        if exporters and processors:
+            exporters[0].attach(processors[0], self._exporter_window)
+
 
     @abstractmethod
     def process_stat_record(self, record):
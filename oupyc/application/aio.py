@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from oupyc.application.generator import GeneratorThread
+from oupyc.application.processor import ProcessorThread
+from oupyc.application.transformer import TransformerThread
+from oupyc.queues import FixedSizeQueue, QueueTimeoutException
+from oupyc.stdthreads import ExitEventAwareThread
+from oupyc.utils import underscore_to_camelcase
+
+try:
+    import asyncio
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+except ImportError:
+    asyncio = None
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+
+def _assert_asyncio(obj):
+    assert asyncio is not None, "%s requires asyncio" % obj.__class__.__name__
+
+
+class _BridgeMixin(object):
+    """ Waits on threaded queue or loop future at most timeout seconds at once, checking exit event between """
+    # seconds to wait before checking exit event again
+    timeout = 1.0
+
+    def _stopped(self):
+        return self._exit_event.isSet() or self.loop.is_closed()
+
+    def _wait(self, future):
+        """ Return (True, result) once future is done, (False, None) if it is cancelled on exit """
+        while True:
+            try:
+                return True, future.result(self.timeout)
+            except FutureTimeoutError:
+                if self._stopped() and future.cancel():
+                    return False, None
+
+
+class ThreadedToAsyncBridge(_BridgeMixin, ExitEventAwareThread):
+    """ Moves items from threaded queue to asyncio.Queue of running loop. Item not delivered on exit is nacked """
+    description = "threaded to asyncio queue bridge"
+
+    def __init__(self, source, target, loop, *args, **kwargs):
+        _assert_asyncio(self)
+        super(ThreadedToAsyncBridge, self).__init__(*args, **kwargs)
+        self.source = source
+        self.target = target
+        self.loop = loop
+
+    def run(self):
+        while not self._stopped():
+            try:
+                item = self.source.get(self.timeout)
+            except QueueTimeoutException:
+                continue
+            token = self.source.taken()
+            # wait while asyncio queue is full
+            delivered, _ = self._wait(asyncio.run_coroutine_threadsafe(self.target.put(item), self.loop))
+            if delivered:
+                self.source.ack(token)
+            else:
+                error("%s stopped before item was delivered, give it back", self.getName())
+                self.source.nack(token)
+
+
+class AsyncToThreadedBridge(_BridgeMixin, ExitEventAwareThread):
+    """ Moves items from asyncio.Queue of running loop to threaded queue """
+    description = "asyncio to threaded queue bridge"
+
+    def __init__(self, source, target, loop, *args, **kwargs):
+        _assert_asyncio(self)
+        super(AsyncToThreadedBridge, self).__init__(*args, **kwargs)
+        self.source = source
+        self.target = target
+        self.loop = loop
+
+    def run(self):
+        while not self._stopped():
+            got, item = self._wait(asyncio.run_coroutine_threadsafe(self.source.get(), self.loop))
+            if got:
+                self.target.put(item)
+
+
+class AsyncStageMixin(object):
+    """ Runs stage coroutines on own event loop with at most concurrency of them in flight.
+
+    Stage thread runs event loop. Intake helper thread waits for free slot, takes next coroutine and schedules it,
+    waking every intake_timeout seconds to check exit event and whether the loop has stopped. Output helper thread
+    puts completed results to result queue, acks incoming item (nacks failed one) and frees slot, so event loop never
+    blocks on stage queues.
+    Coroutines still in flight on stop are cancelled and their items nacked.
+    """
+    concurrency = 100
+    has_output = True
+    # seconds intake helper waits for free slot or incoming item before checking exit event
+    intake_timeout = 1.0
+    # seconds to wait for helpers on stop
+    stop_timeout = 10
+
+    def run(self):
+        _assert_asyncio(self)
+        self.loop = asyncio.new_event_loop()
+        # stop of this stage only, application exit event is left to supervisor
+        self._loop_stopped = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        # never blocks: every completed future holds a slot, one more place is for stop mark
+        self._completed = FixedSizeQueue(size=self.concurrency + 1)
+        # futures in flight to their tokens
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        helpers = [threading.Thread(target=self._intake, name="%s.intake" % self.getName())]
+        if self.has_output:
+            helpers.append(threading.Thread(target=self._output, name="%s.output" % self.getName()))
+        for helper in helpers:
+            helper.setDaemon(self.isDaemon())
+            helper.start()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            # intake helper wakes within intake_timeout and stops too
+            self._loop_stopped.set()
+            self._cancel_pending()
+            if not self._completed.try_put(None):
+                error("%s could not stop output helper", self.getName())
+            for helper in helpers:
+                helper.join(self.stop_timeout)
+                if helper.is_alive():
+                    warning("%s did not stop in %s seconds", helper.getName(), self.stop_timeout)
+            self.loop.close()
+
+    def _intake(self):
+        try:
+            while not (self._exit_event.isSet() or self._loop_stopped.isSet()):
+                if not self._slots.acquire(timeout=self.intake_timeout):
+                    continue
+                try:
+                    coroutine = self.next_coroutine()
+                except QueueTimeoutException:
+                    self._slots.release()
+                    continue
+                token = self.taken()
+                future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+                with self._pending_lock:
+                    self._pending[future] = token
+                future.add_done_callback(lambda done, token=token: self._done(done, token))
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _done(self, future, token):
+        with self._pending_lock:
+            self._pending.pop(future, None)
+        self.on_done(future, token)
+
+    def _cancel_pending(self):
+        """ Cancel coroutines left on stopped loop and wait stop_timeout seconds for them, so on_done nacks their
+        items. Items of coroutines ignoring cancellation are nacked here """
+        tasks = [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+        if tasks:
+            warning("%s cancels %s coroutines in flight", self.getName(), len(tasks))
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.wait(tasks, timeout=self.stop_timeout))
+        with self._pending_lock:
+            stuck, self._pending = list(self._pending.values()), {}
+        for token in stuck:
+            error("%s coroutine did not stop, give its item back", self.getName())
+            self.nack(token)
+
+    def _output(self):
+        while True:
+            completed = self._completed.get()
+            if completed is None:
+                break
+            future, token = completed
+            try:
+                if future.cancelled():
+                    warning("%s coroutine cancelled", self.getName())
+                    self.nack(token)
+                    continue
+                self.put_result(future.result())
+                self.ack(token)
+            except Exception as exc:
+                error("%s coroutine failed: %s", self.getName(), exc)
+                self.nack(token)
+            finally:
+                self._slots.release()
+
+    def taken(self):
+        """ Token of incoming item the last coroutine was made of, None for stages without incoming queue """
+        incoming = self.get_all_queues().get('incoming')
+        return incoming.taken() if incoming is not None else None
+
+    def ack(self, token):
+        if token is not None:
+            self.get_queue('incoming').ack(token)
+
+    def nack(self, token):
+        if token is not None:
+            self.get_queue('incoming').nack(token)
+
+    def next_coroutine(self):
+        raise NotImplementedError("%s to define its own next_coroutine" % self.__class__.__name__)
+
+    def put_result(self, result):
+        self.get_queue('result').put(result)
+
+    def on_done(self, future, token=None):
+        """ Called in event loop thread, must not block """
+        self._completed.put((future, token))
+
+
+class AsyncGeneratorThread(AsyncStageMixin, GeneratorThread):
+    """ Runs up to concurrency generate_item coroutines at once and passes results to result queue """
+
+    def next_coroutine(self):
+        return self.generate_item()
+
+    @classmethod
+    def make(cls, func, concurrency=100):
+        if not hasattr(func, "description"):
+            raise NotImplementedError("%s to have description attribute" % func.__name__)
+        return type("AsyncGenerator%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+            description=func.description,
+            concurrency=concurrency,
+            stage_name=func.__name__,
+            # coroutine function generating item
+            generate_item=lambda self: func(),
+        ))()
+
+
+class AsyncTransformerThread(AsyncStageMixin, TransformerThread):
+    """ Takes items from incoming queue, runs up to concurrency transform_item coroutines at once and
+    passes results to result queue. Results order is completion order """
+
+    def next_coroutine(self):
+        return self.transform_item(self.get_queue('incoming').get(self.intake_timeout))
+
+    @classmethod
+    def make(cls, func, concurrency=100):
+        if not hasattr(func, "description"):
+            raise NotImplementedError("%s to have description attribute" % func.__name__)
+        return type("AsyncTransformer%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+            description=func.description,
+            concurrency=concurrency,
+            stage_name=func.__name__,
+            # coroutine function transforming item
+            transform_item=lambda self, item: func(item),
+        ))()
+
+
+class AsyncProcessorThread(AsyncStageMixin, ProcessorThread):
+    """ Takes items from incoming queue and runs up to concurrency process_item coroutines at once """
+    has_output = False
+
+    def next_coroutine(self):
+        return self.process_item(self.get_queue('incoming').get(self.intake_timeout))
+
+    def on_done(self, future, token=None):
+        if future.cancelled():
+            warning("%s coroutine cancelled", self.getName())
+            self.nack(token)
+        elif future.exception() is not None:
+            error("%s coroutine failed: %s", self.getName(), future.exception())
+            self.nack(token)
+        else:
+            self.ack(token)
+        self._slots.release()
+
+    @classmethod
+    def make(cls, func, concurrency=100):
+        if not hasattr(func, "description"):
+            raise NotImplementedError("%s to have description attribute" % func.__name__)
+        return type("AsyncProcessor%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+            description=func.description,
+            concurrency=concurrency,
+            stage_name=func.__name__,
+            # coroutine function processing item
+            process_item=lambda self, item: func(item),
+        ))()
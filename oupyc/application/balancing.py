@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+import random
+import struct
+
+__author__ = 'AMarin'
+
+# virtual nodes per destination on hash ring
+DEFAULT_VNODES = 100
+
+# load balancing modes
+POWER_OF_TWO = "power_of_two"
+LEAST_LOADED = "least_loaded"
+
+
+def _hash(value):
+    if not isinstance(value, bytes):
+        value = (u'%s' % (value,)).encode('utf-8')
+    return struct.unpack('>Q', hashlib.md5(value).digest()[:8])[0]
+
+
+class ConsistentHashRing(object):
+    """ Maps keys to nodes so that adding or removing node moves only keys of that node """
+
+    def __init__(self, vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self._hashes = []
+        self._nodes = {}
+
+    def add(self, node):
+        for idx in range(self.vnodes):
+            point = _hash('%s#%s' % (node, idx))
+            if point not in self._nodes:
+                bisect.insort(self._hashes, point)
+            self._nodes[point] = node
+
+    def remove(self, node):
+        for idx in range(self.vnodes):
+            point = _hash('%s#%s' % (node, idx))
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._hashes.remove(point)
+
+    def get(self, key):
+        assert self._hashes, "Hash ring is empty"
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[self._hashes[idx]]
+
+    def copy(self):
+        ring = ConsistentHashRing(self.vnodes)
+        ring._hashes = list(self._hashes)
+        ring._nodes = dict(self._nodes)
+        return ring
+
+    def __len__(self):
+        return len(set(self._nodes.values()))
+
+
+class PartitionedDestination(object):
+    """ Spreads items over replica queues by consistent hash of item key.
+
+    Items with the same key always go to the same replica while replicas set is unchanged, keeping per key order.
+    Destination is immutable once used for routing: with_replica/without_replica return changed copies.
+    """
+
+    def __init__(self, key_function, vnodes=DEFAULT_VNODES):
+        assert callable(key_function), "key_function to be callable"
+        self.key_function = key_function
+        self._ring = ConsistentHashRing(vnodes)
+        self._queues = {}
+
+    def _copy(self):
+        destination = PartitionedDestination(self.key_function, self._ring.vnodes)
+        destination._ring = self._ring.copy()
+        destination._queues = dict(self._queues)
+        return destination
+
+    def with_replica(self, name, queue):
+        destination = self._copy()
+        destination._queues[name] = queue
+        destination._ring.add(name)
+        return destination
+
+    def without_replica(self, name):
+        destination = self._copy()
+        destination._queues.pop(name)
+        destination._ring.remove(name)
+        return destination
+
+    replicas = property(lambda self: sorted(self._queues), None, None, "Replica queue names")
+
+    def select(self, item):
+        """ Return (name, queue) of replica for item """
+        name = self._ring.get(self.key_function(item))
+        return name, self._queues[name]
+
+    def put(self, item):
+        self.select(item)[1].put(item)
+
+    def try_put(self, item):
+        """ Put item if its replica queue is not full. Return True if item is put """
+        return self.select(item)[1].try_put(item)
+
+
+class LoadBalancedDestination(object):
+    """ Spreads items over replica queues preferring less loaded ones.
+
+    In POWER_OF_TWO mode two random replicas are compared by queue length, in LEAST_LOADED mode all of them.
+    Full queues are skipped without waiting, other replicas are tried in random order. Only when every replica
+    is full router waits on the shortest queue. Destination is immutable once used for routing:
+    with_replica/without_replica return changed copies.
+    """
+
+    def __init__(self, mode=POWER_OF_TWO):
+        assert mode in (POWER_OF_TWO, LEAST_LOADED), "Unknown balancing mode %s" % mode
+        self.mode = mode
+        self._names = []
+        self._queues = []
+
+    def with_replica(self, name, queue):
+        destination = LoadBalancedDestination(self.mode)
+        destination._names = self._names + [name]
+        destination._queues = self._queues + [queue]
+        return destination
+
+    def without_replica(self, name):
+        idx = self._names.index(name)
+        destination = LoadBalancedDestination(self.mode)
+        destination._names = self._names[:idx] + self._names[idx + 1:]
+        destination._queues = self._queues[:idx] + self._queues[idx + 1:]
+        return destination
+
+    replicas = property(lambda self: list(self._names), None, None, "Replica queue names")
+
+    def candidates(self):
+        """ Return replica queues in order of preference """
+        queues = self._queues
+        assert queues, "No replicas to balance"
+        if LEAST_LOADED == self.mode or len(queues) < 3:
+            return sorted(queues, key=len)
+        chosen = random.sample(range(len(queues)), 2)
+        rest = [queue for idx, queue in enumerate(queues) if idx not in chosen]
+        random.shuffle(rest)
+        return sorted([queues[idx] for idx in chosen], key=len) + rest
+
+    def put(self, item):
+        candidates = self.candidates()
+        for queue in candidates:
+            if queue.try_put(item):
+                return
+        # every replica is full
+        min(candidates, key=len).put(item)
+
+    def try_put(self, item):
+        """ Put item to any replica queue having room. Return True if item is put """
+        for queue in self.candidates():
+            if queue.try_put(item):
+                return True
+        return False
@@ -3,9 +3,11 @@ import importlib
 import logging
 
 from oupyc.checks import require_kwarg_type
+from oupyc.application.retry import pop_attempt
 from oupyc.application.transformer import TransformerThread
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread, NamedQueueWithStatistics
-from oupyc.remote.task import TaskPrototype, ResultImplementationError
+from oupyc.remote.codecs import CodecError
+from oupyc.remote.task import TASK_REGISTRY, TaskPrototype, ResultImplementationError, ResultTaskNotImplementedError
 
 __author__ = 'AMarin'
 
@@ -15,36 +17,196 @@ debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,
 
 
 class TaskExecutorThread(TransformerThread):
-    """ Takes items from incoming queue, process with transform_item and pass to result queue """
+    """ Takes items from incoming queue, process with transform_item and pass to result queue.
+    With retry_scheduler items having RESULT_ERROR_REPEAT result are put back to incoming queue after backoff
+    instead of passing result until attempts exhausted """
+    description = "task executor"
+    drop_none = True
 
     def __init__(self, *args, **kwargs):
         super(TaskExecutorThread, self).__init__(*args, **kwargs)
         _task_class = kwargs.get("task_class", TaskPrototype)
-        assert issubclass(self.task_class, TaskPrototype), '%s requires task_class to be %s subtype, got %s' % (
+        assert issubclass(_task_class, TaskPrototype), '%s requires task_class to be %s subtype, got %s' % (
             self.__class__.__name__,
             TaskPrototype.__name__,
             type(_task_class)
         )
         self.__task_class = _task_class
+        # optional oupyc.remote.codecs.Codec, incoming items and results are bytes then
+        self.__codec = kwargs.get("codec")
+        # collect batches for task_class.process_batch
+        self.batch_size = kwargs.get("batch_size", self.batch_size)
+        self.batch_timeout = kwargs.get("batch_timeout", self.batch_timeout)
+        # optional oupyc.application.retry.RetrySchedulerThread
+        self._retry_scheduler = kwargs.get("retry_scheduler")
 
-        self.__max_threads = require_kwarg_type("max_threads", int, **kwargs)
-        assert issubclass(self.task_class, TaskPrototype), '%s requires task_class to be %s instance, got %s' % (
-            self.task_class,
-            TaskPrototype,
-            type(self.task_class)
-        )
-        self.add_queue('incoming', NamedQueueWithStatistics(
-            allow=dict,
-            size=self.__max_threads,
-            name=self.task_class.__name__
-        ))
+        self.__max_threads = require_kwarg_type("max_threads", int, kwargs)
+        # prebuilt incoming queue, e.g. NamedPriorityQueueWithStatistics
+        incoming = kwargs.get("incoming_queue")
+        if incoming is None:
+            incoming = NamedQueueWithStatistics(
+                allow=self.__codec is not None and bytes or dict,
+                size=self.__max_threads,
+                name=self.task_class.__name__
+            )
+        self.add_queue('incoming', incoming)
 
     task_class = property(lambda self: self.__task_class, None, None, "Task class to be processed")
+    codec = property(lambda self: self.__codec, None, None, "Codec of incoming items and results if any")
+
+    def _decode(self, item):
+        """ Return task or None if codec does not know its class """
+        if self.__codec is None:
+            return self.task_class.deserialize(item)
+        try:
+            return self.__codec.loads(item)
+        except CodecError as exc:
+            warning("%s got unknown task: %s", self.getName(), exc)
+            return None
+
+    def _not_implemented(self):
+        return self.__codec.dumps(ResultTaskNotImplementedError(message="Unknown task class"))
 
     def transform_item(self, item):
         debug("Process item %s", item)
-        task_instance_object = self.task_class.deserialize(item)
+        item, attempt = pop_attempt(item)
+        task_instance_object = self._decode(item)
+        if task_instance_object is None:
+            return self._not_implemented()
         debug("Task instance object created, call process_request")
-        result = task_instance_object.process_request()
+        result = self._retry(item, attempt, task_instance_object.process_request())
         debug('request processed, return result')
-        return result
\ No newline at end of file
+        if self.__codec is not None and result is not None:
+            return self.__codec.dumps(result)
+        return result
+
+    def transform_batch(self, items):
+        items, attempts = zip(*[pop_attempt(item) for item in items])
+        tasks = [self._decode(item) for item in items]
+        results = [None] * len(items)
+        # codec may decode tasks of any registered class
+        groups = dict()
+        for idx, task in enumerate(tasks):
+            if task is not None:
+                groups.setdefault(task.__class__, []).append(idx)
+        for task_class, positions in groups.items():
+            for idx, result in zip(positions, task_class.process_batch([tasks[idx] for idx in positions])):
+                results[idx] = self._retry(items[idx], attempts[idx], result)
+        if self.__codec is not None:
+            results = [result if result is None else self.__codec.dumps(result) for result in results]
+            for idx, task in enumerate(tasks):
+                if task is None:
+                    results[idx] = self._not_implemented()
+        return results
+
+    def _retry(self, item, attempt, result):
+        if self._retry_scheduler is None:
+            return result
+        return self._retry_scheduler.handle_result(item, result, self.get_queue('incoming'), attempt)
+
+
+class MultiTaskExecutorThread(TransformerThread):
+    """ Executes tasks of any registered class taken from single incoming queue by shared workers pool.
+
+    Task class is found by task_name through TASK_REGISTRY (or by class module and name for items serialized
+    without task_name) once, then cached with its deserializer. With codec incoming items are bytes decoded by
+    class id. Unknown tasks, including unknown class ids, give ResultTaskNotImplementedError result. Executed
+    tasks are counted as task.<task_name> events.
+    """
+    description = "multi task executor"
+    drop_none = True
+
+    def __init__(self, *args, **kwargs):
+        super(MultiTaskExecutorThread, self).__init__(*args, **kwargs)
+        self.__codec = kwargs.get("codec")
+        self.workers = kwargs.get("workers", self.workers)
+        self.batch_size = kwargs.get("batch_size", self.batch_size)
+        self.batch_timeout = kwargs.get("batch_timeout", self.batch_timeout)
+        # optional oupyc.application.retry.RetrySchedulerThread
+        self._retry_scheduler = kwargs.get("retry_scheduler")
+        # task_name or (class_module, class_name) -> (deserialize, event name)
+        self.__dispatch = dict()
+        self.__max_threads = require_kwarg_type("max_threads", int, kwargs)
+        incoming = kwargs.get("incoming_queue")
+        if incoming is None:
+            incoming = NamedQueueWithStatistics(
+                allow=self.__codec is not None and bytes or dict,
+                size=self.__max_threads,
+                name=kwargs.get("name", self.__class__.__name__)
+            )
+        self.add_queue('incoming', incoming)
+
+    codec = property(lambda self: self.__codec, None, None, "Codec of incoming items and results if any")
+
+    def _lookup(self, key):
+        """ Find task class by task name or (module, name) key and cache its deserializer """
+        task_class = None
+        if isinstance(key, tuple):
+            for registered in list(TASK_REGISTRY.values()):
+                if (registered.__module__, registered.__name__) == key:
+                    task_class = registered
+                    break
+        else:
+            task_class = TASK_REGISTRY.get(key)
+        if task_class is None:
+            return None
+        entry = self.__dispatch[key] = (task_class.deserialize, "task.%s" % task_class.task_name)
+        return entry
+
+    def _decode(self, item):
+        """ Return (task, event name) or (None, error result) for unknown task """
+        if self.__codec is not None:
+            try:
+                task = self.__codec.loads(item)
+            except CodecError as exc:
+                warning("%s got unknown task: %s", self.getName(), exc)
+                return None, ResultTaskNotImplementedError(message="Unknown task: %s" % exc)
+            assert isinstance(task, TaskPrototype), "%s expects tasks, got %s" % (self.getName(), type(task))
+            return task, "task.%s" % task.task_name
+        key = item.get('task_name') or (item.get('class_module'), item.get('class_name'))
+        entry = self.__dispatch.get(key) or self._lookup(key)
+        if entry is None:
+            warning("%s got unknown task %s", self.getName(), key)
+            return None, ResultTaskNotImplementedError(message="Unknown task %s" % (key, ))
+        deserialize, event = entry
+        return deserialize(item), event
+
+    def transform_item(self, item):
+        item, attempt = pop_attempt(item)
+        task, event = self._decode(item)
+        if task is None:
+            return self._encode(event)
+        result = task.process_request()
+        self.account_event(event)
+        return self._encode(self._retry(item, attempt, result))
+
+    def transform_batch(self, items):
+        """ Group batch by task class, run process_batch of every class and return results in items order """
+        results = [None] * len(items)
+        items, attempts = zip(*[pop_attempt(item) for item in items])
+        groups = dict()
+        for idx, item in enumerate(items):
+            task, event = self._decode(item)
+            if task is None:
+                results[idx] = self._encode(event)
+                continue
+            group = groups.get(task.__class__)
+            if group is None:
+                group = groups[task.__class__] = (event, [], [])
+            group[1].append(idx)
+            group[2].append(task)
+        for task_class, (event, positions, tasks) in groups.items():
+            for idx, result in zip(positions, task_class.process_batch(tasks)):
+                results[idx] = self._encode(self._retry(items[idx], attempts[idx], result))
+            self.account_event(event, len(tasks))
+        return results
+
+    def _retry(self, item, attempt, result):
+        if self._retry_scheduler is None:
+            return result
+        return self._retry_scheduler.handle_result(item, result, self.get_queue('incoming'), attempt)
+
+    def _encode(self, result):
+        if self.__codec is not None and result is not None:
+            return self.__codec.dumps(result)
+        return result
@@ -2,7 +2,7 @@
 import logging
 
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread
-from oupyc.utils import underscore_to_camelcase
+from oupyc.utils import monotonic, underscore_to_camelcase
 
 _l = logging.getLogger(__name__)
 _l.setLevel(logging.DEBUG)
@@ -11,6 +11,11 @@ debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,
 
 class GeneratorThread(StatisticsEnabledQueuesProcessorThread):
     """ Takes items from incoming queue, process with transform_item and pass to result queue """
+    # micro-batch mode: pass up to batch_size items or items generated in batch_timeout seconds at once
+    batch_size = None
+    batch_timeout = None
+    # generate_batch produces item lists by itself
+    batched = False
 
     def add_queue(self, name, queue):
         assert name in ['result'], "%s allows only result thread" % self.__class__.__name__
@@ -18,18 +23,61 @@ class GeneratorThread(StatisticsEnabledQueuesProcessorThread):
 
     def run(self):
         while not self._exit_event.isSet():
-            self.get_queue('result').put_wait(lambda: self.generate_item())
+            if self.batch_size or self.batched:
+                self.process_next_batch()
+            else:
+                self.process_next_item()
+
+    def process_next_item(self):
+        timings = []
+
+        def generate():
+            # put_wait calls it when result queue has free slot
+            timings.append(monotonic())
+            item = self.generate_item()
+            timings.append(monotonic())
+            return item
+
+        started = monotonic()
+        self.get_queue('result').put_wait(generate)
+        finished = monotonic()
+        self.account_stage(0, timings[1] - timings[0], (timings[0] - started) + (finished - timings[1]))
+
+    def process_next_batch(self):
+        started = monotonic()
+        batch = self.generate_batch()
+        generated = monotonic()
+        self.get_queue('result').put_many(batch)
+        self.account_stage(0, generated - started, monotonic() - generated, len(batch))
 
     def generate_item(self):
         raise NotImplementedError("%s to define its own generate_item" % self.__class__.__name__)
 
+    def generate_batch(self):
+        """ Generate up to batch_size items, stop earlier when batch_timeout exceeded """
+        deadline = self.batch_timeout and monotonic() + self.batch_timeout
+        batch = []
+        while len(batch) < self.batch_size and not (deadline and monotonic() >= deadline):
+            batch.append(self.generate_item())
+        return batch
+
     @classmethod
-    def make(cls, func):
+    def make(cls, func, batch_size=None, batch_timeout=None):
+        """ Make generator thread from callable. Callable having true batch attribute returns item lists """
         if not hasattr(func, "description"):
             raise NotImplementedError("%s to have description attribute" % func.__name__)
-        return type("Generator%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+        attrs = dict(
             description= func.description,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+            stage_name=func.__name__,
             # generate item from callable
             generate_item=lambda self: func(),
-        ))()
+        )
+        if getattr(func, "batch", False):
+            attrs.update(
+                batched=True,
+                generate_batch=lambda self: func(),
+            )
+        return type("Generator%s" % underscore_to_camelcase(func.__name__), (cls,), attrs)()
 
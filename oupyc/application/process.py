@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import traceback
+
+from oupyc.application.transformer import TransformerThread
+from oupyc.utils import process_context, underscore_to_camelcase
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+_ITEM = 0
+_BATCH = 1
+
+
+class ProcessTransformError(Exception):
+    pass
+
+
+class WorkerProcessCrashed(Exception):
+    pass
+
+
+def _process_worker(conn, func, batched):
+    """ Worker process main loop: receive item or batch, answer with (success, result or traceback) """
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        kind, payload = message
+        try:
+            if _BATCH == kind:
+                result = func(payload) if batched else [func(item) for item in payload]
+            else:
+                result = func([payload])[0] if batched else func(payload)
+            conn.send((True, result))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+class ProcessTransformerThread(TransformerThread):
+    """ Transformer running process_function in worker processes, one process per pool worker.
+
+    Stage looks like ordinary transformer to the rest of chain: items are taken from incoming queue and results
+    are put to result queue by threads, only transformation itself is done in child process. Items and results
+    are passed through pipes so they must be picklable. Died process is restarted and item is retried
+    process_retries times.
+
+    Processes are started by forkserver or spawn method where available, so process_function must be importable
+    module level callable. On Python 2 processes are forked, all of them are started before pool threads;
+    replacements of died processes are still forked from running threads.
+    """
+    description = "process transformer"
+    # module level callable to run in worker processes, takes and returns lists if process_batched
+    process_function = None
+    process_batched = False
+    # seconds between child liveness checks while waiting result
+    process_poll_interval = 1.0
+    process_retries = 1
+
+    def __init__(self, *args, **kwargs):
+        super(ProcessTransformerThread, self).__init__(*args, **kwargs)
+        self._local = threading.local()
+        self._processes = []
+        # started processes not taken by pool worker yet
+        self._idle = []
+
+    def run(self):
+        try:
+            # start processes before pool threads exist
+            for _ in range(self.workers):
+                self._idle.append(self._start_process())
+            super(ProcessTransformerThread, self).run()
+        finally:
+            self.stop_processes()
+
+    def _start_process(self):
+        context = process_context()
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_process_worker,
+            args=(child_conn, self.process_function, self.process_batched),
+            name="%s.process" % threading.current_thread().getName(),
+        )
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        info("%s started worker process %s", self.getName(), process.pid)
+        with self._mutex:
+            self._processes.append((process, parent_conn))
+        return process, parent_conn
+
+    def _drop_process(self, process, conn):
+        with self._mutex:
+            self._processes.remove((process, conn))
+        self._local.process = None
+        conn.close()
+
+    def _get_process(self):
+        """ Return worker process of current thread, taking prestarted one or starting it if needed """
+        process_conn = getattr(self._local, 'process', None)
+        if process_conn is None:
+            with self._mutex:
+                process_conn = self._idle and self._idle.pop() or None
+            if process_conn is None:
+                process_conn = self._start_process()
+            self._local.process = process_conn
+        return process_conn
+
+    def stop_processes(self):
+        with self._mutex:
+            processes, self._processes = self._processes, []
+            self._idle = []
+        for process, conn in processes:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+    def _wait_result(self, process, conn):
+        """ Wait for result from process. Return (success, result) or None if process died """
+        while not conn.poll(self.process_poll_interval):
+            if not process.is_alive():
+                # last chance to get result sent right before exit
+                if not conn.poll():
+                    return None
+                break
+        try:
+            return conn.recv()
+        except EOFError:
+            return None
+
+    def call_process(self, kind, payload):
+        for attempt in range(self.process_retries + 1):
+            process, conn = self._get_process()
+            try:
+                conn.send((kind, payload))
+                answer = self._wait_result(process, conn)
+            except (IOError, OSError):
+                answer = None
+            if answer is not None:
+                success, result = answer
+                if not success:
+                    raise ProcessTransformError(result)
+                return result
+            process.join(self.process_poll_interval)
+            error("%s worker process %s died with exit code %s, attempt %s", self.getName(), process.pid,
+                  process.exitcode, attempt + 1)
+            self._drop_process(process, conn)
+        raise WorkerProcessCrashed("%s failed to process item %s times" % (self.getName(), self.process_retries + 1))
+
+    def transform_item(self, item):
+        return self.call_process(_ITEM, item)
+
+    def transform_batch(self, items):
+        return self.call_process(_BATCH, items)
+
+    @classmethod
+    def make(cls, func, batch_size=None, batch_timeout=None, processes=1, ordered=False):
+        """ Make process transformer thread from module level callable run by processes worker processes.
+        Callable having true batch attribute takes and returns lists """
+        if not hasattr(func, "description"):
+            raise NotImplementedError("%s to have description attribute" % func.__name__)
+        return type("ProcessTransformer%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+            description=func.description,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+            workers=processes,
+            ordered=ordered,
+            stage_name=func.__name__,
+            process_function=staticmethod(func),
+            process_batched=getattr(func, "batch", False),
+        ))()
@@ -2,7 +2,7 @@
 import logging
 
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread
-from oupyc.utils import underscore_to_camelcase
+from oupyc.utils import monotonic, underscore_to_camelcase
 
 __author__ = 'AMarin'
 
@@ -12,6 +12,9 @@ debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,
 
 
 class ProcessorThread(StatisticsEnabledQueuesProcessorThread):
+    # micro-batch mode: take up to batch_size items or items collected in batch_timeout seconds at once
+    batch_size = None
+    batch_timeout = None
 
     def add_queue(self, name, queue):
         assert name == 'incoming', "%s allows only incoming thread" % self.__class__.__name__
@@ -19,20 +22,69 @@ class ProcessorThread(StatisticsEnabledQueuesProcessorThread):
 
     def run(self):
         while not self._exit_event.isSet():
-            debug("Waiting for next item")
-            item = self.get_queue('incoming').get()
-            debug("Got item, processing")
-            self.process_item(item)
+            if self.batch_size:
+                self.process_next_batch()
+            else:
+                self.process_next_item()
+
+    def process_next_item(self):
+        debug("Waiting for next item")
+        started = monotonic()
+        item = self.get_queue('incoming').get()
+        token = self.get_queue('incoming').taken()
+        debug("Got item, processing")
+        taken = monotonic()
+        self.begin_work()
+        self._process(token, self.process_item, item)
+        self.get_queue('incoming').ack(token)
+        self.end_work()
+        self.account_stage(taken - started, monotonic() - taken)
+
+    def process_next_batch(self):
+        debug("Waiting for next batch")
+        started = monotonic()
+        items = self.get_queue('incoming').get_many(self.batch_size, self.batch_timeout)
+        token = self.get_queue('incoming').taken()
+        debug("Got %s items, processing", len(items))
+        taken = monotonic()
+        self.begin_work()
+        self._process(token, self.process_batch, items)
+        self.get_queue('incoming').ack(token)
+        self.end_work()
+        self.account_stage(taken - started, monotonic() - taken, items=len(items))
+
+    def _process(self, token, process, taken):
+        try:
+            process(taken)
+        except Exception:
+            # failed item(s) are not acked by following ones
+            self.get_queue('incoming').nack(token)
+            raise
 
     def process_item(self, item):
         raise NotImplementedError("%s to define its own process_item" % self.__class__.__name__)
 
+    def process_batch(self, items):
+        """ Process list of items """
+        for item in items:
+            self.process_item(item)
+
     @classmethod
-    def make(cls, func):
+    def make(cls, func, batch_size=None, batch_timeout=None):
+        """ Make processor thread from callable. Callable having true batch attribute takes item lists """
         if not hasattr(func, "description"):
             raise NotImplementedError("%s to have description attribute" % func.__name__)
-        return type("Processor%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+        attrs = dict(
             description = func.description,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+            stage_name=func.__name__,
             # generate item from callable
             process_item=lambda self, item: func(item),
-        ))()
\ No newline at end of file
+        )
+        if getattr(func, "batch", False):
+            attrs.update(
+                process_item=lambda self, item: func([item]),
+                process_batch=lambda self, items: func(items),
+            )
+        return type("Processor%s" % underscore_to_camelcase(func.__name__), (cls,), attrs)()
\ No newline at end of file
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import struct
+import threading
+
+from oupyc.inthreads.statistics import StatisticsEnabledThread
+from oupyc.remote.task import RESULT_ERROR_REPEAT
+from oupyc.utils import monotonic
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+# attempt number is carried by re-enqueued item: dict key, bytes prefix or object attribute
+RETRY_ATTEMPT = 'retry_attempt'
+_BYTES_MARK = b'\x00oupyc-retry'
+_BYTES_ATTEMPT = struct.Struct('>I')
+
+
+def with_attempt(item, attempt):
+    """ Return item carrying attempt number, it survives copying and pickling by queues """
+    if isinstance(item, dict):
+        return dict(item, **{RETRY_ATTEMPT: attempt})
+    if isinstance(item, bytes):
+        return _BYTES_MARK + _BYTES_ATTEMPT.pack(attempt) + item
+    setattr(item, RETRY_ATTEMPT, attempt)
+    return item
+
+
+def pop_attempt(item):
+    """ Return (item, attempt) of item got from queue, attempt is 0 for new item. Dicts and bytes are returned
+    as they were before with_attempt() """
+    if isinstance(item, dict):
+        if RETRY_ATTEMPT not in item:
+            return item, 0
+        item = dict(item)
+        return item, item.pop(RETRY_ATTEMPT)
+    if isinstance(item, bytes):
+        if not item.startswith(_BYTES_MARK):
+            return item, 0
+        offset = len(_BYTES_MARK)
+        attempt, = _BYTES_ATTEMPT.unpack_from(item, offset)
+        return item[offset + _BYTES_ATTEMPT.size:], attempt
+    return item, getattr(item, RETRY_ATTEMPT, 0)
+
+
+class TimerWheel(object):
+    """ Hashed timer wheel: O(1) insert, expiration work proportional to entries in passed slots.
+
+    Delay is counted from the time of add and rounded up to whole ticks, so entry is never due early. Entries
+    further than one wheel rotation are kept in their slot with number of rotations to wait, so any delay fits
+    without hierarchy levels.
+    """
+
+    def __init__(self, tick=0.1, wheel_size=512, now=None):
+        self.tick = tick
+        self.wheel_size = wheel_size
+        self._slots = [[] for _ in range(wheel_size)]
+        self._current = 0
+        self._time = monotonic() if now is None else now
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, delay, entry, now=None):
+        now = monotonic() if now is None else now
+        # part of current tick already passed counts too
+        ticks = max(1, int(-(-(now - self._time + delay) // self.tick)))
+        rounds, offset = divmod(ticks - 1, self.wheel_size)
+        self._slots[(self._current + offset + 1) % self.wheel_size].append((rounds, entry))
+        self._length += 1
+
+    def advance(self, now=None):
+        """ Pass ticks elapsed till now, return list of due entries """
+        now = monotonic() if now is None else now
+        due = []
+        while self._time + self.tick <= now:
+            self._time += self.tick
+            self._current = (self._current + 1) % self.wheel_size
+            slot = self._slots[self._current]
+            if not slot:
+                continue
+            waiting = []
+            for rounds, entry in slot:
+                if rounds:
+                    waiting.append((rounds - 1, entry))
+                else:
+                    due.append(entry)
+            self._slots[self._current] = waiting
+        self._length -= len(due)
+        return due
+
+    def next_tick(self):
+        """ Time of next tick """
+        return self._time + self.tick
+
+
+class RetrySchedulerThread(StatisticsEnabledThread):
+    """ Puts items back to their queues after exponential backoff with jitter.
+
+    schedule() only appends item to timer wheel, the thread wakes once per tick and re-enqueues due items without
+    blocking: item whose queue is full is deferred to the next tick. Delay of attempt n is
+    min(max_delay, base_delay * multiplier ** (n - 1)) reduced by random part up to jitter of it.
+    Re-enqueued item carries its attempt number (see with_attempt), consumer gets it with pop_attempt() and
+    passes to handle_result().
+    Scheduled items are kept in memory only: consumer acks incoming item once it is scheduled, so retries
+    pending on crash are lost even with durable incoming queue.
+    Reports retry.scheduled, retry.released, retry.deferred and retry.exhausted events.
+    """
+    description = "retry scheduler"
+    tick = 0.1
+    wheel_size = 512
+    base_delay = 1.0
+    multiplier = 2.0
+    max_delay = 300.0
+    jitter = 0.5
+    max_attempts = 5
+
+    def __init__(self, *args, **kwargs):
+        super(RetrySchedulerThread, self).__init__(*args, **kwargs)
+        for name in ('tick', 'wheel_size', 'base_delay', 'multiplier', 'max_delay', 'jitter', 'max_attempts'):
+            setattr(self, name, kwargs.get(name, getattr(self, name)))
+        self._wheel = TimerWheel(self.tick, self.wheel_size)
+        self._wheel_mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1.0 - self.jitter * random.random())
+
+    def schedule(self, item, queue, attempt=1):
+        """ Put item to queue after backoff delay of attempt. Return False if attempts exhausted """
+        if attempt > self.max_attempts:
+            self.account_event('retry.exhausted')
+            return False
+        with self._wheel_mutex:
+            self._wheel.add(self.delay(attempt), (item, queue, attempt))
+        self.account_event('retry.scheduled')
+        return True
+
+    def clone(self):
+        """ Make replacement thread releasing items scheduled with this one """
+        thread = super(RetrySchedulerThread, self).clone()
+        thread._wheel = self._wheel
+        thread._wheel_mutex = self._wheel_mutex
+        return thread
+
+    def handle_result(self, item, result, queue, attempt=0):
+        """ Schedule item back to queue if result asks to repeat. Return None if scheduled, result otherwise.
+        item and attempt are as returned by pop_attempt() """
+        if getattr(result, 'code', None) != RESULT_ERROR_REPEAT:
+            return result
+        if self.schedule(item, queue, attempt + 1):
+            return None
+        warning("%s gave up after %s attempts: %s", self.getName(), attempt, getattr(result, 'message', result))
+        return result
+
+    def release(self, now=None):
+        """ Re-enqueue due items, return number of released ones """
+        with self._wheel_mutex:
+            due = self._wheel.advance(now)
+        deferred = []
+        for entry in due:
+            item, queue, attempt = entry
+            if not queue.try_put(with_attempt(item, attempt)):
+                deferred.append(entry)
+        if deferred:
+            with self._wheel_mutex:
+                for entry in deferred:
+                    self._wheel.add(0, entry)
+            self.account_event('retry.deferred', len(deferred))
+        released = len(due) - len(deferred)
+        if released:
+            self.account_event('retry.released', released)
+        return released
+
+    def run(self):
+        while not self._exit_event.isSet():
+            self._exit_event.wait(max(0.0, self._wheel.next_tick() - monotonic()))
+            self.release()
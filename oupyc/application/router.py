@@ -3,7 +3,7 @@ import logging
 
 from oupyc.inthreads.singleton import ThreadSafeSingletonMixin
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread
-from oupyc.utils import underscore_to_camelcase
+from oupyc.utils import monotonic, underscore_to_camelcase
 
 _l = logging.getLogger(__name__)
 _l.setLevel(logging.WARNING)
@@ -15,9 +15,18 @@ class RouterThread(StatisticsEnabledQueuesProcessorThread):
     def run(self):
         while not self._exit_event.isSet():
             debug("Waiting for next item")
+            started = monotonic()
             item = self.get_queue('incoming').get()
+            token = self.get_queue('incoming').taken()
             debug("Got item, processing")
-            self.get_queue(self.route_item(item)).put(item)
+            taken = monotonic()
+            self.begin_work()
+            queue = self.get_queue(self.route_item(item))
+            routed = monotonic()
+            queue.put(item)
+            self.get_queue('incoming').ack(token)
+            self.end_work()
+            self.account_stage(taken - started, routed - taken, monotonic() - routed)
 
     def route_item(self, item):
         raise NotImplementedError("%s to define its own process_item" % self.__class__.__name__)
@@ -28,6 +37,7 @@ class RouterThread(StatisticsEnabledQueuesProcessorThread):
             raise NotImplementedError("%s to have description attribute" % func.__name__)
         return type("Router%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
             description = func.description,
+            stage_name=func.__name__,
             # generate item from callable
             route_item=lambda self, item: func(item),
         ))()
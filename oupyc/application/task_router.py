@@ -1,33 +1,103 @@
 # -*- coding: utf-8 -*-
 import logging
 
-import time
-
 from abc import abstractmethod, ABCMeta
 
+from oupyc.application.balancing import PartitionedDestination, LoadBalancedDestination, DEFAULT_VNODES, \
+    POWER_OF_TWO
+from collections import deque
+
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread
-from oupyc.utils import underscore_to_camelcase
+from oupyc.queues import QueueTimeoutException
+from oupyc.utils import monotonic, underscore_to_camelcase
 
 _l = logging.getLogger(__name__)
 _l.setLevel(logging.WARNING)
 debug, info, warning, error, critical, log = _l.debug, _l.info, _l.warning, _l.error,  _l.critical, _l.log
 
+DEAD_LETTER = 'dead_letter'
 
 
 class ItemRouter(StatisticsEnabledQueuesProcessorThread):
-    """ Simple queue processor. """
+    """ Simple queue processor.
+
+    Routes table is copied on every change and replaced as a whole, so routing reads it without lock and
+    no lock is held while waiting for incoming items. Items without route go to dead letter queue if set, waiting
+    while it is full. Otherwise they are parked in router and routed without waiting, in arrival order, once
+    route is added, checked after every routes change and every retry_interval seconds. Both are counted.
+    At most max_parked items are parked, the oldest one is nacked to make room and counted as overflow. Items
+    nacked on overflow or still parked on exit are replayed after restart by durable incoming queue and lost
+    otherwise.
+
+    Route is either name of router queue or destination object putting item to one of its queues, e.g.
+    PartitionedDestination spreading items over replicas of processor by key or LoadBalancedDestination
+    choosing less loaded replica.
+    """
     __metaclass__ = ABCMeta
     description = "task router thread"
+    # seconds between attempts to route parked items when routes are not changed
+    retry_interval = 1.0
+    # limit of unroutable items kept in router
+    max_parked = 10000
 
     def __init__(self, *args, **kwargs):
         super(ItemRouter, self).__init__(*args, **kwargs)
         self.setName("ROUTER")
-        self.__destinations = kwargs.get('destinations_threads', dict())
+        self.__destinations = dict(kwargs.get('destinations_threads', dict()))
         self.__incoming_key = kwargs.get('key_function', None)
+        self.max_parked = kwargs.get('max_parked', self.max_parked)
+        self.__unroutable = 0
+        self.__overflowed = 0
+        # (key, item, incoming token) of unroutable items, touched by router thread only
+        self.__parked = deque()
+        self.__routes_version = 0
+        self.__retried_version = 0
+        self.__retried_at = monotonic()
+        if kwargs.get('dead_letter_queue', None) is not None:
+            self.set_dead_letter_queue(kwargs['dead_letter_queue'])
 
     def add_item_route(self, task_name, queue_name):
         with self._mutex:
-            self.__destinations[task_name] = queue_name
+            destinations = dict(self.__destinations)
+            destinations[task_name] = queue_name
+            self.__destinations = destinations
+            self.__routes_version += 1
+
+    def remove_item_route(self, task_name):
+        with self._mutex:
+            destinations = dict(self.__destinations)
+            destinations.pop(task_name, None)
+            self.__destinations = destinations
+            self.__routes_version += 1
+
+    def add_partitioned_chain(self, task_name, processor_threads, key_function, vnodes=DEFAULT_VNODES):
+        """ Route task_name items to incoming queues of processor_threads replicas by consistent hash of key """
+        destination = PartitionedDestination(key_function, vnodes)
+        for idx, processor_thread in enumerate(processor_threads):
+            destination = destination.with_replica('%s[%s]' % (task_name, idx), processor_thread.get_queue('incoming'))
+        self.add_item_route(task_name, destination)
+
+    def add_balanced_chain(self, task_name, processor_threads, mode=POWER_OF_TWO):
+        """ Route task_name items to less loaded of processor_threads replicas, skipping full ones """
+        destination = LoadBalancedDestination(mode)
+        for idx, processor_thread in enumerate(processor_threads):
+            destination = destination.with_replica('%s[%s]' % (task_name, idx), processor_thread.get_queue('incoming'))
+        self.add_item_route(task_name, destination)
+
+    def add_replica(self, task_name, replica_name, processor_thread):
+        """ Add processor replica to partitioned or balanced route """
+        with self._mutex:
+            destination = self.__destinations[task_name]
+            self.add_item_route(task_name, destination.with_replica(replica_name, processor_thread.get_queue('incoming')))
+
+    def remove_replica(self, task_name, replica_name):
+        """ Remove replica from partitioned or balanced route """
+        with self._mutex:
+            self.add_item_route(task_name, self.__destinations[task_name].without_replica(replica_name))
+
+    def set_dead_letter_queue(self, queue):
+        """ Queue to put items having no route to """
+        self.add_queue(DEAD_LETTER, queue)
 
     def add_chain(self, task_name, processor_thread, result_queue=None):
         debug("Adding chain to %s.incoming", processor_thread.getName())
@@ -40,30 +110,123 @@ class ItemRouter(StatisticsEnabledQueuesProcessorThread):
         self.add_item_route(task_name, task_name)
         debug('Chain created')
 
+    unroutable = property(lambda self: self.__unroutable, None, None, "Number of items having no route")
+    parked = property(lambda self: len(self.__parked), None, None, "Number of unroutable items waiting for route")
+    overflowed = property(lambda self: self.__overflowed, None, None, "Number of parked items given back on overflow")
+
+    def clone(self):
+        """ Make replacement thread keeping routes, key function and counters """
+        thread = super(ItemRouter, self).clone()
+        thread.__destinations = self.__destinations
+        thread.__incoming_key = self.__incoming_key
+        thread.__unroutable = self.__unroutable
+        thread.__overflowed = self.__overflowed
+        thread.__parked = deque(self.__parked)
+        thread.__routes_version = self.__routes_version
+        thread.__retried_version = self.__retried_version
+        thread.__retried_at = self.__retried_at
+        return thread
+
     def get_item_key(self, item):
         assert callable(self.__incoming_key), "Either set key_function or redefine get_item_key()"
         return self.__incoming_key(item)
 
+    def route_unroutable(self, key, item, token):
+        """ Put item having no route to dead letter queue, waiting while it is full. Without dead letter queue park
+        it until route is added. Return True if item is done with, so its incoming token is to be acked """
+        self.__unroutable += 1
+        self.account_event('router.%s.unroutable' % self.getName())
+        if DEAD_LETTER in self.get_all_queues():
+            warning("No destination for item [%s], put to dead letter queue", key)
+            self.get_queue(DEAD_LETTER).put(item)
+            return True
+        error("No destination for item [%s], park it until route is added", key)
+        self.account_event('router.%s.parked' % self.getName())
+        if len(self.__parked) >= self.max_parked:
+            overflow_key, _, overflow_token = self.__parked.popleft()
+            error("Too many parked items, give back the oldest one [%s]", overflow_key)
+            self.__overflowed += 1
+            self.account_event('router.%s.overflow' % self.getName())
+            self.get_queue('incoming').nack(overflow_token)
+        self.__parked.append((key, item, token))
+        return False
+
+    def try_route_parked(self):
+        """ Route parked items having route now to not full destinations, without waiting. Items of the same key
+        keep their order """
+        self.__retried_version = self.__routes_version
+        self.__retried_at = monotonic()
+        destinations = self.__destinations
+        waiting = set()
+        parked = deque()
+        while self.__parked:
+            key, item, token = entry = self.__parked.popleft()
+            target = destinations.get(key, None)
+            if key in waiting or not target:
+                waiting.add(key)
+                parked.append(entry)
+                continue
+            queue = target if hasattr(target, 'try_put') else self.get_queue(target)
+            if not queue.try_put(item):
+                waiting.add(key)
+                parked.append(entry)
+                continue
+            info("Parked [%s] routed", key)
+            self.get_queue('incoming').ack(token)
+        self.__parked = parked
+
+    def _retry_due(self):
+        return self.__parked and (
+            self.__routes_version != self.__retried_version or
+            monotonic() - self.__retried_at >= self.retry_interval
+        )
+
     def process_next_item(self):
-        # wait for task, put to running registry and start task thread
-        with self._mutex:
-            info("Waiting for received task")
+        info("Waiting for received task")
+        started = monotonic()
+        if not self.__parked:
             item = self.get_queue('incoming').get()
-            key = self.get_item_key(item)
-            target_queue_name = self.__destinations.get(key, None)
-            if target_queue_name:
-                info("Incoming [%s] route to destination %s", key, target_queue_name)
-                self.get_queue(target_queue_name).put(item)
-            else:
-                error("No destination for item [%s], return it to queue", key)
-                self.get_queue('incoming').put(item)
-                time.sleep(1)
+        else:
+            try:
+                # wake up to route parked items even if no new ones come
+                item = self.get_queue('incoming').get(timeout=self.retry_interval)
+            except QueueTimeoutException:
+                self.try_route_parked()
+                return
+        token = self.get_queue('incoming').taken()
+        taken = monotonic()
+        self.begin_work()
+        if self._retry_due():
+            self.try_route_parked()
+        key = self.get_item_key(item)
+        # routes table is never changed in place
+        target = self.__destinations.get(key, None)
+        routed = monotonic()
+        done = True
+        if hasattr(target, 'put'):
+            info("Incoming [%s] route to %s", key, target.__class__.__name__)
+            target.put(item)
+        elif target:
+            info("Incoming [%s] route to destination %s", key, target)
+            self.get_queue(target).put(item)
+        else:
+            done = self.route_unroutable(key, item, token)
+        if done:
+            self.get_queue('incoming').ack(token)
+        self.end_work()
+        self.account_stage(taken - started, routed - taken, monotonic() - routed)
 
     def run(self):
         info("Starting %s", self.__class__.__name__)
         while not self._exit_event.isSet():
             self.process_next_item()
         warning("Got exit signal, finish existed tasks")
-        while self.get_queue('incoming').length() > 0:
+        for _ in range(len(self.get_queue('incoming'))):
             self.process_next_item()
-        info("Stopping %s", self.__class__.__name__)
\ No newline at end of file
+        if self.__parked:
+            self.try_route_parked()
+        for key, item, token in self.__parked:
+            error("No destination for item [%s] on exit, give it back", key)
+            self.get_queue('incoming').nack(token)
+        self.__parked = deque()
+        info("Stopping %s", self.__class__.__name__)
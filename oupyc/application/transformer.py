@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import logging
+from threading import Thread, RLock, Condition
 
 from oupyc.inthreads.statistics import StatisticsEnabledQueuesProcessorThread
-from oupyc.utils import underscore_to_camelcase
+from oupyc.utils import monotonic, underscore_to_camelcase
 
 _l = logging.getLogger(__name__)
 _l.setLevel(logging.DEBUG)
@@ -11,29 +12,169 @@ debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,
 
 class TransformerThread(StatisticsEnabledQueuesProcessorThread):
     """ Takes items from incoming queue, process with transform_item and pass to result queue """
+    # micro-batch mode: take up to batch_size items or items collected in batch_timeout seconds at once
+    batch_size = None
+    batch_timeout = None
+    # pool mode: number of workers sharing incoming queue, keep results in input order if ordered
+    workers = 1
+    ordered = False
+    # do not put None results, e.g. for items handed over elsewhere
+    drop_none = False
+
+    def __init__(self, *args, **kwargs):
+        super(TransformerThread, self).__init__(*args, **kwargs)
+        # ordered pool state: sequence numbers are given on get and results are put in sequence order
+        self._take_mutex = RLock()
+        self._reorder = Condition()
+        self._next_seq = 0
+        self._emit_seq = 0
+        self._pending = {}
 
     def add_queue(self, name, queue):
         assert name in ['incoming', 'result'], "%s allows only incoming and result threads" % self.__class__.__name__
         super(TransformerThread, self).add_queue(name, queue)
 
     def run(self):
+        if self.workers > 1:
+            self.run_pool()
+        else:
+            self.work()
+
+    def run_pool(self):
+        """ Run workers-1 helper threads and one more worker in this thread """
+        helpers = [
+            Thread(target=self.work_safe, name="%s.worker[%s]" % (self.getName(), idx))
+            for idx in range(1, self.workers)
+        ]
+        for helper in helpers:
+            helper.setDaemon(self.isDaemon())
+            helper.start()
+        self.work_safe()
+        for helper in helpers:
+            helper.join()
+
+    def work(self):
         while not self._exit_event.isSet():
-            debug("Waiting for next item")
-            item = self.get_queue('incoming').get()
-            debug("Got item, transforming")
-            transformed = self.transform_item(item)
-            debug("Item processed, WAIT result thread")
-            self.get_queue('result').put(transformed)
+            if self.batch_size:
+                self.process_next_batch()
+            else:
+                self.process_next_item()
+
+    def work_safe(self):
+        """ Pool worker loop. Failed items are logged and skipped to keep pool size """
+        while not self._exit_event.isSet():
+            try:
+                if self.batch_size:
+                    self.process_next_batch()
+                else:
+                    self.process_next_item()
+            except Exception as exc:
+                self.end_work()
+                _l.exception("%s failed to transform: %s", self.getName(), exc)
+
+    def _take(self, get):
+        """ Get next item(s) with get callable, return it with sequence number in ordered mode """
+        if not self.ordered:
+            return None, get()
+        with self._take_mutex:
+            seq = self._next_seq
+            taken = get()
+            self._next_seq += 1
+            return seq, taken
+
+    def _emit(self, seq, put, token=None):
+        """ Put result(s) with put callable, then ack incoming item(s) of token. In ordered mode wait results for
+        all previous sequence numbers """
+        if token is not None:
+            put_result = put
+
+            def put():
+                put_result()
+                self.get_queue('incoming').ack(token)
+        if not self.ordered:
+            return put()
+        with self._reorder:
+            # limit reorder buffer, lagging worker is always allowed to proceed
+            while seq - self._emit_seq >= 2 * self.workers:
+                self._reorder.wait()
+            self._pending[seq] = put
+            while self._emit_seq in self._pending:
+                self._pending.pop(self._emit_seq)()
+                self._emit_seq += 1
+            self._reorder.notify_all()
+
+    def _transform(self, seq, token, transform, taken):
+        try:
+            return transform(taken)
+        except Exception:
+            # failed item(s) are not acked by following ones
+            self.get_queue('incoming').nack(token)
+            if self.ordered:
+                # release sequence number of failed item(s)
+                self._emit(seq, lambda: None)
+            raise
+
+    def process_next_item(self):
+        debug("Waiting for next item")
+        started = monotonic()
+        seq, item = self._take(lambda: self.get_queue('incoming').get())
+        token = self.get_queue('incoming').taken()
+        debug("Got item, transforming")
+        taken = monotonic()
+        self.begin_work()
+        transformed = self._transform(seq, token, self.transform_item, item)
+        debug("Item processed, WAIT result thread")
+        called = monotonic()
+        if transformed is None and self.drop_none:
+            self._emit(seq, lambda: None, token)
+        else:
+            self._emit(seq, lambda: self.get_queue('result').put(transformed), token)
+        self.end_work()
+        self.account_stage(taken - started, called - taken, monotonic() - called)
+
+    def process_next_batch(self):
+        debug("Waiting for next batch")
+        started = monotonic()
+        seq, items = self._take(lambda: self.get_queue('incoming').get_many(self.batch_size, self.batch_timeout))
+        token = self.get_queue('incoming').taken()
+        debug("Got %s items, transforming", len(items))
+        taken = monotonic()
+        self.begin_work()
+        transformed = self._transform(seq, token, self.transform_batch, items)
+        if self.drop_none:
+            transformed = [result for result in transformed if result is not None]
+        debug("Batch processed, WAIT result thread")
+        called = monotonic()
+        self._emit(seq, lambda: self.get_queue('result').put_many(transformed), token)
+        self.end_work()
+        self.account_stage(taken - started, called - taken, monotonic() - called, len(items))
 
     def transform_item(self, item):
         raise NotImplementedError("%s to define its own process_item" % self.__class__.__name__)
 
+    def transform_batch(self, items):
+        """ Transform list of items returning list of results """
+        return [self.transform_item(item) for item in items]
+
     @classmethod
-    def make(cls, func):
+    def make(cls, func, batch_size=None, batch_timeout=None, workers=1, ordered=False):
+        """ Make transformer thread from callable. Callable having true batch attribute takes and returns lists.
+        With workers > 1 callable is run by workers pool, ordered pool keeps results in input order """
         if not hasattr(func, "description"):
             raise NotImplementedError("%s to have description attribute" % func.__name__)
-        return type("Transformer%s" % underscore_to_camelcase(func.__name__), (cls,), dict(
+        attrs = dict(
             description= func.description,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+            workers=workers,
+            ordered=ordered,
+            stage_name=func.__name__,
             # generate item from callable
             transform_item=lambda self, item: func(item),
-        ))()
+        )
+        if getattr(func, "batch", False):
+            attrs.update(
+                transform_item=lambda self, item: func([item])[0],
+                transform_batch=lambda self, items: func(items),
+            )
+        return type("Transformer%s" % underscore_to_camelcase(func.__name__), (cls,), attrs)()
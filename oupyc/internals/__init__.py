@@ -5,6 +5,12 @@ _l = logging.getLogger(__name__)
 _l.setLevel(logging.DEBUG)
 debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
 
+try:
+    basestring
+except NameError:
+    # python 3
+    basestring = str
+
 class NamedObject(object):
     """ Simple object having name """
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import re
+
+from oupyc.stdthreads import ExitEventAwareThread
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    # python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+_QUANTILES = (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99'), ('p999', '0.999'))
+_GAUGES = ('min', 'max', 'last')
+# sampled queue metrics exported as gauge of given value or counter of sums
+_QUEUE_GAUGES = {'length': 'last', 'high_water': 'max'}
+_QUEUE_COUNTERS = ('enqueued', 'dequeued', 'full.seconds', 'empty.seconds')
+_INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def metric_name(name):
+    """ Make OpenMetrics metric name from dotted statistics name """
+    name = _INVALID_CHARS.sub('_', name)
+    return name[0].isdigit() and '_%s' % name or name
+
+
+def metric_value(value):
+    """ Format float as OpenMetrics number, NaN and infinities are spelled NaN, +Inf and -Inf """
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return value > 0 and '+Inf' or '-Inf'
+    return repr(value)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        payload = self.server.exporter.payload
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        debug(format, *args)
+
+
+class OpenMetricsExporterThread(ExitEventAwareThread):
+    """ Serves aggregated statistics over HTTP in OpenMetrics text format.
+
+    Payload is rendered once per closed window of attached statistics processor and every scrape just sends it.
+    Value metrics are exported as summaries with window quantiles plus min/max/last gauges, events as counters.
+    Sampled queue metrics are exported as gauges (length, high_water) and counters (enqueued, dequeued, seconds
+    full or empty). Summary sums and counts and all counters are totals since exporter start. Metrics without
+    events in closed window are still rendered, with values of the last window they had events in.
+
+    Address is bound on construction, so bad or busy address fails application start. Replacement thread made by
+    clone() serves the same socket, keeps payload and totals and takes over the processor listener.
+    """
+    description = 'statistics OpenMetrics exporter'
+
+    def __init__(self, address, *args, **kwargs):
+        super(OpenMetricsExporterThread, self).__init__(*args, **kwargs)
+        self.address = address
+        self.payload = b'# EOF\n'
+        # name -> [count, sum] since start and summary of last window having the name
+        self.__totals = {}
+        self.__last = {}
+        self.__processor = None
+        self.__window = None
+        self.__server = kwargs.get('server') or HTTPServer(address, _MetricsHandler)
+        # wake up to check exit event
+        self.__server.timeout = 1
+
+    server_address = property(lambda self: self.__server.server_address, None, None, "Bound address")
+
+    def attach(self, processor, window=60):
+        """ Render payload when window of processor closed. Attaching again, e.g. to replacement processor,
+        moves the listener """
+        if self.__processor is not None:
+            self.__processor.remove_listener(self.__window, self.update)
+        processor.add_listener(window, self.update)
+        self.__processor, self.__window = processor, window
+
+    def clone(self):
+        """ Make replacement thread serving the same socket, keeping payload, totals and processor listener """
+        self._init_kwargs = dict(self._init_kwargs, server=self.__server)
+        thread = super(OpenMetricsExporterThread, self).clone()
+        thread.payload = self.payload
+        thread.__totals = self.__totals
+        thread.__last = self.__last
+        if self.__processor is not None:
+            self.__processor.remove_listener(self.__window, self.update)
+            thread.attach(self.__processor, self.__window)
+        return thread
+
+    def update(self, start, summary):
+        for name, values in summary.items():
+            totals = self.__totals.setdefault(name, [0, 0])
+            totals[0] += values['count']
+            totals[1] += values.get('sum', 0)
+            self.__last[name] = values
+        # every known family is rendered, ones without events in window keep their totals and last values
+        lines = []
+        for name in sorted(self.__last):
+            lines.extend(self._render_metric(name, self.__last[name], self.__totals[name]))
+        lines.append('# EOF\n')
+        self.payload = '\n'.join(lines).encode('utf-8')
+
+    def _render_metric(self, name, values, totals):
+        family = metric_name(name)
+        if 'sum' not in values:
+            return ['# TYPE %s counter' % family, '%s_total %s' % (family, totals[0])]
+        if name.startswith('queue.'):
+            return self._render_queue_metric(name, family, values, totals)
+        lines = ['# TYPE %s summary' % family]
+        for suffix, quantile in _QUANTILES:
+            # no quantiles if window had infinite or NaN values only
+            if suffix in values:
+                lines.append('%s{quantile="%s"} %s' % (family, quantile, metric_value(values[suffix])))
+        lines.append('%s_sum %s' % (family, metric_value(totals[1])))
+        lines.append('%s_count %s' % (family, totals[0]))
+        for gauge in _GAUGES:
+            lines.append('# TYPE %s_%s gauge' % (family, gauge))
+            lines.append('%s_%s %s' % (family, gauge, metric_value(values[gauge])))
+        return lines
+
+    def _render_queue_metric(self, name, family, values, totals):
+        for suffix, value_name in _QUEUE_GAUGES.items():
+            if name.endswith('.%s' % suffix):
+                return ['# TYPE %s gauge' % family, '%s %s' % (family, metric_value(values[value_name]))]
+        for suffix in _QUEUE_COUNTERS:
+            if name.endswith('.%s' % suffix):
+                return ['# TYPE %s counter' % family, '%s_total %s' % (family, metric_value(totals[1]))]
+        return []
+
+    def run(self):
+        self.__server.exporter = self
+        info("Serving OpenMetrics on %s:%s", *self.__server.server_address[:2])
+        try:
+            while not self._exit_event.isSet():
+                self.__server.handle_request()
+        finally:
+            # socket is kept for replacement thread unless application stops
+            if self._exit_event.isSet():
+                self.__server.server_close()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from math import ceil, isinf, isnan, log
+
+__author__ = 'AMarin'
+
+# default relative accuracy of quantile values
+DEFAULT_ACCURACY = 0.01
+# default buckets limit, with 1% accuracy covers values ratio about 1e17 before collapsing
+DEFAULT_MAX_BUCKETS = 2048
+
+
+class LogHistogram(object):
+    """ Mergeable streaming histogram with logarithmic buckets.
+
+    Value v > 0 is counted in bucket ceil(log(v, gamma)), so any quantile is returned with given relative
+    accuracy. Negative values are counted by absolute value in separate buckets, zeros are just counted.
+    Infinite and NaN values have no bucket, they are counted in nonfinite only and are not part of count.
+    Memory is bounded by max_buckets per sign: when exceeded the lowest buckets are collapsed together.
+    """
+    __slots__ = ('accuracy', 'max_buckets', 'gamma', 'log_gamma', 'positive', 'negative', 'zero', 'count', 'nonfinite')
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self.log_gamma = log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.nonfinite = 0
+
+    def add(self, value):
+        if isnan(value) or isinf(value):
+            self.nonfinite += 1
+            return
+        if value > 0:
+            buckets = self.positive
+        elif value < 0:
+            buckets = self.negative
+            value = -value
+        else:
+            self.zero += 1
+            self.count += 1
+            return
+        idx = int(ceil(log(value) / self.log_gamma))
+        buckets[idx] = buckets.get(idx, 0) + 1
+        self.count += 1
+        if len(buckets) > self.max_buckets:
+            self._collapse(buckets)
+
+    def _collapse(self, buckets):
+        """ Join lowest buckets until limit satisfied """
+        keys = sorted(buckets)
+        excess = len(keys) - self.max_buckets
+        moved = sum(buckets.pop(key) for key in keys[:excess])
+        buckets[keys[excess]] += moved
+
+    def merge(self, other):
+        """ Add counts of other histogram having the same accuracy """
+        assert self.gamma == other.gamma, "Can merge only histograms with the same accuracy"
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for idx, count in other_buckets.items():
+                buckets[idx] = buckets.get(idx, 0) + count
+            if len(buckets) > self.max_buckets:
+                self._collapse(buckets)
+        self.zero += other.zero
+        self.count += other.count
+        self.nonfinite += other.nonfinite
+        return self
+
+    def copy(self):
+        return LogHistogram(self.accuracy, self.max_buckets).merge(self)
+
+    def _value(self, idx):
+        """ Bucket representative value with relative error within accuracy """
+        return 2.0 * self.gamma ** idx / (self.gamma + 1)
+
+    def quantiles(self, *qs):
+        """ Return approximate q-quantiles (0 <= q <= 1) in one pass over buckets, None values if empty """
+        result = [None] * len(qs)
+        if not self.count:
+            return result
+        ranks = sorted((q * (self.count - 1), pos) for pos, q in enumerate(qs))
+        # from the most negative to the most positive
+        buckets = [(-self._value(idx), self.negative[idx]) for idx in sorted(self.negative, reverse=True)]
+        buckets.append((0, self.zero))
+        buckets.extend((self._value(idx), self.positive[idx]) for idx in sorted(self.positive))
+        seen = 0
+        current = 0
+        for value, count in buckets:
+            seen += count
+            while current < len(ranks) and seen > ranks[current][0]:
+                result[ranks[current][1]] = value
+                current += 1
+        return result
+
+    def quantile(self, q):
+        return self.quantiles(q)[0]
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import datetime, timedelta
-from time import sleep
-from oupyc.queues import NamedAndTypedQueue
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+from time import sleep, time
+from oupyc.inthreads.histogram import LogHistogram
+from oupyc.queues import NamedAndTypedQueue, PriorityStorageMixin
+from oupyc.queues.durable import DurableStorageMixin
+from oupyc.queues.spilling import SpillingStorageMixin
 from oupyc.stdthreads import ExitEventAwareThread, QueueProcessorThread
+from oupyc.utils import monotonic
 
 __author__ = 'AMarin'
 
@@ -11,21 +18,167 @@ _l = logging.getLogger(__name__)
 _l.setLevel(logging.INFO)
 debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
 
-# Internal queues for stat records
-_IN_QUEUE = None
+# Internal queue for aggregated stat records
 _OUT_QUEUE_MINUTES = None
 def _assert_is_started():
-    global _IN_QUEUE, _OUT_QUEUE_MINUTES
-    assert _IN_QUEUE is not None, "You must call %s.start() first" % __name__
+    global _OUT_QUEUE_MINUTES
     assert _OUT_QUEUE_MINUTES is not None, "You must call %s.start() first" % __name__
 
 
+# Accumulator list indexes
+_COUNT, _SUM, _MIN, _MAX, _LAST, _HISTOGRAM = range(6)
+# Reported percentiles as (name suffix, quantile)
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999))
+# Aggregation windows in seconds, each one is a multiple of previous. The first is collection interval
+WINDOWS = (1, 10, 60, 300, 3600)
+# Windows passed to save function
+OUTPUT_WINDOWS = (60,)
+# Number of recent windows kept for each resolution
+HISTORY_LENGTH = 60
+
+# Per thread accumulator shards
+_SHARDS = []
+_SHARDS_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+# Queues sampled by statistics processor
+_SAMPLED_QUEUES = weakref.WeakSet()
+_SAMPLED_QUEUES_LOCK = threading.Lock()
+
+
+class _StatShard(object):
+    """ Metric accumulators of single thread. Only owner thread updates data, aggregator replaces it as a whole """
+    __slots__ = ('data', 'thread')
+
+    def __init__(self):
+        self.data = {}
+        self.thread = threading.current_thread()
+
+
+def _shard_data():
+    try:
+        return _LOCAL.shard.data
+    except AttributeError:
+        shard = _LOCAL.shard = _StatShard()
+        with _SHARDS_LOCK:
+            _SHARDS.append(shard)
+        return shard.data
+
+
+def _update(name, value):
+    """ Account metric value in current thread shard, no locks taken """
+    data = _shard_data()
+    acc = data.get(name)
+    if acc is None or acc[_HISTOGRAM] is None:
+        # events counted under the same name so far are kept in count
+        acc = data[name] = [(acc and acc[_COUNT] or 0) + 1, value, value, value, value, LogHistogram()]
+    else:
+        acc[_COUNT] += 1
+        acc[_SUM] += value
+        if value < acc[_MIN]:
+            acc[_MIN] = value
+        if value > acc[_MAX]:
+            acc[_MAX] = value
+        acc[_LAST] = value
+    acc[_HISTOGRAM].add(value)
+
+
+def _count(name, count=1):
+    """ Account event(s) in current thread shard, no locks taken """
+    data = _shard_data()
+    acc = data.get(name)
+    if acc is None:
+        data[name] = [count, 0, 0, 0, 0, None]
+    else:
+        acc[_COUNT] += count
+
+
+def _merge(target, data):
+    """ Merge accumulators dict data into target accumulators dict """
+    for name, acc in data.items():
+        current = target.get(name)
+        if current is None:
+            current = target[name] = list(acc)
+            if acc[_HISTOGRAM] is not None:
+                current[_HISTOGRAM] = acc[_HISTOGRAM].copy()
+        else:
+            current[_COUNT] += acc[_COUNT]
+            if acc[_HISTOGRAM] is None:
+                continue
+            if current[_HISTOGRAM] is None:
+                # only events were counted under the name so far
+                current[_SUM:_HISTOGRAM] = acc[_SUM:_HISTOGRAM]
+                current[_HISTOGRAM] = acc[_HISTOGRAM].copy()
+                continue
+            current[_SUM] += acc[_SUM]
+            current[_MIN] = min(current[_MIN], acc[_MIN])
+            current[_MAX] = max(current[_MAX], acc[_MAX])
+            current[_LAST] = acc[_LAST]
+            if acc[_HISTOGRAM] is not None:
+                current[_HISTOGRAM].merge(acc[_HISTOGRAM])
+
+
+def _swap_shards():
+    """ Take collected data of all shards replacing it with empty dicts. Drops shards of finished threads """
+    collected = []
+    with _SHARDS_LOCK:
+        for shard in list(_SHARDS):
+            data, shard.data = shard.data, {}
+            if data:
+                collected.append(data)
+            if not shard.thread.is_alive():
+                _SHARDS.remove(shard)
+    return collected
+
+
+def _summarize(data):
+    """ Make {name: {value_name: value}} from accumulators dict """
+    summary = {}
+    for name, acc in data.items():
+        if acc[_HISTOGRAM] is None:
+            # just counting events
+            summary[name] = dict(count=acc[_COUNT])
+            continue
+        values = summary[name] = dict(
+            count=acc[_COUNT],
+            max=acc[_MAX],
+            min=acc[_MIN],
+            sum=acc[_SUM],
+            # sum with 0.0 to make float result
+            avg=(acc[_SUM] + 0.0) / acc[_COUNT],
+            last=acc[_LAST],
+        )
+        quantiles = acc[_HISTOGRAM].quantiles(*[q for _, q in PERCENTILES])
+        for (suffix, _), value in zip(PERCENTILES, quantiles):
+            if value is None:
+                # only infinite or NaN values seen
+                continue
+            # bucket value may be slightly out of exact bounds
+            values[suffix] = min(max(value, acc[_MIN]), acc[_MAX])
+    return summary
+
+
+class _Rollup(object):
+    """ Accumulators of current window and summaries of recent windows of single resolution """
+
+    def __init__(self, seconds, history_length):
+        self.seconds = seconds
+        self.start = None
+        self.data = {}
+        self.history = deque(maxlen=history_length)
+
+    def window_start(self, timestamp):
+        return timestamp - timestamp % self.seconds
+
+
 class StatRecord(object):
 
-    def __init__(self, counter, value, dt=None):
+    def __init__(self, counter, value, dt=None, window=None):
         self.counter = counter
         self.value = value
         self.time = dt is not None and dt or datetime.now()
+        # aggregation window length in seconds
+        self.window = window
 
     def __repr__(self):
         return '%s %s %s' % (self.time, self.counter, self.value)
@@ -38,8 +191,8 @@ class _StatRecordQueue(NamedAndTypedQueue):
         kwargs['allow'] = StatRecord
         super(_StatRecordQueue, self).__init__(*args, **kwargs)
 
-    def put_record(self, name, val, dt=None):
-        self.put(StatRecord(name, val, dt))
+    def put_record(self, name, val, dt=None, window=None):
+        self.put(StatRecord(name, val, dt, window))
 
     def put_event(self, name):
         self.put(StatRecord(name, 0))
@@ -69,8 +222,7 @@ class NamedQueue(NamedAndTypedQueue):
 
     def _account(self):
         _assert_is_started()
-        global _IN_QUEUE
-        _IN_QUEUE.put_record("%s.length" % self.__name, self.length())
+        _update("%s.length" % self.__name, len(self))
 
     def getName(self):
         return self.__name
@@ -81,123 +233,314 @@ class NamedQueue(NamedAndTypedQueue):
 
 
 class NamedQueueWithStatistics(NamedQueue):
-    """ Queue counting self length on every change """
+    """ Queue sampled by statistics processor.
+
+    Every change only updates counters under queue lock already held. Once per collection interval statistics
+    processor calls sample() reporting queue.<name>.* metrics: length, high_water mark, enqueued and dequeued
+    items and seconds spent full or empty since previous sample.
+    """
 
     def __init__(self, *args, **kwargs):
         super(NamedQueueWithStatistics, self).__init__(*args, **kwargs)
+        self._last_length = 0
+        self._enqueued = 0
+        self._dequeued = 0
+        self._high_water = 0
+        self._full_since = None
+        self._empty_since = monotonic()
+        self._full_time = 0.0
+        self._empty_time = 0.0
+        with _SAMPLED_QUEUES_LOCK:
+            _SAMPLED_QUEUES.add(self)
 
     def on_change(self):
-        global _IN_QUEUE
-        _assert_is_started()
-        self._account()
+        length = len(self)
+        delta = length - self._last_length
+        if delta > 0:
+            self._enqueued += delta
+            if length > self._high_water:
+                self._high_water = length
+        else:
+            self._dequeued -= delta
+        # track time full or empty on state changes only
+        if self._full_since is not None and length < self._size:
+            self._full_time += monotonic() - self._full_since
+            self._full_since = None
+        elif self._full_since is None and length >= self._size:
+            self._full_since = monotonic()
+        if self._empty_since is not None and length:
+            self._empty_time += monotonic() - self._empty_since
+            self._empty_since = None
+        elif self._empty_since is None and not length:
+            self._empty_since = monotonic()
+        self._last_length = length
+
+    def sample(self):
+        """ Account queue gauges and counters since previous sample """
+        with self._mutex:
+            now = monotonic()
+            length = len(self)
+            full_time, empty_time = self._full_time, self._empty_time
+            if self._full_since is not None:
+                full_time += now - self._full_since
+                self._full_since = now
+            if self._empty_since is not None:
+                empty_time += now - self._empty_since
+                self._empty_since = now
+            values = (
+                ('length', length),
+                ('high_water', self._high_water),
+                ('enqueued', self._enqueued),
+                ('dequeued', self._dequeued),
+                ('full.seconds', full_time),
+                ('empty.seconds', empty_time),
+            )
+            self._enqueued = self._dequeued = 0
+            self._high_water = length
+            self._full_time = self._empty_time = 0.0
+        for suffix, value in values:
+            _update("queue.%s.%s" % (self.getName(), suffix), value)
+
+
+class NamedPriorityQueueWithStatistics(PriorityStorageMixin, NamedQueueWithStatistics):
+    """ Sampled queue giving items in priority order, see PriorityStorageMixin """
+
+
+class NamedSpillingQueueWithStatistics(SpillingStorageMixin, NamedQueueWithStatistics):
+    """ Sampled queue spilling overflow to disk, see SpillingStorageMixin """
+
+
+class NamedDurableQueueWithStatistics(DurableStorageMixin, NamedQueueWithStatistics):
+    """ Sampled queue with write-ahead log, see DurableStorageMixin """
+
+
+def _sample_queues():
+    with _SAMPLED_QUEUES_LOCK:
+        queues = list(_SAMPLED_QUEUES)
+    for queue in queues:
+        queue.sample()
 
 
 class StatisticsProcessorThread(ExitEventAwareThread):
+    """ Collects per thread accumulators every collection interval and rolls them up into coarser windows.
+
+    Data taken from thread shards is merged one interval later, so owner threads finish updates started before
+    the swap without locking. Closed window of every resolution is merged into the next resolution window and
+    its summary is kept in ring buffer of recent windows. Records of output_windows are put to saver queue.
+    """
     description = 'statistics processor'
 
     def __init__(self, *args, **kwargs):
-        global _IN_QUEUE, _OUT_QUEUE_MINUTES
+        global _OUT_QUEUE_MINUTES
         _assert_is_started()
         super(StatisticsProcessorThread, self).__init__(*args, **kwargs)
-        self.__previous_time = self.minute_start()
-
-    def _aggregate_stat(self):
-        _assert_is_started()
-        global _IN_QUEUE, _OUT_QUEUE_MINUTES
-        current_time = datetime.now()
-        prev_start = self.minute_start() - timedelta(minutes=1)
-        prev_end = prev_start + timedelta(seconds=59, microseconds=999999)
-        debug("%s aggregate slice %s-%s", current_time, prev_start, prev_end)
-        records = _IN_QUEUE.pop_filtered(lambda x: prev_start <= x.time <= prev_end)
-        debug("Got %s records to aggregate, %s rest in queue", len(records), len(_IN_QUEUE))
-
-        # process unique metrica names
-        names = list(set(map(lambda x: x.counter, records)))
-        for name in names:
-            # debug("Process %s", name)
-            values = map(lambda x: x.value, filter(lambda x: x.counter == name, records))
-            if '.event' == name[-6:]:
-                # just counting events
-                _OUT_QUEUE_MINUTES.put_record('%s.count' % name, len(values), prev_start)
-            else:
-                _OUT_QUEUE_MINUTES.put_record('%s.max' % name, max(values), prev_start)
-                _OUT_QUEUE_MINUTES.put_record('%s.min' % name, min(values), prev_start)
-                # sum with 0.0 to make float result
-                _OUT_QUEUE_MINUTES.put_record('%s.avg' % name, sum(values, 0.0) / len(values), prev_start)
-                _OUT_QUEUE_MINUTES.put_record('%s.last' % name, values[-1], prev_start)
-
-        # push some handy stat values
-        _OUT_QUEUE_MINUTES.put_record(
-            'stat.aggregate.duration.ms',
-            (datetime.now()-current_time).microseconds/1000.0,
-            prev_start
-        )
-
-    def minute_start(self):
-        current_time = datetime.now()
-        return current_time - timedelta(seconds=current_time.second, microseconds=current_time.microsecond)
-
-    def seconds_start(self):
-        current_time = datetime.now()
-        return current_time - timedelta(microseconds=current_time.microsecond)
+        windows = kwargs.get('windows', None) or WINDOWS
+        for finer, coarser in zip(windows, windows[1:]):
+            assert coarser % finer == 0, "Window %s is not a multiple of %s" % (coarser, finer)
+        self.__output_windows = kwargs.get('output_windows', None) or OUTPUT_WINDOWS
+        history_length = kwargs.get('history_length', None) or HISTORY_LENGTH
+        self.__levels = [_Rollup(seconds, history_length) for seconds in windows]
+        self.__listeners = {}
+        self.__swapped = []
+        self.__swapped_start = None
+
+    windows = property(lambda self: [level.seconds for level in self.__levels], None, None, "Windows in seconds")
+
+    def clone(self):
+        """ Make replacement thread keeping windows data, history and listeners """
+        thread = super(StatisticsProcessorThread, self).clone()
+        thread.__output_windows = self.__output_windows
+        thread.__levels = self.__levels
+        thread.__listeners = self.__listeners
+        thread.__swapped = self.__swapped
+        thread.__swapped_start = self.__swapped_start
+        return thread
+
+    def _collect(self, now=None):
+        """ Close collection interval swapped on previous call, swap data for the next call """
+        base = self.__levels[0]
+        now = now or time()
+        _sample_queues()
+        if self.__swapped_start is not None:
+            data = {}
+            for shard_data in self.__swapped:
+                _merge(data, shard_data)
+            base.start = self.__swapped_start
+            base.data = data
+            self._close(0)
+        self.__swapped = _swap_shards()
+        # just swapped data belongs to interval ended at the last boundary
+        self.__swapped_start = base.window_start(now) - base.seconds
+
+    def _close(self, idx):
+        """ Close current window of level idx and roll it up into the next level """
+        level = self.__levels[idx]
+        started = time()
+        summary = _summarize(level.data)
+        level.history.append((level.start, summary))
+        for listener in self.__listeners.get(level.seconds, []):
+            listener(level.start, summary)
+        if level.seconds in self.__output_windows:
+            records = self._make_records(level, summary)
+            # push some handy stat values
+            records.append(StatRecord(
+                'stat.aggregate.duration.ms',
+                (time() - started) * 1000.0,
+                datetime.fromtimestamp(level.start),
+                level.seconds,
+            ))
+            self._output(records)
+        if idx + 1 < len(self.__levels):
+            parent = self.__levels[idx + 1]
+            parent_start = parent.window_start(level.start)
+            if parent.start is not None and parent.start != parent_start:
+                # windows skipped, close stale one first
+                self._close(idx + 1)
+            if parent.start != parent_start:
+                parent.start, parent.data = parent_start, {}
+            _merge(parent.data, level.data)
+            if level.start + level.seconds >= parent.start + parent.seconds:
+                self._close(idx + 1)
+                parent.start, parent.data = None, {}
+        level.data = {}
+
+    def _make_records(self, level, summary):
+        dt = datetime.fromtimestamp(level.start)
+        debug("aggregate %s metrics of %ss window %s", len(summary), level.seconds, dt)
+        return [
+            StatRecord('%s.%s' % (name, value_name), value, dt, level.seconds)
+            for name, values in summary.items()
+            for value_name, value in values.items()
+        ]
+
+    def _output(self, records):
+        """ Put window records to saver queue at once, never wait for slow saver. Count dropped records """
+        put = _OUT_QUEUE_MINUTES.try_put_many(records)
+        if put < len(records):
+            warning("Saver queue is full, %s of %s records dropped", len(records) - put, len(records))
+            _count('stat.saver.dropped', len(records) - put)
+
+    def add_listener(self, window, listener):
+        """ Call listener(window start timestamp, summary) in processor thread when window of given length closed """
+        assert window in self.windows, "No %ss window, choose one of %s" % (window, self.windows)
+        self.__listeners.setdefault(window, []).append(listener)
+
+    def remove_listener(self, window, listener):
+        """ Stop calling listener added with add_listener """
+        listeners = self.__listeners.get(window, [])
+        # replaced as a whole, window being closed iterates the old list
+        self.__listeners[window] = [added for added in listeners if added != listener]
+
+    def get_history(self, window, name=None):
+        """ Return [(window start datetime, summary)] of recent windows of given length, oldest first.
+        Summary is {metric: {value_name: value}} or {value_name: value} of single metric if name given """
+        for level in self.__levels:
+            if level.seconds == window:
+                return [
+                    (datetime.fromtimestamp(start), name is None and summary or summary.get(name, {}))
+                    for start, summary in list(level.history)
+                ]
+        raise ValueError("No %ss window, choose one of %s" % (window, self.windows))
 
     def run(self):
         _assert_is_started()
+        interval = self.__levels[0].seconds
         while not self._exit_event.isSet():
             self.put_event('stat.threads.switch.event')
-            debug("Processing stat queue")
-            debug(self.seconds_start())
-            if self.__previous_time < self.minute_start():
-                self._aggregate_stat()
-                self.__previous_time = self.minute_start()
-            sleep(1)
+            debug("Processing stat shards")
+            self._collect()
+            # wake up right after next interval boundary
+            sleep(interval - time() % interval)
 
     def put_record(self, name, value):
         _assert_is_started()
-        global _IN_QUEUE
         debug("+STAT %s %s", name, value)
-        _IN_QUEUE.put_record(name, value)
+        _update(name, value)
 
     def put_event(self, name):
         _assert_is_started()
-        global _IN_QUEUE
         debug("+EVENT %s", name)
-        _IN_QUEUE.put_record('%s.event' % name, 0)
+        _count('%s.event' % name)
 
 
 class StatisticsSaverThread(ExitEventAwareThread):
+    """ Calls save function for aggregated records.
+
+    By default function is called with every single record. With batch_size set it is called with list of up to
+    batch_size records collected within batch_timeout seconds. Records of window are queued at once, so batch_size
+    not less than number of records of window gives whole window in one call.
+    """
     description = 'statistics saver'
 
     def __init__(self, process_record_function, *args, **kwargs):
         super(StatisticsSaverThread, self).__init__(*args, **kwargs)
         assert callable(process_record_function), "argument to be callable"
         self.__process_record = process_record_function
+        self.batch_size = kwargs.get('batch_size', None)
+        self.batch_timeout = kwargs.get('batch_timeout', None)
 
     def run(self):
         global _OUT_QUEUE_MINUTES
         _assert_is_started()
         while not self._exit_event.isSet():
-            self.__process_record(_OUT_QUEUE_MINUTES.get())
+            if self.batch_size:
+                records = _OUT_QUEUE_MINUTES.get_many(self.batch_size, self.batch_timeout)
+                started = time()
+                self.__process_record(records)
+                _update('stat.saver.batch.size', len(records))
+            else:
+                records = _OUT_QUEUE_MINUTES.get()
+                started = time()
+                self.__process_record(records)
+            _update('stat.saver.duration.ms', (time() - started) * 1000.0)
 
 
 class StatisticsEnabledThread(ExitEventAwareThread):
     """ Thread having internal methods to put stat metrics values """
+    # name used in stage.<stage_name>.* metrics, class name if not set
+    stage_name = None
+    # account stage timings when statistics started
+    instrumented = True
 
     def __init__(self, *args, **kwargs):
         super(StatisticsEnabledThread, self).__init__(*args, **kwargs)
         assert hasattr(self.__class__, 'description'), "%s must have description attribute" % self.__class__.__name__
+        self.__stage_metrics = None
+
+    def account_event(self, name, count=1):
+        """ Put event(s) like put_event but do nothing if statistics not started """
+        if _OUT_QUEUE_MINUTES is not None:
+            _count(name, count)
+
+    def account_stage(self, get_time, call_time, put_time=None, items=1):
+        """ Account seconds spent waiting incoming item(s), in callable and waiting to put result(s).
+
+        Reports stage.<stage_name>.get.ms, .call.ms, .put.ms values and stage.<stage_name>.items count,
+        items per second is the count divided by window length. Does nothing if statistics not started.
+        """
+        if _OUT_QUEUE_MINUTES is None or not self.instrumented:
+            return
+        if self.__stage_metrics is None:
+            name = self.stage_name or self.__class__.__name__
+            self.__stage_metrics = tuple("stage.%s.%s" % (name, metric) for metric in (
+                'get.ms', 'call.ms', 'put.ms', 'items'
+            ))
+        get_metric, call_metric, put_metric, items_metric = self.__stage_metrics
+        _update(get_metric, get_time * 1000.0)
+        _update(call_metric, call_time * 1000.0)
+        if put_time is not None:
+            _update(put_metric, put_time * 1000.0)
+        _count(items_metric, items)
 
     def put_record(self, name, value):
         """ Put metrica specifyed by name and value """
-        global _IN_QUEUE
         _assert_is_started()
-        _IN_QUEUE.put_record(name, value)
+        _update(name, value)
 
     def put_event(self, name):
         """ Put event specifyed by name """
-        global _IN_QUEUE
         _assert_is_started()
-        _IN_QUEUE.put_event(name)
+        _count(name)
 
 
 class StatisticsEnabledQueuesProcessorThread(QueueProcessorThread, StatisticsEnabledThread):
@@ -206,13 +549,30 @@ class StatisticsEnabledQueuesProcessorThread(QueueProcessorThread, StatisticsEna
         super(StatisticsEnabledQueuesProcessorThread, self).__init__(*args, **kwargs)
 
 
-def start(exit_event, in_queue_length, out_queue_length, save_func):
-    debug("Start statistics events with queues %s/%s" % (in_queue_length, out_queue_length))
-    global _IN_QUEUE, _OUT_QUEUE_MINUTES
-    if not _IN_QUEUE:
-        _IN_QUEUE = StatRecordQueue(size=in_queue_length)
+def get_history(window, name=None):
+    """ Return recent windows summaries of running statistics processor, see StatisticsProcessorThread.get_history """
+    assert _PROCESSOR is not None, "You must call %s.start() first" % __name__
+    return _PROCESSOR.get_history(window, name)
+
+
+_PROCESSOR = None
+
+
+def start(exit_event, in_queue_length, out_queue_length, save_func, **kwargs):
+    """ Start statistics subsystem. in_queue_length is kept for compatibility, metrics are accumulated per thread.
+    Optional windows, output_windows and history_length kwargs configure aggregation, save_batch_size and
+    save_batch_timeout kwargs turn on saving batches of records """
+    debug("Start statistics events with out queue %s" % out_queue_length)
+    global _OUT_QUEUE_MINUTES, _PROCESSOR
     if not _OUT_QUEUE_MINUTES:
         _OUT_QUEUE_MINUTES = StatAgregatorQueue(size=out_queue_length)
-    th_stat = StatisticsProcessorThread(exit_event=exit_event)
-    th_processor_class = StatisticsSaverThread(save_func, exit_event=exit_event)
+    save_batch_size = kwargs.pop('save_batch_size', None)
+    save_batch_timeout = kwargs.pop('save_batch_timeout', None)
+    th_stat = _PROCESSOR = StatisticsProcessorThread(exit_event=exit_event, **kwargs)
+    th_processor_class = StatisticsSaverThread(
+        save_func,
+        exit_event=exit_event,
+        batch_size=save_batch_size,
+        batch_timeout=save_batch_timeout,
+    )
     return th_processor_class, th_stat
\ No newline at end of file
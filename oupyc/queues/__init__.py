@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
+import heapq
 import logging
+from collections import deque
+from itertools import count
 from threading import RLock, Condition
 from oupyc.internals.variable import NamedObject
+from oupyc.utils import monotonic
 
 _l = logging.getLogger(__name__)
 _l.setLevel(logging.INFO)
@@ -12,6 +16,10 @@ class QueueItemNotFoundException(Exception):
     pass
 
 
+class QueueTimeoutException(Exception):
+    pass
+
+
 class SimpleQueue(NamedObject):
     kwargs = []
 
@@ -26,20 +34,47 @@ class SimpleQueue(NamedObject):
 
     def __init__(self, **kwargs):
         super(SimpleQueue, self).__init__(**kwargs)
-        self._queue = []
         self._mutex = RLock()
+        self._init_storage()
+
+    def _init_storage(self):
+        """ Create empty items storage. deque gives O(1) appends and pops on both ends """
+        self._queue = deque()
+
+    def _push(self, val):
+        """ Store single item, mutex already held """
+        self._queue.append(val)
+
+    def _pop(self):
+        """ Take oldest item from storage, mutex already held """
+        return self._queue.popleft()
 
     def put(self, val):
         with self._mutex:
-            self._queue.append(val)
+            self._push(val)
+            self.on_change()
+
+    def put_many(self, items):
+        """ Put all items taking lock and calling on_change once """
+        with self._mutex:
+            for val in items:
+                self._push(val)
             self.on_change()
 
     def get(self):
         with self._mutex:
-            item = self._queue.pop(0)
+            item = self._pop()
             self.on_change()
             return item
 
+    def get_many(self, max_items):
+        """ Get up to max_items available items taking lock and calling on_change once """
+        with self._mutex:
+            items = [self._pop() for _ in range(min(max_items, len(self)))]
+            if items:
+                self.on_change()
+            return items
+
     def len(self):
         return len(self._queue)
 
@@ -50,9 +85,14 @@ class SimpleQueue(NamedObject):
 
     def pop_filtered(self, filter_func):
         with self._mutex:
-            filtered = filter(filter_func, self._queue)
+            filtered, rest = [], deque()
+            for x in self._queue:
+                if filter_func(x):
+                    filtered.append(x)
+                else:
+                    rest.append(x)
             if filtered:
-                self._queue = [x for x in self._queue if x not in filtered]
+                self._queue = rest
                 self.on_change()
             return filtered
 
@@ -65,6 +105,20 @@ class SimpleQueue(NamedObject):
     def on_change(self):
         pass
 
+    def taken(self):
+        """ Token of items got by last get or get_many of current thread to ack or nack them, None for in-memory
+        queues """
+        return None
+
+    def ack(self, token=None):
+        """ Confirm items of token (last take of current thread by default) are processed. Nothing to do for
+        in-memory queues """
+        pass
+
+    def nack(self, token=None, requeue=False):
+        """ Give back items of token failed to process. Nothing to do for in-memory queues """
+        pass
+
     def __repr__(self):
         return "%s[%s]" % (self.__class__.__name__, self.name)
 
@@ -84,26 +138,88 @@ class FixedSizeQueue(SimpleQueue):
 
     def put(self, val):
         with self._full:
-            while len(self._queue) >= self._size:
+            while len(self) >= self._size:
                 self._full.wait()
             super(FixedSizeQueue, self).put(val)
             self._empty.notify()
 
+    def put_many(self, items):
+        """ Put all items, blocking while queue is full. Consumers are signalled once per stored chunk """
+        items = list(items)
+        offset = 0
+        with self._full:
+            while offset < len(items):
+                while len(self) >= self._size:
+                    self._full.wait()
+                chunk = items[offset:offset + self._size - len(self)]
+                offset += len(chunk)
+                super(FixedSizeQueue, self).put_many(chunk)
+                self._empty.notify(len(chunk))
+
+    def try_put(self, val):
+        """ Put item if queue is not full. Return True if item is put """
+        with self._full:
+            if len(self) >= self._size:
+                return False
+            super(FixedSizeQueue, self).put(val)
+            self._empty.notify()
+            return True
+
+    def try_put_many(self, items):
+        """ Put as many items as fit without waiting. Return number of items put """
+        with self._full:
+            chunk = list(items)[:max(self._size - len(self), 0)]
+            if chunk:
+                super(FixedSizeQueue, self).put_many(chunk)
+                self._empty.notify(len(chunk))
+            return len(chunk)
+
     def put_wait(self, call):
         with self._full:
-            while len(self._queue) >= self._size:
+            while len(self) >= self._size:
                 self._full.wait()
-            self._queue.append(call())
+            self._push(call())
+            self.on_change()
             self._empty.notify()
 
-    def get(self):
+    def get(self, timeout=None):
+        """ Wait for item. With timeout given raise QueueTimeoutException if none came in timeout seconds """
         with self._empty:
-            while len(self._queue) == 0:
-                self._empty.wait()
+            if timeout is None:
+                while len(self) == 0:
+                    self._empty.wait()
+            else:
+                deadline = monotonic() + timeout
+                while len(self) == 0:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise QueueTimeoutException("No item in %s seconds" % timeout)
+                    self._empty.wait(remaining)
             ret = super(FixedSizeQueue, self).get()
             self._full.notify()
             return ret
 
+    def get_many(self, max_items, timeout=None):
+        """ Wait for at least one item and get up to max_items. Producers are signalled once per batch.
+        With timeout given wait up to timeout seconds for batch to fill """
+        with self._empty:
+            while len(self) == 0:
+                self._empty.wait()
+            if timeout:
+                deadline = monotonic() + timeout
+                while len(self) < min(max_items, self._size):
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._empty.wait(remaining)
+                while len(self) == 0:
+                    # other consumers took our items while waiting
+                    self._empty.wait()
+            ret = super(FixedSizeQueue, self).get_many(max_items)
+            self._full.notify(len(ret))
+            return ret
+
+    size = property(lambda self: self._size, None, None, "Queue size limit")
 
 
 class NamedAndTypedQueue(FixedSizeQueue, NamedObject):
@@ -119,3 +235,73 @@ class NamedAndTypedQueue(FixedSizeQueue, NamedObject):
         assert isinstance(_v, self.__allowed_type), "Allowed only %s, got %s" % (self.__allowed_type.__name__, type(_v))
         super(NamedAndTypedQueue, self).put(_v)
 
+    def _check_items(self, items):
+        items = list(items)
+        for _v in items:
+            assert isinstance(_v, self.__allowed_type), "Allowed only %s, got %s" % (
+                self.__allowed_type.__name__, type(_v)
+            )
+        return items
+
+    def put_many(self, items):
+        super(NamedAndTypedQueue, self).put_many(self._check_items(items))
+
+    def try_put(self, _v):
+        assert isinstance(_v, self.__allowed_type), "Allowed only %s, got %s" % (self.__allowed_type.__name__, type(_v))
+        return super(NamedAndTypedQueue, self).try_put(_v)
+
+    def try_put_many(self, items):
+        return super(NamedAndTypedQueue, self).try_put_many(self._check_items(items))
+
+
+def item_priority(item):
+    """ Default item priority: 'priority' key of dict or priority attribute, 0 if not set. Lower goes first """
+    if isinstance(item, dict):
+        return item.get('priority') or 0
+    return getattr(item, 'priority', None) or 0
+
+
+class PriorityStorageMixin(object):
+    """ Heap storage for queues: lowest priority value first, FIFO for equal ones, O(log n) put and get.
+
+    priority kwarg is callable returning item priority, item_priority by default. With aging_rate kwarg
+    effective priority is priority + aging_rate * enqueue time, so item waiting 1 / aging_rate seconds gets ahead
+    of new item having priority one step better, and low priority items are not starved.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._priority = kwargs.get('priority') or item_priority
+        self._aging_rate = kwargs.get('aging_rate') or 0.0
+        self._epoch = monotonic()
+        self._sequence = count()
+        super(PriorityStorageMixin, self).__init__(*args, **kwargs)
+
+    def _init_storage(self):
+        self._queue = []
+
+    def _push(self, val):
+        key = self._priority(val)
+        if self._aging_rate:
+            key += (monotonic() - self._epoch) * self._aging_rate
+        heapq.heappush(self._queue, (key, next(self._sequence), val))
+
+    def _pop(self):
+        return heapq.heappop(self._queue)[2]
+
+    def pop_filtered(self, filter_func):
+        with self._mutex:
+            filtered, rest = [], []
+            for entry in self._queue:
+                if filter_func(entry[2]):
+                    filtered.append(entry)
+                else:
+                    rest.append(entry)
+            if filtered:
+                heapq.heapify(rest)
+                self._queue = rest
+                self.on_change()
+            return [entry[2] for entry in sorted(filtered)]
+
+
+class PriorityQueue(PriorityStorageMixin, FixedSizeQueue):
+    """ Bounded priority queue with FixedSizeQueue API """
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from collections import deque
+
+try:
+    import cPickle as pickle
+except ImportError:
+    # python 3
+    import pickle
+
+from oupyc.queues import FixedSizeQueue, QueueItemNotFoundException
+from oupyc.utils import monotonic
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+# record header: kind, sequence number, payload length, payload crc32
+_RECORD = struct.Struct('>BQII')
+_PUT = 1
+_ACK = 2
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+DEAD_LETTER_NAME = 'dead.log'
+
+
+def _dumps(item):
+    return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+
+def _crc(payload):
+    return zlib.crc32(payload) & 0xffffffff
+
+
+def _segment_name(number):
+    return 'wal-%08d.log' % number
+
+
+def _read_records(path):
+    """ Yield (kind, seq, payload) of segment file, stop at torn or corrupted tail """
+    with open(path, 'rb') as wal:
+        while True:
+            header = wal.read(_RECORD.size)
+            if not header:
+                return
+            if len(header) < _RECORD.size:
+                warning("Truncated record header in %s, ignoring the rest", path)
+                return
+            kind, seq, length, crc = _RECORD.unpack(header)
+            payload = wal.read(length)
+            if len(payload) < length or _crc(payload) != crc or kind not in (_PUT, _ACK):
+                warning("Corrupted record %s in %s, ignoring the rest", seq, path)
+                return
+            yield kind, seq, payload
+
+
+class _WalSegment(object):
+    """ Log segment: puts numbered from first_seq, live is number of them not acked yet, acked is numbers of
+    older segments having items acked by records of this one """
+    __slots__ = ('number', 'path', 'first_seq', 'live', 'acked')
+
+    def __init__(self, number, path, first_seq):
+        self.number = number
+        self.path = path
+        self.first_seq = first_seq
+        self.live = 0
+        self.acked = set()
+
+
+class DurableStorageMixin(object):
+    """ Storage logging every put to segmented append only write-ahead log in path directory.
+
+    Every get or get_many is a take: taken() gives its token right after the call and consumer confirms items
+    of the take are processed by ack(token), from any thread. Failed items are given back by nack(token): they
+    are moved to dead letter file and delivered again after restart, or right away with requeue.
+    ack() and nack() without token handle the last take of calling thread. On start log is replayed and items
+    put but not acked are queued again, in put order, so delivery is at least once.
+
+    Put returns after record is fsynced; concurrent puts share one fsync (group commit). With sync_interval kwarg
+    puts do not wait and background flusher fsyncs the log every sync_interval seconds instead, trading last
+    moments before crash for throughput. Acks are fsynced with following puts, by flusher and on close.
+    Segments are rotated at segment_size bytes and removed once all their items are acked and older segments their
+    ack records refer to are removed. Items are pickled by default, dumps and loads kwargs set other serialization.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._path = kwargs.get('path')
+        assert self._path, "%s requires 'path' kwarg with log directory" % self.__class__.__name__
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+        self._segment_size = kwargs.get('segment_size') or DEFAULT_SEGMENT_SIZE
+        self._sync_interval = kwargs.get('sync_interval')
+        self._dumps = kwargs.get('dumps') or _dumps
+        self._loads = kwargs.get('loads') or pickle.loads
+        self._local = threading.local()
+        self._sync_mutex = threading.Lock()
+        self._dead_mutex = threading.Lock()
+        self._segments = []
+        self._segment_firsts = []
+        self._file = None
+        self._file_size = 0
+        self._next_seq = 1
+        self._write_position = 0
+        self._synced_position = 0
+        self._last_sync = monotonic()
+        self._closed = threading.Event()
+        self._flusher = None
+        super(DurableStorageMixin, self).__init__(*args, **kwargs)
+        if self._sync_interval is not None:
+            self._flusher = threading.Thread(
+                target=self._flush, name="%s[%s].flusher" % (self.__class__.__name__, id(self))
+            )
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _init_storage(self):
+        # (seq, item) in put order
+        self._queue = deque()
+        self._replay()
+
+    def _replay(self):
+        numbers = sorted(
+            int(name[4:-4]) for name in os.listdir(self._path) if name.startswith('wal-') and name.endswith('.log')
+        )
+        payloads = dict()
+        for number in numbers:
+            segment = _WalSegment(number, os.path.join(self._path, _segment_name(number)), self._next_seq)
+            self._segments.append(segment)
+            self._segment_firsts.append(segment.first_seq)
+            for kind, seq, payload in _read_records(segment.path):
+                if _PUT == kind:
+                    payloads[seq] = payload
+                    segment.live += 1
+                    self._next_seq = max(self._next_seq, seq + 1)
+                    continue
+                # ack record payload is packed acked sequence numbers
+                for acked in struct.unpack('>%sQ' % (len(payload) // 8), payload):
+                    if payloads.pop(acked, None) is not None:
+                        self._release(acked, segment)
+        for seq in sorted(payloads):
+            self._queue.append((seq, self._loads(payloads[seq])))
+        if payloads:
+            info("%s replayed %s not acked items from %s", self.__class__.__name__, len(payloads), self._path)
+        self._open_segment(numbers[-1] + 1 if numbers else 1)
+        self._replay_dead_letters()
+        self._drop_acked_segments()
+
+    def _replay_dead_letters(self):
+        """ Log nacked items of dead letter file again as new puts, so they are queued and acked as any other """
+        path = os.path.join(self._path, DEAD_LETTER_NAME)
+        if not os.path.exists(path):
+            return
+        count = 0
+        for _, _, payload in _read_records(path):
+            self._rotate_full()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._append(_PUT, seq, payload)
+            self._segments[-1].live += 1
+            self._queue.append((seq, self._loads(payload)))
+            count += 1
+        # items are in the log now, duplicates after crash before unlink are fine for at least once delivery
+        os.fsync(self._file.fileno())
+        self._synced_position = self._write_position
+        os.unlink(path)
+        if count:
+            info("%s replayed %s nacked items from %s", self.__class__.__name__, count, path)
+
+    def _segment_of(self, seq):
+        return self._segments[bisect_right(self._segment_firsts, seq) - 1]
+
+    def _open_segment(self, number):
+        segment = _WalSegment(number, os.path.join(self._path, _segment_name(number)), self._next_seq)
+        # unbuffered: written records survive process crash, fsync makes them survive host crash
+        self._file = open(segment.path, 'ab', 0)
+        self._file_size = 0
+        self._segments.append(segment)
+        self._segment_firsts.append(segment.first_seq)
+
+    def _rotate(self):
+        """ Make current segment durable and start the next one, mutex held """
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._synced_position = self._write_position
+        self._open_segment(self._segments[-1].number + 1)
+
+    def _release(self, seq, segment):
+        """ Account ack of seq logged to segment """
+        owner = self._segment_of(seq)
+        owner.live -= 1
+        if owner is not segment:
+            segment.acked.add(owner.number)
+
+    def _drop_acked_segments(self):
+        """ Remove segments having all items acked, except current one. Segment holding acks of items of older
+        segment still on disk is kept, otherwise those items would be replayed """
+        present = set(segment.number for segment in self._segments)
+        kept = []
+        for segment in self._segments[:-1]:
+            if segment.live or segment.acked & present:
+                kept.append(segment)
+                continue
+            present.discard(segment.number)
+            os.unlink(segment.path)
+        if len(kept) < len(self._segments) - 1:
+            self._segments[:-1] = kept
+            self._segment_firsts[:] = [segment.first_seq for segment in self._segments]
+
+    def _append(self, kind, seq, payload):
+        """ Write record to current segment, mutex held. Rotation is done before, so record of put starting new
+        segment has its first_seq """
+        self._file.write(_RECORD.pack(kind, seq, len(payload), _crc(payload)) + payload)
+        size = _RECORD.size + len(payload)
+        self._file_size += size
+        self._write_position += size
+
+    def _rotate_full(self):
+        if self._file_size >= self._segment_size:
+            self._rotate()
+
+    def _push(self, val):
+        self._rotate_full()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._append(_PUT, seq, self._dumps(val))
+        self._segments[-1].live += 1
+        self._queue.append((seq, val))
+
+    def _pop(self):
+        entry = self._queue.popleft()
+        self._local.taken.append(entry)
+        return entry[1]
+
+    def get(self, *args, **kwargs):
+        self._local.taken = []
+        return super(DurableStorageMixin, self).get(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        self._local.taken = []
+        return super(DurableStorageMixin, self).get_many(*args, **kwargs)
+
+    def taken(self):
+        """ Token of items got by last get or get_many of current thread """
+        return getattr(self._local, 'taken', None)
+
+    def _claim(self, token):
+        """ Return (seq, item) entries of token and empty it, so token is acked or nacked once """
+        if token is None:
+            token = self.taken()
+        if not token:
+            return []
+        entries = list(token)
+        del token[:]
+        return entries
+
+    def _ack_seqs(self, seqs):
+        """ Log ack record and release segments, mutex held """
+        self._rotate_full()
+        self._append(_ACK, seqs[0], struct.pack('>%sQ' % len(seqs), *seqs))
+        for seq in seqs:
+            self._release(seq, self._segments[-1])
+        self._drop_acked_segments()
+
+    def ack(self, token=None):
+        """ Confirm items of token are processed, they are not replayed any more """
+        entries = self._claim(token)
+        if entries:
+            with self._mutex:
+                self._ack_seqs([seq for seq, _ in entries])
+
+    def _park(self, entries):
+        """ Write entries to dead letter file and ack them in log, so they do not keep log segments """
+        records = []
+        for seq, val in entries:
+            payload = self._dumps(val)
+            records.append(_RECORD.pack(_PUT, seq, len(payload), _crc(payload)) + payload)
+        with self._dead_mutex:
+            with open(os.path.join(self._path, DEAD_LETTER_NAME), 'ab') as dead:
+                dead.write(b''.join(records))
+                dead.flush()
+                # ack record must not become durable before dead letter does
+                os.fsync(dead.fileno())
+        with self._mutex:
+            self._ack_seqs([seq for seq, _ in entries])
+
+    def nack(self, token=None, requeue=False):
+        """ Give back items of token failed to process: they are replayed after restart, or got again right
+        away if requeue is True """
+        entries = self._claim(token)
+        if not entries:
+            return
+        if not requeue:
+            self._park(entries)
+            return
+        with self._empty:
+            self._queue.extendleft(reversed(entries))
+            self.on_change()
+            self._empty.notify(len(entries))
+
+    def _sync(self, position):
+        """ Wait until log is fsynced up to position, one fsync covers all writes done before it """
+        with self._sync_mutex:
+            if self._synced_position >= position:
+                return
+            with self._mutex:
+                if self._file.closed:
+                    return
+                target = self._write_position
+                # survives segment rotation closing the file meanwhile
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._synced_position = max(self._synced_position, target)
+            self._last_sync = monotonic()
+
+    def _flush(self):
+        """ Flusher thread loop: fsync log written since last sync every sync_interval seconds """
+        while not self._closed.wait(self._sync_interval):
+            if self._write_position > self._synced_position:
+                self.sync()
+
+    def _commit(self):
+        if self._sync_interval is None:
+            self._sync(self._write_position)
+        elif monotonic() - self._last_sync >= self._sync_interval:
+            self._sync(self._write_position)
+
+    def put(self, val):
+        super(DurableStorageMixin, self).put(val)
+        self._commit()
+
+    def put_many(self, items):
+        super(DurableStorageMixin, self).put_many(items)
+        self._commit()
+
+    def try_put(self, val):
+        put = super(DurableStorageMixin, self).try_put(val)
+        if put:
+            self._commit()
+        return put
+
+    def try_put_many(self, items):
+        count = super(DurableStorageMixin, self).try_put_many(items)
+        if count:
+            self._commit()
+        return count
+
+    def put_wait(self, call):
+        super(DurableStorageMixin, self).put_wait(call)
+        self._commit()
+
+    def pop_filtered(self, filter_func):
+        """ Remove matching items, they are acked as consumed """
+        with self._mutex:
+            filtered, rest = [], deque()
+            for entry in self._queue:
+                if filter_func(entry[1]):
+                    filtered.append(entry)
+                else:
+                    rest.append(entry)
+            if filtered:
+                self._queue = rest
+                self._ack_seqs([seq for seq, _ in filtered])
+                self.on_change()
+        if filtered:
+            self._commit()
+        return [val for _, val in filtered]
+
+    def remove(self, item):
+        # log is synced by pop_filtered, so mutex must not be held around it
+        if not self.pop_filtered(lambda x: x == item):
+            raise QueueItemNotFoundException("Item %s not found in queue" % item)
+
+    def sync(self):
+        """ Make everything logged so far durable """
+        self._sync(self._write_position)
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.sync()
+        with self._sync_mutex:
+            with self._mutex:
+                self._file.close()
+
+
+class DurableQueue(DurableStorageMixin, FixedSizeQueue):
+    """ Queue surviving process restart: not acked items are replayed from write-ahead log in path """
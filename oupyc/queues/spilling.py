@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from collections import deque
+
+try:
+    import cPickle as pickle
+except ImportError:
+    # python 3
+    import pickle
+
+from oupyc.queues import FixedSizeQueue
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+# record header: payload length
+_RECORD = struct.Struct('>I')
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_FREE_SEGMENTS = 2
+
+
+def _dumps(item):
+    return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+
+class _Segment(object):
+    """ Preallocated memory mapped file of length prefixed records, written and read sequentially """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.file = open(path, 'w+b')
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.write_offset = 0
+        self.read_offset = 0
+
+    def append(self, payload):
+        """ Write record if it fits, return True if written """
+        end = self.write_offset + _RECORD.size + len(payload)
+        if end > self.size:
+            return False
+        _RECORD.pack_into(self.map, self.write_offset, len(payload))
+        self.map[self.write_offset + _RECORD.size:end] = payload
+        self.write_offset = end
+        return True
+
+    def has_records(self):
+        return self.read_offset < self.write_offset
+
+    def read(self):
+        length, = _RECORD.unpack_from(self.map, self.read_offset)
+        start = self.read_offset + _RECORD.size
+        self.read_offset = start + length
+        return self.map[start:self.read_offset]
+
+    def reset(self):
+        self.write_offset = self.read_offset = 0
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+        os.unlink(self.path)
+
+
+class SpillingStorageMixin(object):
+    """ Storage keeping up to size items in memory and spilling the rest to memory mapped segment files.
+
+    Items go to disk only while memory head is full or disk has older items, so FIFO order is kept. Segments
+    are append only, preallocated by segment_size (or by record size for larger items) and read back in order
+    they were written; consumed segments are kept for reuse up to free_segments and removed otherwise. Items
+    are pickled by default, dumps and loads kwargs set other serialization. max_items kwarg limits total length,
+    put blocks only when it is reached. Spill files are created in spill_dir (new temporary directory by
+    default) and removed by close().
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._memory_size = kwargs.get('size')
+        if not isinstance(self._memory_size, int) or self._memory_size <= 0:
+            raise ValueError("%s requires positive int 'size' kwarg with number of items kept in memory, got %r" % (
+                self.__class__.__name__, self._memory_size
+            ))
+        self._segment_size = kwargs.get('segment_size') or DEFAULT_SEGMENT_SIZE
+        self._free_limit = kwargs.get('free_segments', DEFAULT_FREE_SEGMENTS)
+        self._dumps = kwargs.get('dumps') or _dumps
+        self._loads = kwargs.get('loads') or pickle.loads
+        self._own_dir = kwargs.get('spill_dir') is None
+        self._spill_dir = kwargs.get('spill_dir') or tempfile.mkdtemp(prefix='oupyc-spill-')
+        self._segments = deque()
+        self._free_segments = []
+        self._segment_number = 0
+        self._spilled = 0
+        self._spilled_bytes = 0
+        kwargs = dict(kwargs, size=kwargs.get('max_items') or sys.maxsize)
+        super(SpillingStorageMixin, self).__init__(*args, **kwargs)
+
+    def _init_storage(self):
+        self._queue = deque()
+
+    def _new_segment(self, record_size):
+        if record_size <= self._segment_size and self._free_segments:
+            segment = self._free_segments.pop()
+            segment.reset()
+            return segment
+        self._segment_number += 1
+        path = os.path.join(self._spill_dir, 'segment-%s-%08d' % (id(self), self._segment_number))
+        return _Segment(path, max(self._segment_size, record_size))
+
+    def _release_segment(self, segment):
+        if segment.size == self._segment_size and len(self._free_segments) < self._free_limit:
+            self._free_segments.append(segment)
+        else:
+            segment.close()
+
+    def _spill(self, val):
+        payload = self._dumps(val)
+        if not self._segments or not self._segments[-1].append(payload):
+            segment = self._new_segment(_RECORD.size + len(payload))
+            segment.append(payload)
+            self._segments.append(segment)
+        self._spilled += 1
+        self._spilled_bytes += _RECORD.size + len(payload)
+
+    def _unspill(self):
+        """ Read oldest spilled item, release segment once consumed """
+        segment = self._segments[0]
+        payload = segment.read()
+        self._spilled -= 1
+        self._spilled_bytes -= _RECORD.size + len(payload)
+        if not segment.has_records() and (len(self._segments) > 1 or not self._spilled):
+            self._release_segment(self._segments.popleft())
+        return self._loads(payload)
+
+    def _push(self, val):
+        if self._spilled or len(self._queue) >= self._memory_size:
+            self._spill(val)
+        else:
+            self._queue.append(val)
+
+    def _pop(self):
+        if not self._queue:
+            # refill memory head from disk
+            while self._spilled and len(self._queue) < self._memory_size:
+                self._queue.append(self._unspill())
+        return self._queue.popleft()
+
+    def len(self):
+        return len(self._queue) + self._spilled
+
+    def __len__(self):
+        return len(self._queue) + self._spilled
+
+    length = property(len, None, None, "Queue length")
+    spilled = property(lambda self: self._spilled, None, None, "Number of items on disk")
+    spilled_bytes = property(lambda self: self._spilled_bytes, None, None, "Size of items on disk")
+
+    def pop_filtered(self, filter_func):
+        """ Scans and rewrites all spilled items, slow for large spills """
+        with self._mutex:
+            filtered, rest = [], deque()
+            for x in self._queue:
+                if filter_func(x):
+                    filtered.append(x)
+                else:
+                    rest.append(x)
+            spilled_rest = []
+            while self._spilled:
+                x = self._unspill()
+                if filter_func(x):
+                    filtered.append(x)
+                else:
+                    spilled_rest.append(x)
+            self._queue = rest
+            for x in spilled_rest:
+                self._spill(x)
+            if filtered:
+                self.on_change()
+            return filtered
+
+    def close(self):
+        """ Remove spill files, queue must not be used after """
+        with self._mutex:
+            for segment in list(self._segments) + self._free_segments:
+                segment.close()
+            self._segments.clear()
+            self._free_segments = []
+            self._spilled = self._spilled_bytes = 0
+            if self._own_dir:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+
+class SpillingQueue(SpillingStorageMixin, FixedSizeQueue):
+    """ Queue keeping size items in memory and overflow on disk, put does not block until max_items """
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import logging
+import marshal
+import sys
+import threading
+from collections import OrderedDict
+
+from oupyc.utils import monotonic
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+
+def _default_sizeof(value):
+    """ Approximate result size: marshalled payload of serializable objects, shallow size otherwise """
+    if hasattr(value, '_pack'):
+        try:
+            return len(marshal.dumps(value._pack()))
+        except ValueError:
+            pass
+    return sys.getsizeof(value)
+
+
+class _Flight(object):
+    """ Computation in progress, waited by concurrent callers with the same key """
+    __slots__ = ('event', 'result', 'exception')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class ResultCache(object):
+    """ Thread safe LRU cache with TTL, items and bytes bounds and single-flight computation.
+
+    get_or_compute() returns cached value or calls compute; concurrent callers of the same missing key wait
+    for one computation instead of running their own. Value is stored only if cacheable(value) is true, so
+    errors are not cached by default predicate of TaskPrototype. Least recently used entries are evicted when
+    max_items or max_bytes is exceeded, entries older than ttl seconds are not returned.
+    """
+
+    def __init__(self, max_items=10000, max_bytes=None, ttl=None, sizeof=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or _default_sizeof
+        self._mutex = threading.Lock()
+        # key -> (value, size, expires)
+        self._entries = OrderedDict()
+        self._inflight = dict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    size_bytes = property(lambda self: self._bytes, None, None, "Total size of cached values")
+
+    def _lookup(self, key, now):
+        """ Return (True, value) for fresh entry moving it to the most recent end, (False, None) otherwise """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False, None
+        if entry[2] is not None and entry[2] <= now:
+            self._bytes -= entry[1]
+            return False, None
+        self._entries[key] = entry
+        return True, entry[0]
+
+    def get(self, key, default=None):
+        with self._mutex:
+            found, value = self._lookup(key, monotonic())
+        return value if found else default
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = monotonic() + self.ttl if self.ttl is not None else None
+        with self._mutex:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_items is not None and len(self._entries) > self.max_items) or
+            (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def invalidate(self, key):
+        with self._mutex:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        with self._mutex:
+            found, value = self._lookup(key, monotonic())
+            if found:
+                self.hits += 1
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.result
+        try:
+            value = compute()
+        except Exception as exc:
+            flight.exception = exc
+            raise
+        else:
+            flight.result = value
+            if cacheable is None or cacheable(value):
+                self.put(key, value)
+            return value
+        finally:
+            with self._mutex:
+                self._inflight.pop(key, None)
+            flight.event.set()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import marshal
+import struct
+import zlib
+from operator import itemgetter
+
+from oupyc.remote.task import CLASS_REGISTRY
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+# binary header: format version, flags, class id
+_HEADER = struct.Struct('>BBI')
+_FORMAT_VERSION = 1
+_FLAG_COMPRESSED = 1
+_FLAG_FIELDS = 2
+
+
+class CodecError(Exception):
+    pass
+
+
+class Codec(object):
+    """ Turns SerializeWithVersionCheck objects into bytes and back """
+
+    def dumps(self, obj):
+        raise NotImplementedError("%s to define its own dumps" % self.__class__.__name__)
+
+    def loads(self, data):
+        raise NotImplementedError("%s to define its own loads" % self.__class__.__name__)
+
+
+class JsonCodec(Codec):
+    """ Interoperable codec: JSON of serialize() dict with full class identity """
+
+    def __init__(self):
+        self._classes = {}
+
+    def _find_class(self, data):
+        key = (data.get('class_module'), data.get('class_name'), data.get('class_version'))
+        cls = self._classes.get(key)
+        if cls is None:
+            for registered in list(CLASS_REGISTRY.values()):
+                if (registered.__module__, registered.__name__, registered._get_version()) == key:
+                    cls = self._classes[key] = registered
+                    break
+            else:
+                raise CodecError("Class %s.%s version %s is not registered" % key)
+        return cls
+
+    def dumps(self, obj):
+        return json.dumps(obj.serialize(), separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        data = json.loads(data)
+        return self._find_class(data).deserialize(data)
+
+
+class BinaryCodec(Codec):
+    """ Compact codec: class_id header and marshalled _pack() payload, optionally zlib compressed.
+
+    Class identity is sent as integer class_id and resolved through CLASS_REGISTRY. Payload of class having
+    'fields' attribute (or request class having it for tasks) is packed as values tuple in that order instead
+    of dict. Per class encoder and decoder are built once and cached. Marshal format is specific to Python
+    version, so both sides must run the same one.
+
+    Not safe for untrusted data: marshal.loads may crash the process or exhaust memory on malformed or
+    malicious input. Use it only between trusted peers, JsonCodec otherwise.
+    """
+
+    def __init__(self, compress_threshold=None, compress_level=1):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._encoders = {}
+        self._decoders = {}
+
+    @staticmethod
+    def _fields(cls):
+        fields = getattr(cls, 'fields', None)
+        if fields is None and getattr(cls, 'request_class', None) is not None:
+            fields = getattr(cls.request_class, 'fields', None)
+        return fields and tuple(fields) or None
+
+    def _encoder(self, cls):
+        encoder = self._encoders.get(cls)
+        if encoder is None:
+            class_id = cls.class_id()
+            fields = self._fields(cls)
+            if fields:
+                getter = itemgetter(*fields)
+                single = 1 == len(fields)
+
+                def encoder(obj):
+                    payload = obj._pack()
+                    if isinstance(payload, dict) and len(payload) == len(fields):
+                        try:
+                            values = getter(payload)
+                            return class_id, _FLAG_FIELDS, marshal.dumps(single and (values,) or values)
+                        except KeyError:
+                            pass
+                    return class_id, 0, marshal.dumps(payload)
+            else:
+                def encoder(obj):
+                    return class_id, 0, marshal.dumps(obj._pack())
+            self._encoders[cls] = encoder
+        return encoder
+
+    def _decoder(self, class_id):
+        decoder = self._decoders.get(class_id)
+        if decoder is None:
+            cls = CLASS_REGISTRY.get(class_id)
+            if cls is None:
+                raise CodecError("Class id %s is not registered" % class_id)
+            fields = self._fields(cls)
+            unpack = cls._unpack
+
+            def decoder(flags, payload):
+                payload = marshal.loads(payload)
+                if flags & _FLAG_FIELDS:
+                    payload = dict(zip(fields, payload))
+                return unpack(payload)
+            self._decoders[class_id] = decoder
+        return decoder
+
+    def dumps(self, obj):
+        class_id, flags, payload = self._encoder(obj.__class__)(obj)
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            payload = zlib.compress(payload, self.compress_level)
+            flags |= _FLAG_COMPRESSED
+        return _HEADER.pack(_FORMAT_VERSION, flags, class_id) + payload
+
+    def loads(self, data):
+        version, flags, class_id = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise CodecError("Unsupported binary format version %s" % version)
+        payload = data[_HEADER.size:]
+        if flags & _FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return self._decoder(class_id)(flags, payload)
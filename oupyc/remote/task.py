@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
 import logging
+import zlib
+from copy import copy
 from abc import ABCMeta, abstractmethod
 from oupyc.checks import require_kwarg_type
 
+try:
+    basestring
+except NameError:
+    # python 3
+    basestring = str
+
 __author__ = 'AMarin'
 
 TASK_REGISTRY = dict()
+# serializable classes by small integer id, see class_id()
+CLASS_REGISTRY = dict()
 RESULT_SUCCESS=0
 RESULT_ERROR=1
 RESULT_ERROR_REPEAT=2
@@ -35,37 +47,56 @@ class SerializeWithVersionCheck(object):
     def _get_version(cls):
         raise NotImplementedError("%s to have its own _get_version() class method" % cls.__name__)
 
+    @classmethod
+    def class_id(cls):
+        """ Small integer id of class name, module and version, the same in every process """
+        identity = cls.__dict__.get('_class_identity')
+        if identity is None:
+            identity = (cls.__name__, cls.__module__, cls._get_version())
+            cls._class_identity = identity
+            cls._class_id = zlib.crc32(('%s.%s:%s' % (identity[1], identity[0], identity[2])).encode('utf-8'))
+            cls._class_id &= 0xffffffff
+        return cls._class_id
+
+    @classmethod
+    def _identity(cls):
+        cls.class_id()
+        return cls._class_identity
+
     def serialize(self):
+        class_name, class_module, class_version = self._identity()
         return dict(
-            class_name=self.__class__.__name__,
-            class_module=self.__class__.__module__,
-            class_version=self.__class__._get_version(),
+            class_name=class_name,
+            class_module=class_module,
+            class_version=class_version,
             data=self._serialize()
         )
 
     @classmethod
     def deserialize(cls, data):
-        # check keys in kwarg
-        check_kwargs = ['class_name', 'class_module', 'class_version']
-        # translate possibly wrong data into dict
-        json_data = dict(**data)
-        debug("Deserializing data: %s", json_data)
+        debug("Deserializing data: %s", data)
+        class_name, class_module, class_version = cls._identity()
         # check class_name
-        _name = require_kwarg_type('class_name', basestring, json_data)
-        assert cls.__name__ == _name, 'Expected %s items class, got %s' % (cls.__name__, _name)
+        _name = require_kwarg_type('class_name', basestring, data)
+        assert class_name == _name, 'Expected %s items class, got %s' % (cls.__name__, _name)
         # check class module
-        _module = require_kwarg_type('class_module', basestring, json_data)
-        assert cls.__module__ == _module, 'Expected %s.%s item, got %s' % (cls.__module__, cls.__name__, _module)
+        _module = require_kwarg_type('class_module', basestring, data)
+        assert class_module == _module, 'Expected %s.%s item, got %s' % (cls.__module__, cls.__name__, _module)
         # check class version
-        _version = require_kwarg_type('class_version', basestring, json_data)
-        assert cls._get_version() == _version, 'Expected %s.%s version %s, got %s' % (
-            cls.__module__, cls.__name__, cls._get_version(), _version
+        _version = require_kwarg_type('class_version', basestring, data)
+        assert class_version == _version, 'Expected %s.%s version %s, got %s' % (
+            cls.__module__, cls.__name__, class_version, _version
         )
-        # that keys are not needed anymore
-        for kwarg in check_kwargs:
-            del json_data[kwarg]
         # return self with data populated
-        return cls._deserialize(json_data['data'])
+        return cls._deserialize(data['data'])
+
+    def _pack(self):
+        """ Compact payload for binary codecs, class identity is passed separately """
+        return self._serialize()
+
+    @classmethod
+    def _unpack(cls, payload):
+        return cls._deserialize(payload)
 
     def as_dict(self):
         return self.serialize()
@@ -95,7 +126,7 @@ class TaskResultPrototype(SerializeWithVersionCheck):
 
     def __init__(self, code=RESULT_ERROR, message=RESULT_ERROR_NO_MESSAGE, data=None, request_id=None):
         self.code = code
-        self.message = message,
+        self.message = message
         self.data = data
         self.request_id=request_id
 
@@ -125,6 +156,16 @@ class ResultTaskNotImplementedError(ResultError):
     def __init__(self, message=RESULT_ERROR_NOT_IMPLEMENTED, data=None, request_id=None):
         super(ResultTaskNotImplementedError, self).__init__(message=message, data=None, request_id=request_id)
 
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+    @classmethod
+    def _deserialize(cls, json_data):
+        json_data = dict(json_data)
+        json_data.pop('code', None)
+        return cls(**json_data)
+
 
 class ResultImplementationError(ResultError):
     def __init__(self, message=RESULT_ERROR_INCORRECT_IMPLEMENTATION, data=None, request_id=None):
@@ -144,6 +185,13 @@ class TaskPrototype(SerializeWithVersionCheck):
     response_class = None
     request_class = None
     task_name = None
+    # results of idempotent task are memoized in result_cache (oupyc.remote.cache.ResultCache) if set
+    idempotent = False
+    result_cache = None
+    # set by caller to match result of process_batch, results get it too
+    request_id = None
+    # lower goes first through priority queues
+    priority = 0
 
     def __init__(self, **kwargs):
         assert self.task_name is not None, "%s to have name attribute" % self.__class__.__name__
@@ -152,6 +200,13 @@ class TaskPrototype(SerializeWithVersionCheck):
         self.request_data = kwargs
         self.request = None
 
+    def serialize(self):
+        # task_name lets multiplexing executors dispatch without knowing task class in advance
+        serialized = super(TaskPrototype, self).serialize()
+        serialized['task_name'] = self.task_name
+        serialized['priority'] = self.priority
+        return serialized
+
     def make_request(self):
         self.request = self.request_class(**self.request_data)
         return self.serialize()
@@ -180,7 +235,84 @@ class TaskPrototype(SerializeWithVersionCheck):
         raise TaskNotImplementedError("%s to define its own process_request")
 
     def process_request(self, **kwargs):
-        return self._process_request(**kwargs)
+        if not (self.idempotent and self.result_cache is not None):
+            return self._process_request(**kwargs)
+        result = self.result_cache.get_or_compute(
+            self.cache_key(**kwargs),
+            lambda: self._process_request(**kwargs),
+            lambda result: getattr(result, 'code', None) == RESULT_SUCCESS,
+        )
+        # callers may set their own request_id on shared result
+        return copy(result)
+
+    @classmethod
+    def _process_batch(cls, tasks):
+        """ Optional bulk hook: process tasks of this class at once, return results having request_id of tasks """
+        raise NotImplementedError("%s has no batch hook" % cls.__name__)
+
+    @classmethod
+    def has_batch_hook(cls):
+        return getattr(cls._process_batch, '__func__', None) is not TaskPrototype._process_batch.__func__
+
+    @classmethod
+    def process_batch(cls, tasks):
+        """ Process tasks of this class returning results in tasks order.
+
+        Uses _process_batch hook if defined, else processes tasks one by one. Results of hook are matched to tasks
+        by request_id, tasks without unique request_id are given positional ones for the call. Task having no
+        result gets error result. Idempotent classes having result_cache pass only cache misses to the hook and
+        cache successful hook results.
+        """
+        if not cls.has_batch_hook():
+            return [task.process_request() for task in tasks]
+        if not (cls.idempotent and cls.result_cache is not None):
+            return cls._call_batch_hook(tasks)
+        missing = object()
+        keys = [task.cache_key() for task in tasks]
+        ordered = [cls.result_cache.get(key, missing) for key in keys]
+        positions = []
+        for idx, (task, result) in enumerate(zip(tasks, ordered)):
+            if result is missing:
+                positions.append(idx)
+            else:
+                # callers may set their own request_id on shared result
+                ordered[idx] = copy(result)
+                ordered[idx].set_request_id(task.request_id)
+        computed = cls._call_batch_hook([tasks[idx] for idx in positions]) if positions else []
+        for idx, result in zip(positions, computed):
+            if getattr(result, 'code', None) == RESULT_SUCCESS:
+                cls.result_cache.put(keys[idx], copy(result))
+            ordered[idx] = result
+        return ordered
+
+    @classmethod
+    def _call_batch_hook(cls, tasks):
+        """ Call _process_batch hook matching its results to tasks by request_id """
+        original_ids = [task.request_id for task in tasks]
+        renumber = None in original_ids or len(set(original_ids)) != len(original_ids)
+        if renumber:
+            for idx, task in enumerate(tasks):
+                task.request_id = idx
+        try:
+            results = dict((result.request_id, result) for result in cls._process_batch(tasks))
+        finally:
+            if renumber:
+                for task, request_id in zip(tasks, original_ids):
+                    task.request_id = request_id
+        ordered = []
+        for idx, (task, request_id) in enumerate(zip(tasks, original_ids)):
+            result = results.get(idx if renumber else request_id)
+            if result is None:
+                result = task.return_error("No result of %s batch" % cls.__name__)
+            result.set_request_id(request_id)
+            ordered.append(result)
+        return ordered
+
+    def cache_key(self, **kwargs):
+        """ Task name, version and sha1 of canonical JSON of request data and process_request kwargs """
+        data = self.request.data if self.request is not None else self.request_data
+        canonical = json.dumps([data, kwargs], sort_keys=True, separators=(',', ':'), default=repr)
+        return self.task_name, self._get_version(), hashlib.sha1(canonical.encode('utf-8')).hexdigest()
 
     def return_success(self, **kwargs):
         kwargs.update(dict(code=RESULT_SUCCESS))
@@ -193,5 +325,42 @@ class TaskPrototype(SerializeWithVersionCheck):
     def get_result(self, json_data):
         return self.response_class(json_data)
 
+    def _pack(self):
+        # request identity is known from task class
+        if self.request_data:
+            return self.request_data
+        return self.request and self.request.data or {}
+
+    @classmethod
+    def _unpack(cls, payload):
+        obj = cls()
+        obj.request = cls.request_class(**payload)
+        obj.request_data = obj.request.data
+        return obj
+
+
+class ClassIdCollisionError(Exception):
+    pass
+
+
+def register_class(cls):
+    """ Make class known to codecs by its class_id. Raise ClassIdCollisionError if other class has the same id,
+    class of the same name, module and version (e.g. reloaded module) replaces registered one """
+    class_id = cls.class_id()
+    registered = CLASS_REGISTRY.get(class_id)
+    if registered is not None and registered._identity() != cls._identity():
+        raise ClassIdCollisionError("Class id %s of %s.%s is taken by %s.%s" % (
+            class_id, cls.__module__, cls.__name__, registered.__module__, registered.__name__
+        ))
+    CLASS_REGISTRY[class_id] = cls
+    return cls
+
+
+register_class(ResultTaskNotImplementedError)
+
+
 def register_task_class(cls):
-    TASK_REGISTRY[cls.task_name]=cls
\ No newline at end of file
+    TASK_REGISTRY[cls.task_name]=cls
+    for registered in (cls, cls.request_class, cls.response_class):
+        register_class(registered)
+    return cls
\ No newline at end of file
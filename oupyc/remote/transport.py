@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+import errno
+import importlib
+import itertools
+import logging
+import os
+import socket
+import struct
+import threading
+import traceback
+
+from oupyc.remote.codecs import JsonCodec
+from oupyc.remote.task import CLASS_REGISTRY, TaskPrototype, TaskResultPrototype, register_class
+from oupyc.utils import process_context
+
+try:
+    basestring
+except NameError:
+    # python 3
+    basestring = str
+
+__author__ = 'AMarin'
+
+_l = logging.getLogger(__name__)
+_l.setLevel(logging.INFO)
+debug, info, warning, error, critical = _l.debug, _l.info, _l.warning, _l.error,  _l.critical
+
+# frame header: payload length, request id
+_FRAME = struct.Struct('>IQ')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DEFAULT_POOL_SIZE = 4
+DEFAULT_MAX_PENDING = 128
+
+
+class TransportError(Exception):
+    pass
+
+
+class ConnectionLost(TransportError):
+    pass
+
+
+class RemoteError(TaskResultPrototype):
+    """ Result sent by server when task failed to decode or raised """
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+register_class(RemoteError)
+
+
+def _socket_family(address):
+    """ Unix socket for path string, TCP for (host, port) """
+    if isinstance(address, basestring):
+        return socket.AF_UNIX
+    return socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionLost("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """ Read one frame, return (request_id, payload) """
+    size, request_id = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+    if size > MAX_FRAME_SIZE:
+        raise TransportError("Frame of %s bytes exceeds limit %s" % (size, MAX_FRAME_SIZE))
+    return request_id, _recv_exactly(sock, size)
+
+
+def write_frame(sock, request_id, payload):
+    sock.sendall(_FRAME.pack(len(payload), request_id) + payload)
+
+
+def _remote_error(exc):
+    return RemoteError(message="%s: %s" % (exc.__class__.__name__, exc))
+
+
+def _execute(codec, payload):
+    """ Decode and run task, return encoded result or encoded RemoteError if any step failed """
+    try:
+        task = codec.loads(payload)
+        assert isinstance(task, TaskPrototype), "Expected task, got %s" % type(task)
+        return codec.dumps(task.process_request())
+    except Exception as exc:
+        warning("Task failed: %s", exc)
+        debug(traceback.format_exc())
+        return codec.dumps(_remote_error(exc))
+
+
+def _serve_connection(conn, codec):
+    """ Answer pipelined requests of one connection in order they came """
+    try:
+        while True:
+            request_id, payload = read_frame(conn)
+            try:
+                response = _execute(codec, payload)
+            except Exception as exc:
+                error("Failed to answer request %s: %s\n%s", request_id, exc, traceback.format_exc())
+                response = codec.dumps(_remote_error(exc))
+            write_frame(conn, request_id, response)
+    except (ConnectionLost, socket.error):
+        pass
+    except TransportError as exc:
+        warning("Closing connection: %s", exc)
+    except Exception as exc:
+        error("Closing connection on unexpected error: %s\n%s", exc, traceback.format_exc())
+    finally:
+        conn.close()
+
+
+def _serve_process(listener, codec, stop_event, accept_timeout, task_modules):
+    """ Worker process main loop: accept connections from shared listening socket, thread per connection.
+    Worker is not forked, so modules registering task classes are imported first """
+    for module in task_modules:
+        importlib.import_module(module)
+    listener.settimeout(accept_timeout)
+    while not stop_event.is_set():
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            continue
+        except socket.error as exc:
+            if exc.args and exc.args[0] in (errno.EINTR, errno.EAGAIN):
+                continue
+            raise
+        conn.settimeout(None)
+        if conn.family != socket.AF_UNIX:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=_serve_connection, args=(conn, codec))
+        thread.daemon = True
+        thread.start()
+    listener.close()
+
+
+class TaskServer(object):
+    """ Executes tasks received over TCP or Unix socket in worker processes.
+
+    Listening socket is shared by worker processes, each accepting connections and serving every connection in
+    its own thread. Workers are started by forkserver or spawn, like ProcessTransformerThread ones, so they
+    import modules of classes registered in parent on start, and task_modules if given. Task classes must be
+    defined in importable modules, not in __main__. Requests are length prefixed frames carrying request id and
+    codec encoded task, answered with frames of the same request id carrying encoded result. Each connection is served sequentially, so client
+    pipelining more than server keeps up is slowed down by socket buffers filling up.
+
+    Codec is JsonCodec by default. BinaryCodec is faster but unmarshals data as received, pass it only when
+    server address is reachable by trusted clients only.
+    """
+
+    def __init__(self, address, codec=None, processes=1, backlog=128, accept_timeout=0.5, task_modules=()):
+        self.codec = codec or JsonCodec()
+        self.processes = processes
+        self.task_modules = tuple(task_modules)
+        self.backlog = backlog
+        self.accept_timeout = accept_timeout
+        self._requested_address = address
+        self._address = None
+        self._listener = None
+        self._workers = []
+        self._context = process_context()
+        self._stop_event = self._context.Event()
+
+    address = property(lambda self: self._address, None, None, "Bound address, known after start()")
+
+    def start(self):
+        address = self._requested_address
+        listener = socket.socket(_socket_family(address), socket.SOCK_STREAM)
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                os.unlink(address)
+        else:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(address)
+        listener.listen(self.backlog)
+        self._listener = listener
+        self._address = listener.getsockname()
+        registered = sorted(set(cls.__module__ for cls in list(CLASS_REGISTRY.values())) - set(['__main__']))
+        task_modules = registered + [module for module in self.task_modules if module not in registered]
+        for idx in range(self.processes):
+            process = self._context.Process(
+                target=_serve_process,
+                args=(listener, self.codec, self._stop_event, self.accept_timeout, task_modules),
+                name="TaskServer[%s].process[%s]" % (id(self), idx),
+            )
+            process.daemon = True
+            process.start()
+            self._workers.append(process)
+        info("Task server on %s started %s worker processes", self._address, self.processes)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        timeout = self.accept_timeout * 2 if timeout is None else timeout
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._workers = []
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if isinstance(self._address, basestring) and os.path.exists(self._address):
+            os.unlink(self._address)
+
+
+class PendingResult(object):
+    """ Result of submitted task to be received """
+    __slots__ = ('request_id', '_event', '_result', '_exception')
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._event.set()
+
+    def get(self, timeout=None):
+        """ Wait for result, raise TransportError on timeout or connection loss """
+        if not self._event.wait(timeout):
+            raise TransportError("No result for request %s in %s seconds" % (self.request_id, timeout))
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class _Connection(object):
+    """ Client connection: requests are written by submitting threads, results read by reader thread """
+
+    def __init__(self, address, codec, max_pending, timeout):
+        self.codec = codec
+        self.sock = socket.socket(_socket_family(address), socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.sock.settimeout(None)
+        if self.sock.family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.alive = True
+        self.pending = dict()
+        self._send_mutex = threading.Lock()
+        self._mutex = threading.Lock()
+        # backpressure: submit blocks while max_pending requests wait for results
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._reader = threading.Thread(target=self._read_results, name="TaskClient.reader[%s]" % id(self))
+        self._reader.daemon = True
+        self._reader.start()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def send(self, request_id, payload):
+        pending = PendingResult(request_id)
+        self._slots.acquire()
+        with self._mutex:
+            if not self.alive:
+                self._slots.release()
+                raise ConnectionLost("Connection is closed")
+            self.pending[request_id] = pending
+        try:
+            with self._send_mutex:
+                write_frame(self.sock, request_id, payload)
+        except socket.error as exc:
+            self._fail(ConnectionLost("Failed to send request: %s" % exc))
+        return pending
+
+    def _read_results(self):
+        try:
+            while True:
+                request_id, payload = read_frame(self.sock)
+                with self._mutex:
+                    pending = self.pending.pop(request_id, None)
+                if pending is None:
+                    warning("Got result for unknown request %s", request_id)
+                    continue
+                self._slots.release()
+                try:
+                    result = self.codec.loads(payload)
+                except Exception as exc:
+                    pending.set_exception(TransportError("Failed to decode result: %s" % exc))
+                    continue
+                if getattr(result, 'request_id', None) is None:
+                    result.set_request_id(request_id)
+                pending.set_result(result)
+        except (TransportError, socket.error) as exc:
+            self._fail(exc if isinstance(exc, TransportError) else ConnectionLost(str(exc)))
+
+    def _fail(self, exception):
+        """ Mark connection dead and fail all pending results """
+        with self._mutex:
+            self.alive = False
+            pending, self.pending = self.pending, dict()
+        for item in pending.values():
+            self._slots.release()
+            item.set_exception(exception)
+        self.close()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+class TaskClient(object):
+    """ Submits tasks to TaskServer over pool of pipelined connections.
+
+    Every connection may have up to max_pending requests waiting for results, submit blocks when all of them
+    are used. Request is sent over connection with the least pending requests, connections are opened lazily
+    up to pool_size and reopened after loss. Results are matched to requests by request id. Codec must be the
+    same as of server, JsonCodec by default.
+    """
+
+    def __init__(self, address, codec=None, pool_size=DEFAULT_POOL_SIZE, max_pending=DEFAULT_MAX_PENDING,
+                 connect_timeout=10.0):
+        self.address = address
+        self.codec = codec or JsonCodec()
+        self.pool_size = pool_size
+        self.max_pending = max_pending
+        self.connect_timeout = connect_timeout
+        self._connections = []
+        self._mutex = threading.Lock()
+        self._request_ids = itertools.count(1)
+
+    def _connection(self):
+        with self._mutex:
+            self._connections = [conn for conn in self._connections if conn.alive]
+            if len(self._connections) < self.pool_size and all(len(conn) for conn in self._connections):
+                conn = _Connection(self.address, self.codec, self.max_pending, self.connect_timeout)
+                self._connections.append(conn)
+                return conn
+            return min(self._connections, key=len)
+
+    def submit(self, task):
+        """ Send task, return PendingResult """
+        request_id = next(self._request_ids)
+        return self._connection().send(request_id, self.codec.dumps(task))
+
+    def submit_many(self, tasks):
+        return [self.submit(task) for task in tasks]
+
+    def call(self, task, timeout=None):
+        """ Send task and wait for its result """
+        return self.submit(task).get(timeout)
+
+    def close(self):
+        with self._mutex:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
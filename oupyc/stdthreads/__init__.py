@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
-from threading import Thread, RLock, Event
+from threading import Thread, RLock, Event, current_thread
+
+from oupyc.utils import monotonic
 
 __author__ = 'AMarin'
 
@@ -15,12 +17,20 @@ class QueueNotFoundException(Exception):
 class ExitEventAwareThread(Thread):
     """ Simple thread having event to exit """
 
+    def __new__(cls, *args, **kwargs):
+        # remember constructor arguments to make replacement thread with clone()
+        obj = super(ExitEventAwareThread, cls).__new__(cls)
+        obj._init_args, obj._init_kwargs = args, kwargs
+        return obj
+
     def __init__(self, *args, **kwargs):
         super(ExitEventAwareThread, self).__init__()
 
         # define internal properties
         self._mutex = RLock()
         self._exit_event = None
+        # thread (or pool worker) -> time it started processing current item, see begin_work()
+        self._busy = dict()
 
         # do additional initialization
         self.exit_event = kwargs.get('exit_event')
@@ -39,6 +49,27 @@ class ExitEventAwareThread(Thread):
 
     exit_event = property(get_exit_event, set_exit_event, None, "Exit event to check")
 
+    def begin_work(self):
+        """ Mark calling thread is processing item, supervisor treats thread busy for too long as stuck """
+        self._busy[current_thread().ident] = monotonic()
+
+    def end_work(self):
+        self._busy.pop(current_thread().ident, None)
+
+    def busy_for(self, now=None):
+        """ Seconds the longest processing of current items lasts, 0 if idle """
+        started = list(self._busy.values())
+        if not started:
+            return 0
+        return (now or monotonic()) - min(started)
+
+    def clone(self):
+        """ Make new not started thread of the same class and arguments, e.g. to replace dead one.
+        Threads having state set after construction override it to copy the state """
+        kwargs = dict(self._init_kwargs)
+        kwargs['exit_event'] = self._exit_event
+        return self.__class__(*self._init_args, **kwargs)
+
 
 class QueueProcessorThread(ExitEventAwareThread):
     """ Simple thread to process queue(s) """
@@ -64,6 +95,12 @@ class QueueProcessorThread(ExitEventAwareThread):
     def get_all_queues(self):
         return self.__queues
 
+    def clone(self):
+        """ Make new not started thread of the same class attached to the same queues """
+        thread = super(QueueProcessorThread, self).clone()
+        thread.__queues = dict(self.__queues)
+        return thread
+
     def set_input(self, thread, queue_from='result', queue_to='incoming'):
         self.add_queue(queue_to, thread.get_queue(queue_from))
 
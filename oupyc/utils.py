@@ -1,7 +1,24 @@
 # -*- coding: utf-8 -*-
+import multiprocessing
+
 __author__ = 'AMarin'
 
+try:
+    from time import monotonic
+except ImportError:
+    # python 2 has no monotonic clock in standard library
+    from time import time as monotonic
+
 
 def underscore_to_camelcase(string_value):
     return ''.join(map(lambda x: "%s%s" % (x[0].upper(), x[1:].lower()), string_value.split("_")))
 
+
+def process_context():
+    """ Start worker processes without forking multithreaded parent where possible: fork copies locks held by
+    other threads (logging, queues) and child may deadlock on them. Python 2 has only fork """
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return multiprocessing
+    methods = multiprocessing.get_all_start_methods()
+    return get_context('forkserver' if 'forkserver' in methods else 'spawn')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import unittest
+
+from oupyc.application.aio import AsyncToThreadedBridge, AsyncTransformerThread, ThreadedToAsyncBridge
+from oupyc.queues import FixedSizeQueue
+
+
+async def make_queue(size):
+    return asyncio.Queue(size)
+
+
+class BridgeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.start()
+        self.addCleanup(self.stop_loop)
+        self.exit_event = threading.Event()
+        self.async_queue = asyncio.run_coroutine_threadsafe(make_queue(1), self.loop).result()
+
+    def stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+
+    def start(self, bridge):
+        bridge.timeout = 0.01
+        bridge.start()
+        self.addCleanup(bridge.join, 1)
+        self.addCleanup(self.exit_event.set)
+        return bridge
+
+    def test_round_trip(self):
+        source, target = FixedSizeQueue(size=10), FixedSizeQueue(size=10)
+        self.start(ThreadedToAsyncBridge(source, self.async_queue, self.loop, exit_event=self.exit_event))
+        self.start(AsyncToThreadedBridge(self.async_queue, target, self.loop, exit_event=self.exit_event))
+        source.put_many(range(5))
+        self.assertEqual(list(range(5)), [target.get(1) for _ in range(5)])
+
+    def test_stop_while_idle_or_blocked(self):
+        source = FixedSizeQueue(size=10)
+        # asyncio queue of one place gets full, bridge waits for loop future
+        source.put_many(range(3))
+        blocked = self.start(ThreadedToAsyncBridge(source, self.async_queue, self.loop, exit_event=self.exit_event))
+        idle = self.start(AsyncToThreadedBridge(
+            asyncio.run_coroutine_threadsafe(make_queue(1), self.loop).result(), FixedSizeQueue(size=1), self.loop,
+            exit_event=self.exit_event,
+        ))
+        self.exit_event.set()
+        blocked.join(1)
+        idle.join(1)
+        self.assertFalse(blocked.is_alive())
+        self.assertFalse(idle.is_alive())
+
+
+class TokenQueue(FixedSizeQueue):
+    """ Gives token per get recording acked and nacked ones """
+
+    def __init__(self, **kwargs):
+        super(TokenQueue, self).__init__(**kwargs)
+        self.items = {}
+        self.acked, self.nacked = [], []
+
+    def get(self, timeout=None):
+        item = super(TokenQueue, self).get(timeout)
+        self.items[threading.current_thread()] = item
+        return item
+
+    def taken(self):
+        return self.items.get(threading.current_thread())
+
+    def ack(self, token=None):
+        self.acked.append(token)
+
+    def nack(self, token=None, requeue=False):
+        self.nacked.append(token)
+
+
+class SleepyTransformer(AsyncTransformerThread):
+    description = "sleeps on every item but fast"
+    concurrency = 4
+    intake_timeout = 0.01
+
+    async def transform_item(self, item):
+        if item != 'fast':
+            await asyncio.sleep(60)
+        return item
+
+
+class AsyncStageTestCase(unittest.TestCase):
+
+    def test_pending_nacked_on_stop(self):
+        exit_event = threading.Event()
+        stage = SleepyTransformer(exit_event=exit_event)
+        incoming, result = TokenQueue(size=10), FixedSizeQueue(size=10)
+        stage.add_queue('incoming', incoming)
+        stage.add_queue('result', result)
+        incoming.put_many(['slow', 'fast', 'slower'])
+        stage.start()
+        self.assertEqual('fast', result.get(5))
+        exit_event.set()
+        stage.join(5)
+        self.assertFalse(stage.is_alive())
+        self.assertEqual(['fast'], incoming.acked)
+        self.assertEqual(['slow', 'slower'], sorted(incoming.nacked))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from oupyc.application import ApplicationWithStatistics
+from oupyc.inthreads.exporter import OpenMetricsExporterThread
+from oupyc.inthreads.statistics import StatisticsProcessorThread
+
+
+class StatisticsApplication(ApplicationWithStatistics):
+
+    def process_stat_record(self, record):
+        pass
+
+
+class ApplicationWithStatisticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = StatisticsApplication(
+            [], statistics_queue_size=1000, statistics_exporter_address=('127.0.0.1', 0), statistics_exporter_window=1,
+        )
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        self.app._exit_event.set()
+        for th in self.app._threads:
+            if th.is_alive():
+                th.join(5)
+
+    def thread_index(self, thread_class):
+        return [idx for idx, th in enumerate(self.app._threads) if isinstance(th, thread_class)][0]
+
+    def test_exporter_updated_after_restarts(self):
+        exporter_idx = self.thread_index(OpenMetricsExporterThread)
+        processor_idx = self.thread_index(StatisticsProcessorThread)
+        self.app.restart_thread(exporter_idx)
+        self.app.restart_thread(processor_idx)
+        exporter = self.app._threads[exporter_idx]
+        processor = self.app._threads[processor_idx]
+        url = 'http://%s:%s/metrics' % exporter.server_address[:2]
+        deadline = time.time() + 10
+        payload = ''
+        while 'test_restart_value_count' not in payload and time.time() < deadline:
+            processor.put_record('test.restart.value', 1)
+            time.sleep(0.2)
+            payload = urlopen(url, timeout=5).read().decode('utf-8')
+        self.assertIn('test_restart_value_count', payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
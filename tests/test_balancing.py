@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from oupyc.application.balancing import ConsistentHashRing, LoadBalancedDestination, PartitionedDestination, \
+    LEAST_LOADED, POWER_OF_TWO
+from oupyc.application.task_router import ItemRouter
+from oupyc.queues import FixedSizeQueue
+
+
+def drain(queue):
+    return queue.get_many(len(queue)) if len(queue) else []
+
+
+class Replica(object):
+    """ Processor thread stand-in having incoming queue """
+
+    def __init__(self, size=100):
+        self.incoming = FixedSizeQueue(size=size)
+
+    def get_queue(self, name):
+        assert 'incoming' == name
+        return self.incoming
+
+
+class KeyRouter(ItemRouter):
+
+    def get_item_key(self, item):
+        return item['task']
+
+
+class ConsistentHashRingTestCase(unittest.TestCase):
+    keys = ['key-%s' % idx for idx in range(2000)]
+
+    def make_ring(self, nodes):
+        ring = ConsistentHashRing()
+        for node in nodes:
+            ring.add(node)
+        return ring
+
+    def mapping(self, ring):
+        return dict((key, ring.get(key)) for key in self.keys)
+
+    def test_stable_mapping(self):
+        first = self.mapping(self.make_ring(['a', 'b', 'c', 'd']))
+        # independent of process and order nodes are added
+        self.assertEqual(first, self.mapping(self.make_ring(['d', 'c', 'b', 'a'])))
+        self.assertEqual(set('abcd'), set(first.values()))
+
+    def test_add_moves_keys_to_new_node_only(self):
+        ring = self.make_ring(['a', 'b', 'c', 'd'])
+        before = self.mapping(ring)
+        ring.add('e')
+        after = self.mapping(ring)
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertEqual(set(['e']), set(after[key] for key in moved))
+        # about 1/5 of keys, far from rehashing everything
+        self.assertTrue(len(self.keys) * 0.1 < len(moved) < len(self.keys) * 0.3, len(moved))
+        ring.remove('e')
+        self.assertEqual(before, self.mapping(ring))
+        self.assertEqual(4, len(ring))
+
+    def test_copy_is_independent(self):
+        ring = self.make_ring(['a', 'b'])
+        copied = ring.copy()
+        copied.add('c')
+        self.assertEqual(2, len(ring))
+        self.assertEqual(3, len(copied))
+
+
+class PartitionedDestinationTestCase(unittest.TestCase):
+
+    def test_same_key_same_replica_in_order(self):
+        destination = PartitionedDestination(lambda item: item[0])
+        queues = [FixedSizeQueue(size=100) for _ in range(3)]
+        for idx, queue in enumerate(queues):
+            destination = destination.with_replica('replica-%s' % idx, queue)
+        items = [('key-%s' % (idx % 10), idx) for idx in range(50)]
+        for item in items:
+            destination.put(item)
+        received = dict()
+        for idx, queue in enumerate(queues):
+            for key, value in drain(queue):
+                received.setdefault(key, set()).add(idx)
+                self.assertEqual(received.get((key, 'last'), -1) < value, True)
+                received[(key, 'last')] = value
+        for key in set(key for key, _ in items):
+            self.assertEqual(1, len(received[key]))
+
+    def test_with_and_without_replica_keep_original(self):
+        destination = PartitionedDestination(lambda item: item).with_replica('a', FixedSizeQueue(size=1))
+        changed = destination.with_replica('b', FixedSizeQueue(size=1))
+        self.assertEqual(['a'], destination.replicas)
+        self.assertEqual(['a', 'b'], changed.replicas)
+        self.assertEqual(['b'], changed.without_replica('a').replicas)
+
+    def test_router_partitioned_chain(self):
+        router = KeyRouter(exit_event=threading.Event())
+        incoming = FixedSizeQueue(size=1)
+        router.add_queue('incoming', incoming)
+        replicas = [Replica() for _ in range(3)]
+        router.add_partitioned_chain('task', replicas, lambda item: item['key'])
+        for idx in range(30):
+            incoming.put(dict(task='task', key=idx % 5, value=idx))
+            router.process_next_item()
+        got = [drain(replica.incoming) for replica in replicas]
+        self.assertEqual(30, sum(len(items) for items in got))
+        for items in got:
+            for key in set(item['key'] for item in items):
+                values = [item['value'] for item in items if item['key'] == key]
+                self.assertEqual(6, len(values))
+                self.assertEqual(sorted(values), values)
+        # removed replica keys go to others, kept replicas keep their keys
+        before = dict((item['key'], idx) for idx, items in enumerate(got) for item in items)
+        router.remove_replica('task', 'task[0]')
+        for key in range(5):
+            incoming.put(dict(task='task', key=key, value=key))
+            router.process_next_item()
+        for idx, replica in enumerate(replicas):
+            for item in drain(replica.incoming):
+                self.assertNotEqual(0, idx)
+                if before[item['key']] != 0:
+                    self.assertEqual(before[item['key']], idx)
+        router.add_replica('task', 'task[0]', replicas[0])
+        for key in range(5):
+            incoming.put(dict(task='task', key=key, value=key))
+            router.process_next_item()
+        self.assertEqual(before, dict(
+            (item['key'], idx) for idx, replica in enumerate(replicas) for item in drain(replica.incoming)
+        ))
+
+
+class LoadBalancedDestinationTestCase(unittest.TestCase):
+
+    def make(self, mode, lengths, size=10):
+        destination = LoadBalancedDestination(mode)
+        queues = []
+        for idx, length in enumerate(lengths):
+            queue = FixedSizeQueue(size=size)
+            queue.put_many(['old'] * length)
+            queues.append(queue)
+            destination = destination.with_replica('replica-%s' % idx, queue)
+        return destination, queues
+
+    def test_least_loaded(self):
+        destination, queues = self.make(LEAST_LOADED, [3, 1, 2, 5])
+        destination.put('new')
+        self.assertEqual([3, 2, 2, 5], [len(queue) for queue in queues])
+        # evens out
+        for _ in range(7):
+            destination.put('new')
+        lengths = [len(queue) for queue in queues]
+        self.assertEqual(19, sum(lengths))
+        self.assertEqual(1, max(lengths) - min(lengths))
+
+    def test_power_of_two_prefers_shorter_of_pair(self):
+        destination, queues = self.make(POWER_OF_TWO, [0, 5, 9])
+        for _ in range(50):
+            candidates = destination.candidates()
+            # every replica is a candidate, shorter of random pair goes first
+            self.assertEqual(sorted(map(id, queues)), sorted(map(id, candidates)))
+            self.assertTrue(len(candidates[0]) <= len(candidates[1]))
+            self.assertNotEqual(9, len(candidates[0]))
+
+    def test_full_replicas_skipped(self):
+        destination, queues = self.make(LEAST_LOADED, [10, 10, 4], size=10)
+        for _ in range(6):
+            self.assertTrue(destination.try_put('new'))
+        self.assertEqual([10, 10, 10], [len(queue) for queue in queues])
+        self.assertFalse(destination.try_put('new'))
+
+    def test_router_balanced_chain(self):
+        router = KeyRouter(exit_event=threading.Event())
+        incoming = FixedSizeQueue(size=1)
+        router.add_queue('incoming', incoming)
+        replicas = [Replica(size=4) for _ in range(3)]
+        router.add_balanced_chain('task', replicas, mode=LEAST_LOADED)
+        for idx in range(12):
+            incoming.put(dict(task='task', value=idx))
+            router.process_next_item()
+        self.assertEqual([4, 4, 4], [len(replica.incoming) for replica in replicas])
+        router.remove_replica('task', 'task[2]')
+        for replica in replicas:
+            drain(replica.incoming)
+        incoming.put(dict(task='task', value=12))
+        router.process_next_item()
+        self.assertEqual(0, len(replicas[2].incoming))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from oupyc.remote.cache import ResultCache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def test_single_flight(self):
+        cache = ResultCache()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute))) for _ in range(4)
+        ]
+        for follower in followers:
+            follower.start()
+        # followers wait for leader computation
+        while cache.coalesced < len(followers):
+            release.wait(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(['value'] * 5, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual((1, 4), (cache.misses, cache.coalesced))
+        self.assertEqual('value', cache.get_or_compute('key', compute))
+        self.assertEqual(1, cache.hits)
+
+    def test_failure_shared_and_not_cached(self):
+        cache = ResultCache()
+
+        def fail():
+            raise ValueError("failed")
+
+        self.assertRaises(ValueError, cache.get_or_compute, 'key', fail)
+        self.assertEqual('value', cache.get_or_compute('key', lambda: 'value'))
+
+    def test_not_cacheable(self):
+        cache = ResultCache()
+        self.assertEqual('error', cache.get_or_compute('key', lambda: 'error', lambda value: value != 'error'))
+        self.assertEqual(0, len(cache))
+
+    def test_ttl(self):
+        now = [100.0]
+        with mock.patch('oupyc.remote.cache.monotonic', lambda: now[0]):
+            cache = ResultCache(ttl=10, max_bytes=1000)
+            cache.put('key', 'old')
+            now[0] += 9
+            self.assertEqual('old', cache.get('key'))
+            now[0] += 1
+            self.assertIsNone(cache.get('key'))
+            self.assertEqual(0, cache.size_bytes)
+            self.assertEqual('new', cache.get_or_compute('key', lambda: 'new'))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_items=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((1, None, 3), (cache.get('a'), cache.get('b'), cache.get('c')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from oupyc.application import ThreadedApplication
+from oupyc.queues import FixedSizeQueue
+
+
+def make_counter():
+    counter = iter(range(1000000))
+
+    def generate():
+        return next(counter)
+    generate.description = 'test counter'
+    return generate
+
+
+def double(item):
+    return item * 2
+double.description = 'test doubler'
+
+
+def make_collector():
+    processed = []
+
+    def process(item):
+        processed.append(item)
+    process.description = 'test collector'
+    return process, processed
+
+
+class ChainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = ThreadedApplication([])
+        self.addCleanup(self.app._exit_event.set)
+
+    def run_until(self, items, count):
+        """ Start chain threads as daemons and wait until count items are collected """
+        for th in self.app._threads:
+            th.daemon = True
+            th.start()
+        deadline = time.time() + 5
+        while len(items) < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.app._exit_event.set()
+        return items[:count]
+
+    def test_options_per_link(self):
+        process, processed = make_collector()
+        self.app.make_gtp_chain(
+            make_counter(), double, process, queue_size=[3, None], batch_size=[None, 4, 2], batch_timeout=0.01,
+        )
+        generator, transformer, processor = self.app._threads
+        self.assertEqual([3, 4], [generator.get_queue('result').size, transformer.get_queue('result').size])
+        self.assertEqual([None, 4, 2], [th.batch_size for th in self.app._threads])
+        self.assertEqual([0.01] * 3, [th.batch_timeout for th in self.app._threads])
+        self.assertIs(generator.get_queue('result'), transformer.get_queue('incoming'))
+        self.assertEqual([idx * 2 for idx in range(20)], self.run_until(processed, 20))
+
+    def test_queue_class_per_link(self):
+        class OtherQueue(FixedSizeQueue):
+            pass
+        self.app.make_gtp_chain(make_counter(), double, make_collector()[0], queue_class=[None, OtherQueue])
+        generator, transformer, _ = self.app._threads
+        self.assertIs(FixedSizeQueue, type(generator.get_queue('result')))
+        self.assertIs(OtherQueue, type(transformer.get_queue('result')))
+        self.assertEqual(2, len(self.app._owned_queues))
+
+
+if __name__ == '__main__':
+    unittest.main()
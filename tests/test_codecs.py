@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import struct
+import unittest
+
+from oupyc.remote.codecs import BinaryCodec, CodecError, JsonCodec
+from oupyc.remote.task import TaskPrototype, TaskRequestPrototype, TaskResultPrototype, register_task_class, \
+    RESULT_SUCCESS
+
+
+class PointRequest(TaskRequestPrototype):
+    fields = ('x', 'y')
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+class PointResult(TaskResultPrototype):
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+@register_task_class
+class PointTask(TaskPrototype):
+    task_name = 'test_codecs.point'
+    request_class = PointRequest
+    response_class = PointResult
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+    def _process_request(self, **kwargs):
+        return self.return_success(data=self.request.get('x') + self.request.get('y'))
+
+
+class CodecsTestCase(unittest.TestCase):
+    codecs = (JsonCodec(), BinaryCodec(), BinaryCodec(compress_threshold=0))
+
+    def test_task_round_trip(self):
+        for codec in self.codecs:
+            task = codec.loads(codec.dumps(PointTask(x=1, y=u'я')))
+            self.assertIsInstance(task, PointTask)
+            self.assertEqual(dict(x=1, y=u'я'), task.request.data)
+
+    def test_result_round_trip(self):
+        for codec in self.codecs:
+            result = codec.loads(codec.dumps(codec.loads(codec.dumps(PointTask(x=1, y=2))).process_request()))
+            self.assertIsInstance(result, PointResult)
+            self.assertEqual((RESULT_SUCCESS, 3), (result.code, result.data))
+
+    def test_fields_packed_as_values(self):
+        codec = BinaryCodec()
+        packed = codec.dumps(PointTask(x=1, y=2))
+        # extra key does not fit fields, whole dict is packed then
+        unpacked = codec.dumps(PointTask(x=1, y=2, z=3))
+        self.assertTrue(len(packed) < len(unpacked))
+        self.assertEqual(dict(x=1, y=2, z=3), codec.loads(unpacked).request.data)
+
+    def test_unknown_class_id(self):
+        codec = BinaryCodec()
+        self.assertRaises(CodecError, codec.loads, struct.pack('>BBI', 1, 0, 1) + b'0')
+
+    def test_unsupported_format_version(self):
+        codec = BinaryCodec()
+        data = bytearray(codec.dumps(PointTask(x=1, y=2)))
+        data[0] = 99
+        self.assertRaises(CodecError, codec.loads, bytes(data))
+
+    def test_unknown_json_class(self):
+        codec = JsonCodec()
+        data = codec.dumps(PointTask(x=1, y=2)).replace(b'"1"', b'"2"')
+        self.assertRaises(CodecError, codec.loads, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from oupyc.application import ThreadedApplication
+from oupyc.application.transformer import TransformerThread
+from oupyc.queues import FixedSizeQueue, QueueItemNotFoundException
+from oupyc.queues.durable import DurableQueue
+
+
+def check_positive(item):
+    if item < 0:
+        raise ValueError("negative item %s" % item)
+    return item
+check_positive.description = 'test transformer'
+
+
+def double(item):
+    return item * 2
+double.description = 'test doubler'
+
+
+class DurableQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='oupyc-test-')
+        # cleanups run in reverse order, so queues are closed first
+        self.addCleanup(shutil.rmtree, self.path, True)
+
+    def make_queue(self, **kwargs):
+        kwargs.setdefault('size', 100)
+        queue = DurableQueue(path=self.path, **kwargs)
+        self.addCleanup(self.close, queue)
+        return queue
+
+    @staticmethod
+    def close(queue):
+        if not queue._file.closed:
+            queue.close()
+
+    def reopen(self, queue, **kwargs):
+        queue.close()
+        return self.make_queue(**kwargs)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.path) if name.startswith('wal-'))
+
+    def test_replay_not_acked(self):
+        queue = self.make_queue()
+        queue.put_many(range(5))
+        queue.get()
+        queue.ack()
+        queue.get()
+        queue = self.reopen(queue)
+        # taken but not acked item is delivered again, in put order
+        self.assertEqual([1, 2, 3, 4], queue.get_many(10))
+
+    def test_ack_token_of_take_only(self):
+        queue = self.make_queue()
+        queue.put_many(['failed', 'ok'])
+        queue.get()
+        failed = queue.taken()
+        queue.get()
+        queue.ack()
+        self.assertEqual(1, len(failed))
+        queue = self.reopen(queue)
+        self.assertEqual(['failed'], queue.get_many(10))
+
+    def test_ack_from_other_thread(self):
+        queue = self.make_queue()
+        queue.put_many(range(4))
+        tokens = []
+        for _ in range(4):
+            queue.get()
+            tokens.append(queue.taken())
+        # out of order, like pool workers finishing
+        workers = [threading.Thread(target=queue.ack, args=(token, )) for token in tokens[::-1][:3]]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        queue = self.reopen(queue)
+        self.assertEqual([0], queue.get_many(10))
+
+    def test_ack_once(self):
+        queue = self.make_queue()
+        queue.put_many(range(2))
+        queue.get_many(2)
+        token = queue.taken()
+        queue.ack(token)
+        queue.ack(token)
+        queue.nack(token, requeue=True)
+        self.assertEqual(0, len(queue))
+
+    def test_nack(self):
+        queue = self.make_queue()
+        queue.put_many(range(3))
+        queue.get()
+        queue.nack()
+        queue.get()
+        queue.nack(requeue=True)
+        self.assertEqual([1, 2], queue.get_many(10))
+        queue.ack()
+        queue = self.reopen(queue)
+        self.assertEqual([0], queue.get_many(10))
+
+    def test_torn_tail(self):
+        queue = self.make_queue()
+        queue.put_many(['a', 'b', 'c'])
+        queue.close()
+        segment = os.path.join(self.path, self.segments()[-1])
+        with open(segment, 'r+b') as wal:
+            wal.truncate(os.path.getsize(segment) - 3)
+        queue = self.make_queue()
+        self.assertEqual(['a', 'b'], queue.get_many(10))
+
+    def test_corrupted_record(self):
+        queue = self.make_queue()
+        queue.put_many(['a', 'b'])
+        queue.close()
+        segment = os.path.join(self.path, self.segments()[-1])
+        with open(segment, 'r+b') as wal:
+            wal.seek(-1, os.SEEK_END)
+            last = wal.read(1)
+            wal.seek(-1, os.SEEK_END)
+            wal.write(bytes(bytearray([ord(last) ^ 0xff])))
+        queue = self.make_queue()
+        self.assertEqual(['a'], queue.get_many(10))
+
+    def test_segment_rotation_and_removal(self):
+        queue = self.make_queue(segment_size=256)
+        for idx in range(50):
+            queue.put('item %s' % idx)
+        self.assertTrue(len(self.segments()) > 2)
+        queue.get_many(25)
+        queue.ack()
+        rotated = self.segments()
+        queue.get_many(25)
+        queue.ack()
+        # older fully acked segments are removed, current one stays
+        self.assertTrue(len(self.segments()) < len(rotated))
+        self.assertEqual(1, len(self.segments()))
+        queue = self.reopen(queue, segment_size=256)
+        self.assertEqual(0, len(queue))
+        queue.put('after')
+        self.assertEqual('after', queue.get())
+
+    def test_not_acked_item_keeps_segments(self):
+        queue = self.make_queue(segment_size=256)
+        for idx in range(50):
+            queue.put(idx)
+        queue.get()
+        first = queue.taken()
+        queue.get_many(49)
+        queue.ack()
+        self.assertTrue(len(self.segments()) > 1)
+        queue.ack(first)
+        self.assertEqual(1, len(self.segments()))
+
+    def test_nacked_item_does_not_keep_segments(self):
+        queue = self.make_queue(segment_size=256)
+        queue.put('failed')
+        queue.get()
+        queue.nack()
+        for idx in range(2000):
+            queue.put(idx)
+            queue.get()
+            queue.ack()
+        self.assertTrue(len(self.segments()) <= 2)
+        queue = self.reopen(queue, segment_size=256)
+        self.assertEqual(['failed'], queue.get_many(10))
+        queue.ack()
+        queue = self.reopen(queue, segment_size=256)
+        self.assertEqual(0, len(queue))
+
+    def test_remove(self):
+        queue = self.make_queue()
+        queue.put_many(range(3))
+        done = []
+        worker = threading.Thread(target=lambda: done.append(queue.remove(1)))
+        worker.start()
+        # concurrent put syncs log while remove runs
+        queue.put(3)
+        worker.join(5)
+        self.assertEqual([None], done)
+        self.assertRaises(QueueItemNotFoundException, queue.remove, 1)
+        queue = self.reopen(queue)
+        self.assertEqual([0, 2, 3], queue.get_many(10))
+
+    def test_sync_interval_flusher(self):
+        queue = self.make_queue(sync_interval=0.05)
+        queue.put('a')
+        deadline = time.time() + 5
+        while queue._synced_position < queue._write_position and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(queue._write_position, queue._synced_position)
+        queue = self.reopen(queue)
+        self.assertEqual('a', queue.get())
+
+    def test_transformer_acks_after_put(self):
+        queue = self.make_queue()
+        queue.put_many([1, -1, 2])
+        transformer = TransformerThread.make(check_positive, workers=2, ordered=True)
+        transformer.add_queue('incoming', queue)
+        result = FixedSizeQueue(size=10)
+        transformer.add_queue('result', result)
+        transformer.process_next_item()
+        self.assertRaises(ValueError, transformer.process_next_item)
+        transformer.process_next_item()
+        self.assertEqual([1, 2], result.get_many(10))
+        # failed item is not acked by following one
+        queue = self.reopen(queue)
+        self.assertEqual([-1], queue.get_many(10))
+
+
+class DurableChainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='oupyc-test-')
+        self.addCleanup(shutil.rmtree, self.path, True)
+        self.app = ThreadedApplication([])
+
+    def test_queue_class_needing_path_rejected(self):
+        self.assertRaises(ValueError, self.app.make_gtp_chain, double, double, double, queue_class=DurableQueue)
+
+    def test_queue_factory_per_link(self):
+        counter = iter(range(1000))
+        processed = []
+
+        def generate():
+            return next(counter)
+        generate.description = 'test counter'
+
+        def process(item):
+            processed.append(item)
+        process.description = 'test collector'
+
+        def make_queue(idx, size):
+            return DurableQueue(path=os.path.join(self.path, 'link-%s' % idx), size=size)
+
+        self.app.make_gtp_chain(generate, double, process, queue_size=4, queue_factory=make_queue)
+        for th in self.app._threads:
+            th.daemon = True
+            th.start()
+        deadline = time.time() + 5
+        while len(processed) < 10 and time.time() < deadline:
+            time.sleep(0.01)
+        self.app._exit_event.set()
+        self.assertEqual([idx * 2 for idx in range(10)], processed[:10])
+        self.assertEqual(['link-0', 'link-1'], sorted(os.listdir(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
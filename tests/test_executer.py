@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import struct
+import unittest
+
+from oupyc.application.executer import MultiTaskExecutorThread, TaskExecutorThread
+from oupyc.remote.codecs import BinaryCodec, JsonCodec
+from oupyc.remote.task import TaskPrototype, TaskRequestPrototype, TaskResultPrototype, register_task_class, \
+    ResultTaskNotImplementedError, RESULT_SUCCESS
+from oupyc.remote.cache import ResultCache
+
+
+class DoubleRequest(TaskRequestPrototype):
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+class DoubleResult(TaskResultPrototype):
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+@register_task_class
+class DoubleTask(TaskPrototype):
+    task_name = 'test_executer.double'
+    request_class = DoubleRequest
+    response_class = DoubleResult
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+    def _process_request(self, **kwargs):
+        return self.return_success(data=self.request.get('value') * 2)
+
+
+@register_task_class
+class SquareTask(DoubleTask):
+    """ Idempotent task having batch hook, hook calls are recorded in batches """
+    task_name = 'test_executer.square'
+    idempotent = True
+    result_cache = ResultCache()
+    batches = []
+
+    @classmethod
+    def _process_batch(cls, tasks):
+        cls.batches.append([task.request.get('value') for task in tasks])
+        return [
+            task.return_success(data=task.request.get('value') ** 2, request_id=task.request_id) for task in tasks
+        ]
+
+
+# binary format version 1, no flags, class id nobody registered
+UNKNOWN_BINARY = struct.pack('>BBI', 1, 0, 1) + b'0'
+UNKNOWN_JSON = b'{"class_module":"nowhere","class_name":"Task","class_version":"1","data":{}}'
+
+
+class MultiTaskExecutorTestCase(unittest.TestCase):
+
+    def check_unknown(self, codec, executor, data):
+        results = [executor.transform_item(data)] + executor.transform_batch([codec.dumps(DoubleTask(value=2)), data])
+        unknown = [codec.loads(results[0]), codec.loads(results[2])]
+        for result in unknown:
+            self.assertIsInstance(result, ResultTaskNotImplementedError)
+        known = codec.loads(results[1])
+        self.assertEqual((RESULT_SUCCESS, 4), (known.code, known.data))
+
+    def test_unknown_class_id(self):
+        codec = BinaryCodec()
+        self.check_unknown(codec, MultiTaskExecutorThread(codec=codec, max_threads=4), UNKNOWN_BINARY)
+        executor = TaskExecutorThread(codec=codec, task_class=DoubleTask, max_threads=4)
+        self.check_unknown(codec, executor, UNKNOWN_BINARY)
+
+    def test_unknown_json_class(self):
+        codec = JsonCodec()
+        self.check_unknown(codec, MultiTaskExecutorThread(codec=codec, max_threads=4), UNKNOWN_JSON)
+
+    def test_unknown_task_name(self):
+        executor = MultiTaskExecutorThread(max_threads=4)
+        result = executor.transform_item(dict(task_name='test_executer.unknown'))
+        self.assertIsInstance(result, ResultTaskNotImplementedError)
+        self.assertEqual(2, executor.transform_item(DoubleTask(value=1).make_request()).data)
+
+
+
+class TaskExecutorBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        SquareTask.result_cache.clear()
+        del SquareTask.batches[:]
+
+    def test_batch_grouped_by_class(self):
+        codec = JsonCodec()
+        executor = TaskExecutorThread(codec=codec, task_class=DoubleTask, max_threads=4)
+        items = [codec.dumps(task) for task in [DoubleTask(value=3), SquareTask(value=3), SquareTask(value=4)]]
+        results = [codec.loads(result) for result in executor.transform_batch(items)]
+        self.assertEqual([6, 9, 16], [result.data for result in results])
+        self.assertEqual([[3, 4]], SquareTask.batches)
+
+    def test_batch_uses_result_cache(self):
+        codec = JsonCodec()
+        executor = TaskExecutorThread(codec=codec, task_class=SquareTask, max_threads=4)
+        executor.transform_batch([codec.dumps(SquareTask(value=2))])
+        results = executor.transform_batch([codec.dumps(SquareTask(value=value)) for value in (2, 5)])
+        self.assertEqual([4, 25], [codec.loads(result).data for result in results])
+        self.assertEqual([[2], [5]], SquareTask.batches)
+        self.assertEqual(4, codec.loads(executor.transform_item(codec.dumps(SquareTask(value=2)))).data)
+        self.assertEqual([[2], [5]], SquareTask.batches)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import unittest
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from oupyc.inthreads.exporter import OpenMetricsExporterThread
+
+
+class Processor(object):
+    """ Listener registry of statistics processor """
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, window, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, window, listener):
+        self.listeners = [added for added in self.listeners if added != listener]
+
+    def close_window(self, summary):
+        for listener in self.listeners:
+            listener(0, summary)
+
+
+class OpenMetricsExporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.exit_event = threading.Event()
+        self.exporter = OpenMetricsExporterThread(('127.0.0.1', 0), exit_event=self.exit_event)
+        # exporter not started closes nothing
+        self.addCleanup(self.exporter._OpenMetricsExporterThread__server.server_close)
+        self.processor = Processor()
+        self.exporter.attach(self.processor, 1)
+
+    def stop(self, thread):
+        self.exit_event.set()
+        thread.join(5)
+
+    def scrape(self):
+        host, port = self.exporter.server_address[:2]
+        return urlopen('http://%s:%s/metrics' % (host, port), timeout=5).read().decode('utf-8')
+
+    def test_render(self):
+        self.processor.close_window({'items.event': dict(count=2)})
+        self.processor.close_window({'latency': dict(count=1, sum=5, min=5, max=5, last=5, avg=5, p50=5)})
+        payload = self.exporter.payload.decode('utf-8')
+        self.assertIn('items_event_total 2', payload)
+        self.assertIn('latency{quantile="0.5"} 5.0', payload)
+        # no quantile is rendered for missing value
+        self.assertNotIn('quantile="0.9"', payload)
+        self.assertTrue(payload.endswith('# EOF\n'))
+
+    def test_clone_keeps_state_and_listener(self):
+        self.processor.close_window({'items.event': dict(count=2)})
+        clone = self.exporter.clone()
+        self.assertEqual([clone.update], self.processor.listeners)
+        self.processor.close_window({'items.event': dict(count=3)})
+        clone.start()
+        self.addCleanup(self.stop, clone)
+        self.assertIn('items_event_total 5', self.scrape())
+
+    def test_busy_address_fails_on_construction(self):
+        self.assertRaises(
+            socket.error, OpenMetricsExporterThread, self.exporter.server_address[:2], exit_event=self.exit_event
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from oupyc.inthreads import statistics
+from oupyc.inthreads.histogram import LogHistogram
+
+
+class LogHistogramTestCase(unittest.TestCase):
+
+    def test_quantiles_within_accuracy(self):
+        histogram = LogHistogram()
+        for value in range(1, 1001):
+            histogram.add(value)
+        self.assertEqual(1000, histogram.count)
+        for q, exact in ((0.5, 500), (0.9, 900), (0.99, 990)):
+            self.assertAlmostEqual(exact, histogram.quantile(q), delta=exact * histogram.accuracy + 1)
+
+    def test_zero_and_negative(self):
+        histogram = LogHistogram()
+        for value in (-10, -1, 0, 0, 1, 10):
+            histogram.add(value)
+        self.assertEqual(6, histogram.count)
+        self.assertEqual(2, histogram.zero)
+        low, median, high = histogram.quantiles(0, 0.5, 1)
+        self.assertAlmostEqual(-10, low, delta=0.1)
+        self.assertEqual(0, median)
+        self.assertAlmostEqual(10, high, delta=0.1)
+
+    def test_non_finite(self):
+        histogram = LogHistogram()
+        for value in (float('inf'), float('-inf'), float('nan')):
+            histogram.add(value)
+        self.assertEqual(0, histogram.count)
+        self.assertEqual(3, histogram.nonfinite)
+        self.assertEqual([None], histogram.quantiles(0.5))
+        histogram.add(2)
+        self.assertEqual(1, histogram.count)
+        self.assertAlmostEqual(2, histogram.quantile(0.5), delta=0.1)
+        merged = LogHistogram().merge(histogram)
+        self.assertEqual((1, 3), (merged.count, merged.nonfinite))
+
+    def test_summary_of_infinite_values(self):
+        inf = float('inf')
+        histogram = LogHistogram()
+        histogram.add(inf)
+        summary = statistics._summarize({'latency': [1, inf, inf, inf, inf, histogram]})['latency']
+        self.assertEqual(1, summary['count'])
+        self.assertNotIn('p50', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
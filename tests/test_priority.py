@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from oupyc.queues import PriorityQueue
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class PriorityQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('oupyc.queues.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_priority_order_and_fifo(self):
+        queue = PriorityQueue(size=10)
+        queue.put_many([
+            dict(name='low', priority=5), dict(name='first'), dict(name='high', priority=-1), dict(name='second'),
+        ])
+        self.assertEqual(['high', 'first', 'second', 'low'], [item['name'] for item in queue.get_many(10)])
+
+    def test_aging_reorders_starved_items(self):
+        queue = PriorityQueue(size=10, aging_rate=1.0)
+        queue.put(dict(name='starved', priority=5))
+        self.clock.now += 2
+        queue.put(dict(name='fresh', priority=4))
+        self.clock.now += 8
+        queue.put(dict(name='urgent', priority=1))
+        # starved waited long enough to get ahead of better priority items put later
+        self.assertEqual(['starved', 'fresh', 'urgent'], [item['name'] for item in queue.get_many(10)])
+
+    def test_aging_keeps_fifo_of_equal_priority(self):
+        queue = PriorityQueue(size=10, aging_rate=1.0)
+        for idx in range(5):
+            queue.put(dict(name=idx, priority=1))
+        self.clock.now += 1
+        for idx in range(5, 10):
+            queue.put(dict(name=idx, priority=1))
+        self.assertEqual(list(range(10)), [item['name'] for item in queue.get_many(10)])
+
+    def test_without_aging_better_priority_first(self):
+        queue = PriorityQueue(size=10)
+        queue.put(dict(name='starved', priority=5))
+        self.clock.now += 1000
+        queue.put(dict(name='urgent', priority=1))
+        self.assertEqual(['urgent', 'starved'], [item['name'] for item in queue.get_many(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from oupyc.application.process import ProcessTransformerThread, ProcessTransformError, WorkerProcessCrashed
+from oupyc.queues import FixedSizeQueue
+
+
+def square(item):
+    """ Square of number. Exits worker process for (number, marker path) item once marker is created """
+    if isinstance(item, tuple):
+        item, marker = item
+        if marker is None or not os.path.exists(marker):
+            if marker is not None:
+                open(marker, 'w').close()
+            os._exit(1)
+    if item < 0:
+        raise ValueError("negative %s" % item)
+    return item * item
+square.description = 'test square'
+
+
+def square_all(items):
+    return [square(item) for item in items]
+square_all.description = 'test batch square'
+square_all.batch = True
+
+
+class ProcessTransformerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='oupyc-test-')
+        self.addCleanup(shutil.rmtree, self.path, True)
+
+    def make(self, func, **kwargs):
+        transformer = ProcessTransformerThread.make(func, **kwargs)
+        transformer.process_poll_interval = 0.05
+        self.addCleanup(transformer.stop_processes)
+        return transformer
+
+    def test_round_trip(self):
+        transformer = self.make(square)
+        self.assertEqual(9, transformer.transform_item(3))
+        self.assertEqual([1, 4], transformer.transform_batch([1, 2]))
+        self.assertEqual([4], self.make(square_all).transform_batch([2]))
+
+    def test_failure_passed_back(self):
+        transformer = self.make(square)
+        self.assertRaises(ProcessTransformError, transformer.transform_item, -1)
+        # process is alive after failure
+        self.assertEqual(4, transformer.transform_item(2))
+
+    def test_crashed_worker_restarted(self):
+        transformer = self.make(square)
+        self.assertEqual(1, transformer.transform_item(1))
+        crashed = transformer._get_process()[0]
+        self.assertEqual(4, transformer.transform_item((2, os.path.join(self.path, 'crashed'))))
+        self.assertNotEqual(crashed.pid, transformer._get_process()[0].pid)
+        self.assertFalse(crashed.is_alive())
+        self.assertEqual(1, len(transformer._processes))
+
+    def test_crash_retries_exhausted(self):
+        transformer = self.make(square)
+        self.assertRaises(WorkerProcessCrashed, transformer.transform_item, (2, None))
+        self.assertEqual(9, transformer.transform_item(3))
+
+    def test_pool_stage(self):
+        exit_event = threading.Event()
+        self.addCleanup(exit_event.set)
+        transformer = self.make(square, processes=2, ordered=True)
+        incoming, result = FixedSizeQueue(size=100), FixedSizeQueue(size=100)
+        transformer.add_queue('incoming', incoming)
+        transformer.add_queue('result', result)
+        transformer._exit_event = exit_event
+        transformer.daemon = True
+        incoming.put_many([1, 2, (3, os.path.join(self.path, 'crashed')), 4, 5])
+        transformer.start()
+        self.assertEqual([1, 4, 9, 16, 25], [result.get(10) for _ in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
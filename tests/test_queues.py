@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from oupyc.queues import FixedSizeQueue, NamedAndTypedQueue, QueueTimeoutException, SimpleQueue
+
+
+class CountingQueue(FixedSizeQueue):
+    """ Counts on_change calls """
+
+    def __init__(self, **kwargs):
+        super(CountingQueue, self).__init__(**kwargs)
+        self.changes = 0
+
+    def on_change(self):
+        self.changes += 1
+
+
+class SimpleQueueTestCase(unittest.TestCase):
+
+    def test_fifo_order(self):
+        queue = SimpleQueue()
+        queue.put_many(range(5))
+        queue.put(5)
+        self.assertEqual(6, len(queue))
+        self.assertEqual(0, queue.get())
+        self.assertEqual([1, 2, 3], queue.get_many(3))
+        self.assertEqual([4, 5], queue.get_many(10))
+        self.assertEqual([], queue.get_many(10))
+
+    def test_pop_filtered(self):
+        queue = SimpleQueue()
+        queue.put_many(range(6))
+        self.assertEqual([0, 2, 4], queue.pop_filtered(lambda x: x % 2 == 0))
+        self.assertEqual([1, 3, 5], queue.get_many(10))
+
+
+class FixedSizeQueueTestCase(unittest.TestCase):
+
+    def test_bulk_calls_on_change_once(self):
+        queue = CountingQueue(size=10)
+        queue.put_many(range(5))
+        self.assertEqual(1, queue.changes)
+        self.assertEqual([0, 1, 2], queue.get_many(3))
+        self.assertEqual(2, queue.changes)
+
+    def test_get_timeout(self):
+        queue = FixedSizeQueue(size=1)
+        self.assertRaises(QueueTimeoutException, queue.get, 0.01)
+
+    def test_try_put(self):
+        queue = FixedSizeQueue(size=3)
+        self.assertTrue(queue.try_put(0))
+        self.assertEqual(2, queue.try_put_many(range(1, 5)))
+        self.assertFalse(queue.try_put(5))
+        self.assertEqual([0, 1, 2], queue.get_many(10))
+
+    def test_put_many_blocks_until_consumed(self):
+        queue = FixedSizeQueue(size=2)
+        producer = threading.Thread(target=queue.put_many, args=(range(10),))
+        producer.start()
+        got = []
+        while len(got) < 10:
+            got.extend(queue.get_many(3, timeout=0.01))
+            self.assertTrue(len(queue) <= 2)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(list(range(10)), got)
+
+    def test_get_many_waits_for_batch(self):
+        queue = FixedSizeQueue(size=10)
+        queue.put(0)
+        threading.Timer(0.05, queue.put_many, args=([1, 2],)).start()
+        self.assertEqual([0, 1, 2], queue.get_many(3, timeout=5))
+
+
+class NamedAndTypedQueueTestCase(unittest.TestCase):
+
+    def test_bulk_type_check(self):
+        queue = NamedAndTypedQueue(name='ints', size=10, allow=int)
+        queue.put_many([1, 2])
+        self.assertRaises(AssertionError, queue.put_many, [3, 'four'])
+        self.assertRaises(AssertionError, queue.try_put_many, ['five'])
+        self.assertEqual([1, 2], queue.get_many(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from oupyc.application.retry import RetrySchedulerThread, TimerWheel, pop_attempt, with_attempt
+from oupyc.queues import FixedSizeQueue
+from oupyc.remote.task import TaskResultPrototype, RESULT_ERROR_REPEAT, RESULT_SUCCESS
+
+
+class Item(object):
+    pass
+
+
+class AttemptTestCase(unittest.TestCase):
+
+    def test_dict(self):
+        item = dict(task_name='task')
+        self.assertEqual((item, 0), pop_attempt(item))
+        self.assertEqual((item, 3), pop_attempt(with_attempt(item, 3)))
+        self.assertEqual(dict(task_name='task'), item)
+
+    def test_bytes(self):
+        self.assertEqual((b'payload', 0), pop_attempt(b'payload'))
+        self.assertEqual((b'payload', 2), pop_attempt(with_attempt(b'payload', 2)))
+        self.assertEqual((b'', 1), pop_attempt(with_attempt(b'', 1)))
+
+    def test_attribute(self):
+        item = Item()
+        self.assertEqual((item, 0), pop_attempt(item))
+        self.assertEqual((item, 4), pop_attempt(with_attempt(item, 4)))
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def test_due_in_delay_order(self):
+        wheel = TimerWheel(tick=1.0, wheel_size=4, now=0)
+        wheel.add(2.5, 'third', now=0)
+        wheel.add(1, 'first', now=0)
+        # longer than one rotation
+        wheel.add(9, 'rounds', now=0)
+        wheel.add(2, 'second', now=0)
+        self.assertEqual(4, len(wheel))
+        self.assertEqual([], wheel.advance(0.5))
+        self.assertEqual(['first', 'second'], wheel.advance(2))
+        self.assertEqual(['third'], wheel.advance(3))
+        self.assertEqual([], wheel.advance(8))
+        self.assertEqual(['rounds'], wheel.advance(9))
+        self.assertEqual(0, len(wheel))
+
+    def test_not_due_early(self):
+        wheel = TimerWheel(tick=1.0, wheel_size=4, now=0)
+        # most of current tick passed already
+        wheel.add(1, 'entry', now=0.9)
+        self.assertEqual([], wheel.advance(1.5))
+        self.assertEqual(['entry'], wheel.advance(2))
+
+    def test_added_after_missed_ticks(self):
+        wheel = TimerWheel(tick=1.0, wheel_size=4, now=0)
+        wheel.add(1, 'entry', now=5.5)
+        self.assertEqual([], wheel.advance(6))
+        self.assertEqual(['entry'], wheel.advance(7))
+
+
+class RetrySchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RetrySchedulerThread(
+            exit_event=threading.Event(), tick=0.01, base_delay=0.01, jitter=0, max_attempts=2,
+        )
+        self.queue = FixedSizeQueue(size=1)
+
+    def release_all(self):
+        return self.scheduler.release(self.scheduler._wheel.next_tick() + 10)
+
+    def test_stops_at_max_attempts(self):
+        repeat = TaskResultPrototype(code=RESULT_ERROR_REPEAT)
+        item, attempt = dict(value=1), 0
+        for expected in (1, 2):
+            self.assertIsNone(self.scheduler.handle_result(item, repeat, self.queue, attempt))
+            self.assertEqual(1, self.release_all())
+            item, attempt = pop_attempt(self.queue.get())
+            self.assertEqual(expected, attempt)
+        self.assertIs(repeat, self.scheduler.handle_result(item, repeat, self.queue, attempt))
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_success_is_passed(self):
+        success = TaskResultPrototype(code=RESULT_SUCCESS)
+        self.assertIs(success, self.scheduler.handle_result(dict(), success, self.queue))
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_deferred_while_queue_full(self):
+        self.queue.put('blocker')
+        self.scheduler.schedule(dict(value=1), self.queue)
+        self.assertEqual(0, self.release_all())
+        self.assertEqual(1, len(self.scheduler))
+        self.queue.get()
+        self.assertEqual(1, self.release_all())
+        self.assertEqual((dict(value=1), 1), pop_attempt(self.queue.get()))
+
+
+if __name__ == '__main__':
+    unittest.main()
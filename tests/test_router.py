@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from oupyc.application.task_router import ItemRouter
+from oupyc.queues import FixedSizeQueue
+
+
+class KeyRouter(ItemRouter):
+
+    def get_item_key(self, item):
+        return item[0]
+
+
+class ItemRouterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.router = KeyRouter(exit_event=threading.Event())
+        self.incoming = FixedSizeQueue(size=1)
+        self.router.add_queue('incoming', self.incoming)
+        self.routed = FixedSizeQueue(size=10)
+        self.router.add_queue('routed', self.routed)
+        self.router.add_item_route('a', 'routed')
+
+    def route(self, *items):
+        for item in items:
+            # incoming queue is full while router routes, parking must not block
+            self.incoming.put(item)
+            self.router.process_next_item()
+
+    def test_unroutable_parked_without_blocking(self):
+        self.route(('b', 1), ('a', 1), ('b', 2), ('a', 2))
+        self.assertEqual([('a', 1), ('a', 2)], self.routed.get_many(10))
+        self.assertEqual(2, self.router.parked)
+        self.assertEqual(2, self.router.unroutable)
+
+    def test_parked_routed_once_route_added(self):
+        self.route(('b', 1), ('b', 2))
+        self.router.add_item_route('b', 'routed')
+        self.route(('a', 1))
+        self.assertEqual([('b', 1), ('b', 2), ('a', 1)], self.routed.get_many(10))
+        self.assertEqual(0, self.router.parked)
+
+    def test_parked_routed_while_idle(self):
+        self.router.retry_interval = 0.01
+        self.route(('b', 1))
+        self.router.add_item_route('b', 'routed')
+        # no incoming items, router wakes up to route parked one
+        self.router.process_next_item()
+        self.assertEqual([('b', 1)], self.routed.get_many(10))
+
+    def test_parked_waits_for_full_destination(self):
+        full = FixedSizeQueue(size=1)
+        full.put('blocker')
+        self.router.add_queue('full', full)
+        self.route(('b', 1))
+        self.router.add_item_route('b', 'full')
+        self.route(('a', 1))
+        self.assertEqual(1, self.router.parked)
+        full.get()
+        self.router.try_route_parked()
+        self.assertEqual([('b', 1)], full.get_many(10))
+
+    def test_route_removal_triggers_retry(self):
+        self.router.retry_interval = 60
+        self.route(('b', 1))
+        self.router.try_route_parked()
+        self.assertFalse(self.router._retry_due())
+        self.router.remove_item_route('a')
+        self.assertTrue(self.router._retry_due())
+
+    def test_parked_limit(self):
+        self.router.max_parked = 2
+        self.route(('b', 1), ('b', 2), ('b', 3))
+        self.assertEqual(2, self.router.parked)
+        self.assertEqual(1, self.router.overflowed)
+        self.router.add_item_route('b', 'routed')
+        self.router.try_route_parked()
+        self.assertEqual([('b', 2), ('b', 3)], self.routed.get_many(10))
+
+    def test_clone_keeps_parked(self):
+        self.route(('b', 1))
+        clone = self.router.clone()
+        self.assertEqual(1, clone.parked)
+        clone.add_item_route('b', 'routed')
+        clone.try_route_parked()
+        self.assertEqual(0, clone.parked)
+        # dead thread buffer is not shared
+        self.assertEqual(1, self.router.parked)
+
+
+if __name__ == '__main__':
+    unittest.main()
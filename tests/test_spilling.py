@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from oupyc.application import ThreadedApplication
+from oupyc.queues.spilling import SpillingQueue
+
+
+def generate():
+    return 1
+generate.description = 'test generator'
+
+
+def process(item):
+    pass
+process.description = 'test processor'
+
+
+class SpillingQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp(prefix='oupyc-test-')
+        # cleanups run in reverse order, so queues are closed first
+        self.addCleanup(shutil.rmtree, self.spill_dir, True)
+
+    def make_queue(self, **kwargs):
+        kwargs.setdefault('spill_dir', self.spill_dir)
+        queue = SpillingQueue(**kwargs)
+        self.addCleanup(queue.close)
+        return queue
+
+    def spill_files(self):
+        return sorted(os.listdir(self.spill_dir))
+
+    def test_fifo_across_memory_and_disk(self):
+        queue = self.make_queue(size=3, segment_size=64)
+        queue.put_many(range(10))
+        self.assertEqual(10, len(queue))
+        self.assertEqual(7, queue.spilled)
+        self.assertEqual([0, 1, 2, 3], [queue.get() for _ in range(4)])
+        # put while disk has older items goes to disk too
+        queue.put(10)
+        self.assertEqual(list(range(4, 11)), [queue.get() for _ in range(7)])
+        self.assertEqual(0, len(queue))
+        self.assertEqual(0, queue.spilled_bytes)
+
+    def test_size_required(self):
+        for size in (None, 0, -1):
+            self.assertRaises(ValueError, SpillingQueue, size=size, spill_dir=self.spill_dir)
+        self.assertRaises(ValueError, SpillingQueue, spill_dir=self.spill_dir)
+
+    def test_segments_reused(self):
+        queue = self.make_queue(size=1, segment_size=64, free_segments=1)
+        for rounds in range(3):
+            queue.put_many(range(20))
+            self.assertEqual(list(range(20)), [queue.get() for _ in range(20)])
+        files = self.spill_files()
+        self.assertEqual(1, len(files))
+        # free segment is reused instead of creating new file
+        queue.put_many(range(3))
+        self.assertEqual(files, self.spill_files())
+        self.assertEqual([0, 1, 2], [queue.get() for _ in range(3)])
+
+    def test_oversized_record(self):
+        queue = self.make_queue(size=1, segment_size=64)
+        large = 'x' * 1000
+        queue.put_many(['first', large, 'last'])
+        self.assertEqual(['first', large, 'last'], [queue.get() for _ in range(3)])
+        # segment sized by record is removed, only regular one is kept for reuse
+        files = self.spill_files()
+        self.assertEqual(1, len(files))
+        self.assertEqual(64, os.path.getsize(os.path.join(self.spill_dir, files[0])))
+
+    def test_max_items(self):
+        queue = self.make_queue(size=1, max_items=3)
+        self.assertEqual(3, queue.try_put_many(range(5)))
+        self.assertFalse(queue.try_put(5))
+
+    def test_pop_filtered_rewrites_spilled(self):
+        queue = self.make_queue(size=2, segment_size=64)
+        queue.put_many(range(10))
+        self.assertEqual([0, 2, 4, 6, 8], queue.pop_filtered(lambda x: x % 2 == 0))
+        self.assertEqual(5, len(queue))
+        self.assertEqual([1, 3, 5, 7, 9], [queue.get() for _ in range(5)])
+
+    def test_remove(self):
+        queue = self.make_queue(size=1, segment_size=64)
+        queue.put_many(range(5))
+        queue.remove(3)
+        self.assertEqual([0, 1, 2, 4], [queue.get() for _ in range(4)])
+
+    def test_close_removes_files(self):
+        queue = self.make_queue(size=1, segment_size=64)
+        queue.put_many(range(10))
+        self.assertTrue(self.spill_files())
+        queue.close()
+        self.assertEqual([], self.spill_files())
+        self.assertTrue(os.path.isdir(self.spill_dir))
+
+    def test_close_removes_own_dir(self):
+        queue = SpillingQueue(size=1, segment_size=64)
+        queue.put_many(range(10))
+        spill_dir = queue._spill_dir
+        self.assertTrue(os.listdir(spill_dir))
+        queue.close()
+        self.assertFalse(os.path.exists(spill_dir))
+
+    def test_application_closes_chain_queues(self):
+        application = ThreadedApplication([])
+        application.make_gtp_chain(generate, process, queue_class=SpillingQueue)
+        queue = application._threads[0].get_queue('result')
+        spill_dir = queue._spill_dir
+        self.assertTrue(os.path.isdir(spill_dir))
+        application.close_queues()
+        self.assertFalse(os.path.exists(spill_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
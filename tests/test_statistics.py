@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from datetime import datetime
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from oupyc.application.generator import GeneratorThread
+from oupyc.application.processor import ProcessorThread
+from oupyc.application.transformer import TransformerThread
+from oupyc.inthreads import statistics
+from oupyc.queues import FixedSizeQueue
+
+
+def double(item):
+    return item * 2
+double.description = 'test doubler'
+
+
+def generate():
+    return 1
+generate.description = 'test generator'
+
+
+def process(item):
+    pass
+process.description = 'test collector'
+
+
+class ShardAccumulatorsTestCase(unittest.TestCase):
+
+    def collect(self):
+        data = {}
+        for shard_data in statistics._swap_shards():
+            statistics._merge(data, shard_data)
+        return data
+
+    def test_value_after_event_of_same_name(self):
+        statistics._swap_shards()
+        statistics._count('test.mixed')
+        statistics._update('test.mixed', 5)
+        statistics._update('test.mixed', 3)
+        summary = statistics._summarize(self.collect())['test.mixed']
+        self.assertEqual((3, 8, 3, 5, 3), tuple(summary[name] for name in ('count', 'sum', 'min', 'max', 'last')))
+
+    def test_merge_events_and_values_of_threads(self):
+        statistics._swap_shards()
+        statistics._count('test.threads', 2)
+        worker = threading.Thread(target=statistics._update, args=('test.threads', 7))
+        worker.start()
+        worker.join()
+        statistics._count('test.threads')
+        summary = statistics._summarize(self.collect())['test.threads']
+        self.assertEqual((4, 7, 7, 7), tuple(summary[name] for name in ('count', 'sum', 'min', 'max')))
+        self.assertAlmostEqual(7, summary['p50'], delta=0.1)
+
+    def test_events_and_values(self):
+        statistics._swap_shards()
+        statistics._count('test.events', 3)
+        for value in (1, 2, 3):
+            statistics._update('test.values', value)
+        summary = statistics._summarize(self.collect())
+        self.assertEqual(dict(count=3), summary['test.events'])
+        self.assertEqual(2.0, summary['test.values']['avg'])
+
+
+class QueueSamplingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch.object(statistics, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = statistics.NamedQueueWithStatistics(name='test.sampled', size=4, allow=int)
+        statistics._swap_shards()
+
+    def sample(self):
+        """ Sample queue, return {gauge: value} """
+        self.queue.sample()
+        data = {}
+        for shard_data in statistics._swap_shards():
+            statistics._merge(data, shard_data)
+        prefix = 'queue.test.sampled.'
+        return dict(
+            (name[len(prefix):], summary['last']) for name, summary in statistics._summarize(data).items()
+            if name.startswith(prefix)
+        )
+
+    def test_gauges(self):
+        self.now = 1.0
+        self.queue.put_many([1, 2, 3, 4])
+        self.now = 3.0
+        self.queue.get_many(3)
+        self.now = 4.0
+        self.assertEqual(dict(
+            length=1, high_water=4, enqueued=4, dequeued=3, **{'full.seconds': 2.0, 'empty.seconds': 1.0}
+        ), self.sample())
+        self.now = 5.0
+        self.queue.get()
+        self.now = 6.0
+        self.assertEqual(dict(
+            length=0, high_water=1, enqueued=0, dequeued=1, **{'full.seconds': 0.0, 'empty.seconds': 1.0}
+        ), self.sample())
+
+    def test_full_span_split_by_samples(self):
+        self.now = 1.0
+        self.queue.put_many([1, 2, 3, 4])
+        self.now = 2.5
+        self.assertEqual(1.5, self.sample()['full.seconds'])
+        self.now = 4.0
+        self.assertEqual(1.5, self.sample()['full.seconds'])
+
+    def test_sampled_by_processor(self):
+        self.assertIn(self.queue, list(statistics._SAMPLED_QUEUES))
+
+
+class StageInstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # statistics are started once saver queue exists
+        patcher = mock.patch.object(statistics, '_OUT_QUEUE_MINUTES', statistics.StatAgregatorQueue(size=10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        statistics._swap_shards()
+
+    def collect(self, stage_name):
+        data = {}
+        for shard_data in statistics._swap_shards():
+            statistics._merge(data, shard_data)
+        prefix = 'stage.%s.' % stage_name
+        summary = statistics._summarize(data)
+        return dict((name[len(prefix):], summary[name]['count']) for name in summary if name.startswith(prefix))
+
+    def make(self, thread_class, func, queue_names=('incoming', 'result'), **kwargs):
+        """ Make stage having queues of queue_names, incoming one has 3 items """
+        stage = thread_class.make(func, **kwargs)
+        for name in queue_names:
+            stage.add_queue(name, FixedSizeQueue(size=10))
+        if 'incoming' in queue_names:
+            stage.get_queue('incoming').put_many([1, 2, 3])
+        return stage
+
+    def test_transformer(self):
+        stage = self.make(TransformerThread, double, batch_size=2)
+        stage.process_next_item()
+        stage.process_next_batch()
+        self.assertEqual({'get.ms': 2, 'call.ms': 2, 'put.ms': 2, 'items': 3}, self.collect('double'))
+
+    def test_generator_and_processor(self):
+        self.make(GeneratorThread, generate, ['result']).process_next_item()
+        self.make(GeneratorThread, generate, ['result'], batch_size=3).process_next_batch()
+        self.assertEqual({'get.ms': 2, 'call.ms': 2, 'put.ms': 2, 'items': 4}, self.collect('generate'))
+        processor = self.make(ProcessorThread, process, ['incoming'])
+        processor.process_next_item()
+        self.assertEqual({'get.ms': 1, 'call.ms': 1, 'items': 1}, self.collect('process'))
+
+    def test_disabled(self):
+        stage = self.make(TransformerThread, double)
+        stage.instrumented = False
+        stage.process_next_item()
+        self.assertEqual({}, self.collect('double'))
+        with mock.patch.object(statistics, '_OUT_QUEUE_MINUTES', None):
+            self.make(TransformerThread, double).process_next_item()
+        self.assertEqual({}, self.collect('double'))
+
+
+class RollupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        _, self.processor = statistics.start(
+            threading.Event(), 0, 1000, lambda record: None,
+            windows=(1, 10, 60), output_windows=(10,), history_length=3,
+        )
+        # records are kept here instead of shared saver queue
+        self.records = []
+        self.processor._output = self.records.extend
+        self.closed = []
+        self.processor.add_listener(10, lambda start, summary: self.closed.append((start, summary.get('test.rollup'))))
+        statistics._swap_shards()
+        self.processor._collect(now=99.5)
+
+    def feed(self, first, last):
+        """ Account value of every second in range, value is second number """
+        for second in range(first, last):
+            statistics._update('test.rollup', second)
+            self.processor._collect(now=second + 0.5)
+
+    def test_windows_rolled_up(self):
+        self.feed(100, 125)
+        self.assertEqual([90, 100, 110], [start for start, _ in self.closed])
+        summary = self.closed[1][1]
+        self.assertEqual((10, 1055, 101, 110), tuple(summary[name] for name in ('count', 'sum', 'min', 'max')))
+        # minute window got every value of closed 10s windows
+        (start, summary), = self.processor.get_history(60, 'test.rollup')
+        self.assertEqual(datetime.fromtimestamp(60), start)
+        self.assertEqual((21, sum(range(100, 121))), (summary['count'], summary['sum']))
+
+    def test_history_ring_buffer(self):
+        self.feed(100, 125)
+        history = self.processor.get_history(1, 'test.rollup')
+        self.assertEqual([datetime.fromtimestamp(second) for second in (120, 121, 122)], [dt for dt, _ in history])
+        self.assertEqual([121, 122, 123], [summary['last'] for _, summary in history])
+        self.assertEqual(3, len(self.processor.get_history(10)))
+        self.assertRaises(ValueError, self.processor.get_history, 5)
+
+    def test_output_windows(self):
+        self.feed(100, 112)
+        windows = set(record.window for record in self.records)
+        self.assertEqual({10}, windows)
+        counts = [record.value for record in self.records if record.counter == 'test.rollup.count']
+        self.assertEqual([1, 10], counts)
+
+    def test_skipped_windows_closed(self):
+        self.feed(100, 112)
+        statistics._update('test.rollup', 1000)
+        # no collection for 50 seconds
+        self.processor._collect(now=160.5)
+        self.processor._collect(now=161.5)
+        self.assertEqual([90, 100, 110, 150], [start for start, _ in self.closed])
+        self.assertEqual(1000, self.closed[-1][1]['last'])
+
+
+class SaverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = statistics.StatAgregatorQueue(size=5)
+        patcher = mock.patch.object(statistics, '_OUT_QUEUE_MINUTES', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.exit_event = threading.Event()
+        self.addCleanup(self.exit_event.set)
+        self.records = [statistics.StatRecord('test.saver.%s' % idx, idx) for idx in range(5)]
+
+    def save(self, expected, **kwargs):
+        """ Run saver until expected number of calls made, return arguments of calls """
+        calls = []
+
+        def save(records):
+            calls.append(records)
+            if len(calls) == expected:
+                self.exit_event.set()
+
+        saver = statistics.StatisticsSaverThread(save, exit_event=self.exit_event, **kwargs)
+        saver.daemon = True
+        saver.start()
+        saver.join(5)
+        self.assertFalse(saver.is_alive())
+        return calls
+
+    def test_batches(self):
+        self.queue.put_many(self.records)
+        calls = self.save(2, batch_size=3, batch_timeout=0.01)
+        self.assertEqual([self.records[:3], self.records[3:]], calls)
+
+    def test_single_records(self):
+        self.queue.put_many(self.records[:2])
+        self.assertEqual(self.records[:2], self.save(2))
+
+    def test_full_queue_drops_records(self):
+        processor = statistics.StatisticsProcessorThread(exit_event=self.exit_event)
+        statistics._swap_shards()
+        processor._output(self.records[:3])
+        processor._output(self.records)
+        self.assertEqual(self.records[:3] + self.records[:2], self.queue.get_many(10))
+        data = {}
+        for shard_data in statistics._swap_shards():
+            statistics._merge(data, shard_data)
+        self.assertEqual(dict(count=3), statistics._summarize(data)['stat.saver.dropped'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+import unittest
+
+from oupyc.application import ThreadedApplication
+from oupyc.application.transformer import TransformerThread
+from oupyc.queues import FixedSizeQueue
+
+
+def jitter(item):
+    # later items often finish first
+    time.sleep(random.random() * 0.005)
+    if item == 7:
+        raise ValueError("test failure of %s" % item)
+    return item
+jitter.description = 'test jitter'
+
+
+def shuffle(items):
+    # batch results may come in other order than batches
+    time.sleep(random.random() * 0.005)
+    return items
+shuffle.description = 'test batch jitter'
+shuffle.batch = True
+
+
+class TransformerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.exit_event = threading.Event()
+        self.addCleanup(self.exit_event.set)
+
+    def start(self, transformer, items):
+        incoming, result = FixedSizeQueue(size=100), FixedSizeQueue(size=100)
+        transformer.add_queue('incoming', incoming)
+        transformer.add_queue('result', result)
+        transformer._exit_event = self.exit_event
+        transformer.daemon = True
+        incoming.put_many(items)
+        transformer.start()
+        return result
+
+    def test_ordered_pool(self):
+        result = self.start(TransformerThread.make(jitter, workers=4, ordered=True), range(50))
+        expected = [item for item in range(50) if item != 7]
+        self.assertEqual(expected, [result.get(5) for _ in expected])
+
+    def test_ordered_pool_batches(self):
+        transformer = TransformerThread.make(jitter, workers=3, ordered=True, batch_size=4, batch_timeout=0.01)
+        result = self.start(transformer, range(8, 48))
+        self.assertEqual(list(range(8, 48)), [result.get(5) for _ in range(40)])
+
+    def test_unordered_pool(self):
+        result = self.start(TransformerThread.make(jitter, workers=4), range(8, 48))
+        self.assertEqual(list(range(8, 48)), sorted(result.get(5) for _ in range(40)))
+
+
+class TransformerRestartTestCase(unittest.TestCase):
+
+    def test_restart_keeps_configuration(self):
+        app = ThreadedApplication([])
+        self.addCleanup(app._exit_event.set)
+        counter = iter(range(1000000))
+
+        def generate():
+            return next(counter)
+        generate.description = 'test counter'
+        processed = []
+
+        def process(item):
+            processed.append(item)
+        process.description = 'test collector'
+
+        app.make_gtp_chain(generate, shuffle, process, workers=[None, 4], ordered=True, batch_size=[None, 3, None])
+        old = app._threads[1]
+        # clone made in daemon thread is daemon too, so workers waiting for items do not hold test process
+        restarter = threading.Thread(target=app.restart_thread, args=(1,))
+        restarter.daemon = True
+        restarter.start()
+        restarter.join()
+        new = app._threads[1]
+        self.assertIsNot(old, new)
+        self.assertEqual((4, True, 3), (new.workers, new.ordered, new.batch_size))
+        self.assertIs(old.get_queue('incoming'), new.get_queue('incoming'))
+        self.assertIs(old.get_queue('result'), new.get_queue('result'))
+        self.assertIs(app._exit_event, new._exit_event)
+        for th in (app._threads[0], app._threads[2]):
+            th.daemon = True
+            th.start()
+        deadline = time.time() + 5
+        while len(processed) < 30 and time.time() < deadline:
+            time.sleep(0.01)
+        app._exit_event.set()
+        self.assertEqual(list(range(30)), processed[:30])
+
+
+if __name__ == '__main__':
+    unittest.main()
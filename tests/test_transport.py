@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from oupyc.remote.codecs import BinaryCodec
+from oupyc.remote.task import TaskPrototype, TaskRequestPrototype, TaskResultPrototype, register_task_class, \
+    RESULT_SUCCESS
+from oupyc.remote.transport import TaskServer, TaskClient, RemoteError
+
+
+class EchoRequest(TaskRequestPrototype):
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+class EchoResult(TaskResultPrototype):
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+
+@register_task_class
+class EchoTask(TaskPrototype):
+    task_name = 'test_transport.echo'
+    request_class = EchoRequest
+    response_class = EchoResult
+
+    @classmethod
+    def _get_version(cls):
+        return '1'
+
+    def _process_request(self, **kwargs):
+        if self.request.get('fail'):
+            raise ValueError("failed on purpose")
+        return self.return_success(data=dict(value=self.request.get('value'), pid=os.getpid()))
+
+
+class TransportTestCase(unittest.TestCase):
+    processes = 3
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='oupyc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def serve(self, address, codec=None):
+        server = TaskServer(address, codec=codec, processes=self.processes).start()
+        self.addCleanup(server.stop)
+        client = TaskClient(server.address, codec=codec, pool_size=4, max_pending=16)
+        self.addCleanup(client.close)
+        return server, client
+
+    def check_pipelined(self, client, count=200):
+        pending = client.submit_many([EchoTask(value=idx) for idx in range(count)])
+        results = [result.get(10) for result in pending]
+        self.assertEqual([RESULT_SUCCESS] * count, [result.code for result in results])
+        self.assertEqual(list(range(count)), [result.data['value'] for result in results])
+        self.assertEqual([result.request_id for result in pending], [result.request_id for result in results])
+
+    def test_tcp(self):
+        server, client = self.serve(('127.0.0.1', 0))
+        self.assertNotEqual(0, server.address[1])
+        self.check_pipelined(client)
+
+    def test_unix_socket(self):
+        path = os.path.join(self.tmp_dir, 'tasks.sock')
+        server, client = self.serve(path)
+        self.check_pipelined(client)
+        server.stop()
+        self.assertFalse(os.path.exists(path))
+
+    def test_binary_codec(self):
+        server, client = self.serve(('127.0.0.1', 0), codec=BinaryCodec(compress_threshold=64))
+        self.check_pipelined(client)
+
+    def test_task_error_keeps_connection(self):
+        server, client = self.serve(('127.0.0.1', 0))
+        failed, succeeded = client.submit_many([EchoTask(fail=True), EchoTask(value='after')])
+        result = failed.get(10)
+        self.assertIsInstance(result, RemoteError)
+        self.assertIn('failed on purpose', result.message)
+        self.assertEqual('after', succeeded.get(10).data['value'])
+
+    def test_backpressure_slots_released(self):
+        server, client = self.serve(('127.0.0.1', 0))
+        client.pool_size = 1
+        # more requests than max_pending go through only if every result frees its slot
+        self.check_pipelined(client, count=100)
+
+
+if __name__ == '__main__':
+    unittest.main()